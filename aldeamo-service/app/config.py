@@ -1,9 +1,24 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     # Configuración para simular fallas
     FAILURE_RATE: float = float(os.getenv("ALDEAMO_FAILURE_RATE", "0.0"))  # Porcentaje de fallas (0.0 - 1.0)
+    LATENCY: float = float(os.getenv("ALDEAMO_LATENCY", "0.2"))            # Latencia fija del escenario por defecto
+
+    # Escenario de fallos y latencia (ver app/scenarios.py); se puede cambiar con /toggle-failure
+    SCENARIO_FILE: str = os.getenv("ALDEAMO_SCENARIO_FILE", "")                 # JSON cargado al arrancar
+    SCENARIO_SEED: Optional[int] = int(os.environ["ALDEAMO_SCENARIO_SEED"]) if os.getenv("ALDEAMO_SCENARIO_SEED") else None
+
+    # Camino rápido de /notify: orjson y estructuras con __slots__ en lugar de Pydantic
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "false").lower() == "true"
+
+    # Logging: JSON a través de una cola drenada por un hilo; los eventos de éxito se muestrean
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")                       # "json" o "text"
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))     # Fracción de eventos de éxito que se registran
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))         # Registros en cola antes de descartar
     
     model_config = {
         "env_file": ".env"
@@ -1,15 +1,39 @@
 import logging
 import random
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
+from typing import List, Optional
 from .config import settings
+from .metrics import Counter, instrument_app
+from .scenarios import ScenarioEngine, request_deadline
+from .serialization import CodecError, RawJSONResponse, StructField, dumps, struct, validation_error_response
+from .structured_logging import setup_logging
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (cola no bloqueante; las entregas exitosas se muestrean)
+setup_logging(
+    "aldeamo-service",
+    level=settings.LOG_LEVEL,
+    log_format=settings.LOG_FORMAT,
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    sampled_events=("notification_delivered", "notification_batch"),
+    queue_size=settings.LOG_QUEUE_SIZE
+)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Servicio de Notificaciones Aldeamo")
 
+# Middleware de métricas y endpoint /metrics
+instrument_app(app)
+
+NOTIFICATIONS = Counter("notifications_total", "Notificaciones procesadas por resultado", ["outcome"])
+NOTIFICATIONS_DELIVERED = NOTIFICATIONS.labels("delivered")
+NOTIFICATIONS_FAILED = NOTIFICATIONS.labels("failed")
+
+# Escenario de fallos y latencia (por defecto: latencia fija y FAILURE_RATE)
+scenarios = ScenarioEngine(settings.LATENCY, settings.FAILURE_RATE, settings.SCENARIO_SEED)
+if settings.SCENARIO_FILE:
+    scenarios.load_file(settings.SCENARIO_FILE)
+
 class NotificationRequest(BaseModel):
     message: str
     customer_id: str
@@ -19,6 +43,22 @@ class NotificationResponse(BaseModel):
     status: str
     message_id: str
 
+# Estructura compilada equivalente a NotificationRequest para el camino rápido
+NotificationIn = struct("NotificationIn", message=StructField(str), customer_id=StructField(str))
+
+class BatchNotificationRequest(BaseModel):
+    notifications: List[NotificationRequest]
+
+class BatchItemResult(BaseModel):
+    customer_id: str
+    status: str
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchNotificationResponse(BaseModel):
+    provider: str
+    results: List[BatchItemResult]
+
 @app.get("/")
 async def read_root():
     return {"message": "Servicio de Notificaciones Aldeamo", "status": "online"}
@@ -27,34 +67,101 @@ async def read_root():
 async def health_check():
     return {"status": "healthy"}
 
-@app.post("/notify", response_model=NotificationResponse)
-async def send_notification(notification: NotificationRequest):
-    # Simular fallas aleatorias basadas en el FAILURE_RATE configurado
-    if random.random() < settings.FAILURE_RATE:
-        logger.error(f"Simulando falla en el servicio Aldeamo")
-        raise HTTPException(status_code=500, detail="Error al enviar notificación con Aldeamo")
-    
+NOTIFY_ROUTE = {"response_model": NotificationResponse}
+
+async def send_notification(notification: NotificationRequest, request: Request):
+    with scenarios.request() as outcome:
+        # Simular fallas aleatorias según el escenario vigente
+        if outcome.fault == "error":
+            logger.error("Simulando falla en el servicio Aldeamo", extra={"event": "notification_failed"})
+            NOTIFICATIONS_FAILED.inc()
+            raise HTTPException(status_code=500, detail="Error al enviar notificación con Aldeamo")
+
+        # Simular el tiempo de respuesta (o un timeout o cuelgue) sin pasar del deadline del llamador
+        await outcome.wait(request, request_deadline(request))
+
     # Procesar la notificación (simulado)
-    logger.info(f"Enviando notificación a través de Aldeamo para el cliente {notification.customer_id}")
-    logger.info(f"Mensaje: {notification.message}")
-    
-    # Simular un pequeño retardo para enviar la notificación
-    import asyncio
-    await asyncio.sleep(0.2)
-    
-    return {
+    logger.info("Enviando notificación a través de Aldeamo para el cliente %s", notification.customer_id,
+                extra={"event": "notification_delivered", "customer_id": notification.customer_id})
+
+    NOTIFICATIONS_DELIVERED.inc()
+    return outcome.respond({
         "provider": "Aldeamo",
         "status": "delivered",
         "message_id": f"aldeamo_{random.randint(1000, 9999)}_{notification.customer_id}"
-    }
+    })
+
+async def send_notification_fast(request: Request):
+    """/notify sin Pydantic: decodifica a NotificationIn y devuelve los bytes de la respuesta"""
+    try:
+        notification = NotificationIn.decode(await request.body())
+    except CodecError as e:
+        return validation_error_response(e)
+    result = await send_notification(notification, request)
+    return result if isinstance(result, Response) else RawJSONResponse(dumps(result))
+
+# Con FAST_PATH_ENABLED el mismo endpoint se sirve sin validación de Pydantic
+if settings.FAST_PATH_ENABLED:
+    app.post("/notify", response_class=RawJSONResponse, openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": NotificationRequest.model_json_schema()}}
+    }}, **NOTIFY_ROUTE)(send_notification_fast)
+else:
+    app.post("/notify", **NOTIFY_ROUTE)(send_notification)
+
+@app.post("/notify/batch", response_model=BatchNotificationResponse)
+async def send_notification_batch(batch: BatchNotificationRequest, request: Request):
+    """Envía varias notificaciones en una sola llamada; cada elemento puede fallar por separado"""
+    logger.info("Enviando lote de %d notificaciones a través de Aldeamo", len(batch.notifications),
+                extra={"event": "notification_batch", "size": len(batch.notifications)})
+
+    # Un lote tarda lo mismo que una notificación individual
+    with scenarios.request(batch=True) as outcome:
+        await outcome.wait(request, request_deadline(request))
+
+    results = []
+    for notification in batch.notifications:
+        if outcome.item_failed():
+            NOTIFICATIONS_FAILED.inc()
+            results.append({
+                "customer_id": notification.customer_id,
+                "status": "failed",
+                "error": "Error al enviar notificación con Aldeamo"
+            })
+        else:
+            NOTIFICATIONS_DELIVERED.inc()
+            results.append({
+                "customer_id": notification.customer_id,
+                "status": "delivered",
+                "message_id": f"aldeamo_{random.randint(1000, 9999)}_{notification.customer_id}"
+            })
+
+    return outcome.respond({"provider": "Aldeamo", "results": results})
 
 @app.post("/toggle-failure")
-async def toggle_failure(failure_rate: float):
-    """Endpoint para cambiar la tasa de fallos (para pruebas)"""
-    old_rate = settings.FAILURE_RATE
-    settings.FAILURE_RATE = max(0.0, min(1.0, failure_rate))  # Asegurar que esté entre 0 y 1
-    logger.info(f"Tasa de fallos de Aldeamo cambiada de {old_rate} a {settings.FAILURE_RATE}")
-    return {"status": "updated", "failure_rate": settings.FAILURE_RATE}
+async def toggle_failure(failure_rate: Optional[float] = None, scenario: Optional[dict] = Body(None)):
+    """
+    Endpoint para cambiar la tasa de fallos (para pruebas). Con un escenario JSON
+    en el cuerpo lo sustituye (ver app/scenarios.py); `{}` vuelve al escenario
+    por defecto.
+    """
+    if scenario is not None:
+        try:
+            scenarios.load(scenario)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Escenario inválido: {e}")
+        logger.info("Escenario de Aldeamo cargado", extra={"event": "scenario_loaded"})
+    if failure_rate is not None:
+        old_rate = settings.FAILURE_RATE
+        settings.FAILURE_RATE = max(0.0, min(1.0, failure_rate))  # Asegurar que esté entre 0 y 1
+        scenarios.set_failure_rate(settings.FAILURE_RATE)
+        logger.info("Tasa de fallos de Aldeamo cambiada de %s a %s", old_rate, settings.FAILURE_RATE)
+    return {"status": "updated", "failure_rate": settings.FAILURE_RATE, "scenario": scenarios.describe()}
+
+@app.get("/scenario")
+async def get_scenario():
+    """Escenario vigente: fase, probabilidades de fallo y latencia"""
+    return scenarios.describe()
 
 if __name__ == "__main__":
     import uvicorn
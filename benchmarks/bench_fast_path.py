@@ -0,0 +1,93 @@
+"""
+Solicitudes por segundo por núcleo de /payments y de /notify con y sin el
+camino rápido (FAST_PATH_ENABLED).
+
+Cada modo corre en un proceso aparte (la configuración se lee al importar) con
+los tres servicios en el mismo proceso conectados con ASGITransport, como el
+modo inprocess de loadgen.py, y los simuladores sin latencia simulada, de modo
+que todo el tiempo es CPU de los servicios. Un lazo cerrado de `--concurrency`
+clientes envía solicitudes durante `--duration` segundos; el resultado se divide
+por el tiempo de CPU del proceso, que usa un solo núcleo.
+
+Uso:
+    python benchmarks/bench_fast_path.py --duration 5 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+async def closed_loop(client, path, payload, duration, concurrency):
+    deadline = time.monotonic() + duration
+    counts = {"ok": 0, "errors": 0}
+
+    async def worker():
+        while time.monotonic() < deadline:
+            response = await client.post(path, json=payload)
+            counts["ok" if response.status_code == 200 else "errors"] += 1
+
+    cpu_start = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    cpu = time.process_time() - cpu_start
+    return {"requests": counts["ok"], "errors": counts["errors"], "rps_per_core": round(counts["ok"] / cpu, 1)}
+
+
+async def child(duration, concurrency):
+    sys.path.insert(0, BENCHMARKS)
+    from loadgen import InProcessEnvironment
+
+    logging.disable(logging.CRITICAL)
+    payment = {"amount": 100.5, "customer_id": "cust_12345", "message": "Gracias por tu pago"}
+    notification = {"message": "Gracias por tu pago", "customer_id": "cust_12345"}
+    async with InProcessEnvironment() as env:
+        # Calentamiento (pools, métricas, caminos de código)
+        await closed_loop(env.payment, "/payments", payment, 0.5, concurrency)
+        result = {
+            "payments": await closed_loop(env.payment, "/payments", payment, duration, concurrency),
+            "notify": await closed_loop(env.aldeamo, "/notify", notification, duration, concurrency),
+        }
+    print(json.dumps(result))
+
+
+def run_mode(fast, duration, concurrency):
+    env = dict(os.environ, FAST_PATH_ENABLED=str(fast).lower(), ALDEAMO_LATENCY="0", TWILIO_LATENCY="0",
+               HEALTH_PROBE_ENABLED="false", LOG_LEVEL="WARNING")
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--child", "--duration", str(duration), "--concurrency", str(concurrency)],
+        env=env
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.duration, args.concurrency))
+        return
+
+    before = run_mode(False, args.duration, args.concurrency)
+    after = run_mode(True, args.duration, args.concurrency)
+    for endpoint in ("payments", "notify"):
+        print(json.dumps({
+            "endpoint": endpoint,
+            "before_rps_per_core": before[endpoint]["rps_per_core"],
+            "after_rps_per_core": after[endpoint]["rps_per_core"],
+            "speedup": round(after[endpoint]["rps_per_core"] / before[endpoint]["rps_per_core"], 2),
+            "errors": before[endpoint]["errors"] + after[endpoint]["errors"],
+        }))
+
+
+if __name__ == "__main__":
+    main()
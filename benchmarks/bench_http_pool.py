@@ -0,0 +1,136 @@
+"""
+Benchmark de throughput de /payments: cliente HTTP por petición vs pool de larga vida.
+
+Levanta aldeamo-service y twilio-service con uvicorn en puertos locales y ejecuta
+payment-service en proceso (ASGITransport). El modo "per-request" reproduce el
+comportamiento anterior (un httpx.AsyncClient nuevo por notificación) y el modo
+"pooled" usa los clientes creados en el lifespan.
+
+Uso:
+    python benchmarks/bench_http_pool.py --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALDEAMO_PORT = 18001
+TWILIO_PORT = 18002
+
+os.environ["ALDEAMO_SERVICE_URL"] = f"http://127.0.0.1:{ALDEAMO_PORT}"
+os.environ["TWILIO_SERVICE_URL"] = f"http://127.0.0.1:{TWILIO_PORT}"
+sys.path.insert(0, os.path.join(ROOT, "payment-service"))
+
+from app.main import app  # noqa: E402
+from app.services.notification_service import notification_service  # noqa: E402
+from app.services.providers import provider_registry  # noqa: E402
+
+
+class PerRequestClient:
+    """Imita el código anterior: abre y cierra un AsyncClient en cada llamada"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    async def post(self, url, **kwargs):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            return await client.post(url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            return await client.get(url, **kwargs)
+
+    async def aclose(self):
+        pass
+
+
+def start_provider(service_dir, port, env_name):
+    env = dict(os.environ, **{env_name: "0.0"})
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, service_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(port):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"http://127.0.0.1:{port}/health")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"El proveedor en el puerto {port} no arrancó")
+
+
+async def run_mode(mode, total, concurrency):
+    await notification_service.shutdown()
+    if mode == "per-request":
+        for provider in provider_registry:
+            provider.client = PerRequestClient(5.0)
+    else:
+        await notification_service.startup()
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://payment") as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/payments", json={"amount": 10.0, "customer_id": f"c{i}"}
+                )
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    await notification_service.shutdown()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    processes = [
+        start_provider("aldeamo-service", ALDEAMO_PORT, "ALDEAMO_FAILURE_RATE"),
+        start_provider("twilio-service", TWILIO_PORT, "TWILIO_FAILURE_RATE"),
+    ]
+    try:
+        await wait_ready(ALDEAMO_PORT)
+        await wait_ready(TWILIO_PORT)
+        for mode in ("per-request", "pooled"):
+            print(await run_mode(mode, args.requests, args.concurrency))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
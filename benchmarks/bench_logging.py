@@ -0,0 +1,95 @@
+"""
+Microbenchmark del coste del logging por solicitud en el event loop.
+
+Reproduce las líneas de log que emite payment-service por cada pago exitoso y
+mide el tiempo que pasan en el hilo que las emite (el del event loop):
+
+- antes: StreamHandler síncrono con f-strings (cinco líneas INFO, incluida la de
+  httpx y el cuerpo del mensaje);
+- después: setup_logging (cola + hilo, JSON, formato perezoso y muestreo de los
+  eventos de éxito con LOG_SAMPLE_RATE).
+
+La salida va a /dev/null para medir el logging y no la terminal.
+
+Uso:
+    python benchmarks/bench_logging.py --requests 100000 --sample-rate 0.1
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "payment-service"))
+
+from app.structured_logging import TEXT_FORMAT, setup_logging  # noqa: E402
+
+MESSAGE = "Se ha procesado un pago de $100.0 con éxito."
+
+
+def log_before(logger, i):
+    customer_id = f"cust_{i}"
+    logger.info(f"Procesando pago de {100.0} para el cliente {customer_id}")
+    logger.info(f"Intentando notificar con Aldeamo: {MESSAGE}")
+    logger.info(f"HTTP Request: POST {'http://aldeamo-service:8001/notify'} \"HTTP/1.1 200 OK\"")
+    logger.info(f"✅ Notificación enviada con éxito a través de {'Aldeamo'}")
+    logger.info(f"Pago procesado y notificado a través de {'Aldeamo'}")
+
+
+def log_after(logger, i):
+    customer_id = f"cust_{i}"
+    logger.debug("Procesando pago de %s para el cliente %s", 100.0, customer_id)
+    logger.debug("Intentando notificar con %s", "Aldeamo")
+    logger.info("✅ Notificación enviada con éxito a través de %s", "Aldeamo",
+                extra={"event": "notification_sent", "provider": "Aldeamo"})
+    logger.info("Pago %s procesado y notificado a través de %s", "pmt_" + customer_id, "Aldeamo",
+                extra={"event": "payment_processed", "customer_id": customer_id, "provider": "Aldeamo"})
+
+
+def run(func, logger, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        func(logger, i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+
+    before = logging.getLogger("bench.before")
+    before.propagate = False
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    before.addHandler(handler)
+    before.setLevel(logging.INFO)
+
+    pipeline = setup_logging(
+        "bench", sample_rate=args.sample_rate, sampled_events=("notification_sent", "payment_processed"),
+        queue_size=args.requests * 2, stream=devnull
+    )
+    after = logging.getLogger("bench.after")
+
+    run(log_before, before, 1000)
+    run(log_after, after, 1000)
+    before_us = run(log_before, before, args.requests)
+    after_us = run(log_after, after, args.requests)
+    pipeline.stop()
+
+    print({
+        "requests": args.requests,
+        "sample_rate": args.sample_rate,
+        "before_us_per_request": round(before_us, 2),
+        "after_us_per_request": round(after_us, 2),
+        "saved_us_per_request": round(before_us - after_us, 2),
+        **pipeline.stats(),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Microbenchmark del coste de las métricas en el camino caliente.
+
+Mide los nanosegundos por operación de un contador y de un histograma con
+etiquetas enlazadas de antemano, y el sobrecoste por solicitud de
+MetricsMiddleware llamando directamente a la aplicación ASGI (sin red) con y
+sin el middleware.
+
+Uso:
+    python benchmarks/bench_metrics.py --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "payment-service"))
+
+from fastapi import FastAPI  # noqa: E402
+
+from app.metrics import Counter, Histogram, MetricsMiddleware, Registry  # noqa: E402
+
+
+def bench_ops(operations):
+    registry = Registry()
+    counter = Counter("bench_total", "bench", ["provider"], registry=registry).labels("Aldeamo")
+    histogram = Histogram("bench_seconds", "bench", ["provider"], registry=registry).labels("Aldeamo")
+
+    start = time.perf_counter()
+    for _ in range(operations):
+        counter.inc()
+    inc_ns = (time.perf_counter() - start) / operations * 1e9
+
+    start = time.perf_counter()
+    for i in range(operations):
+        histogram.observe((i % 1000) / 1000)
+    observe_ns = (time.perf_counter() - start) / operations * 1e9
+    return round(inc_ns, 1), round(observe_ns, 1)
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.post("/payments")
+    async def process_payment():
+        return {"status": "completed"}
+
+    return app
+
+
+async def drive(asgi_app, requests):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/payments", "raw_path": b"/payments", "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"bench")], "server": ("bench", 80), "client": ("bench", 1),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await asgi_app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--operations", type=int, default=1000000)
+    args = parser.parse_args()
+
+    inc_ns, observe_ns = bench_ops(args.operations)
+    print({"counter_inc_ns": inc_ns, "histogram_observe_ns": observe_ns})
+
+    bare = build_app()
+    instrumented = MetricsMiddleware(build_app())
+    # Calentamiento: construye la pila de middlewares de Starlette y los hijos de las métricas
+    await drive(bare, 100)
+    await drive(instrumented, 100)
+
+    bare_us = await drive(bare, args.requests)
+    instrumented_us = await drive(instrumented, args.requests)
+    print({
+        "requests": args.requests,
+        "bare_us_per_request": round(bare_us, 2),
+        "instrumented_us_per_request": round(instrumented_us, 2),
+        "overhead_us_per_request": round(instrumented_us - bare_us, 2),
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark del outbox durable: encolados por segundo y amplificación de escritura.
+
+Para cada combinación de tamaño de grupo (escrituras por commit) y modo
+`synchronous` de SQLite persiste N notificaciones concurrentes y mide:
+- throughput de append (notificaciones/s hasta que son durables),
+- commits (fsyncs) realizados,
+- bytes escritos al disco según /proc/self/io (solo Linux) frente a los bytes
+  útiles de las notificaciones (amplificación de escritura).
+
+Uso:
+    python benchmarks/bench_outbox_store.py --items 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "payment-service"))
+
+from app.services.outbox_store import SQLiteOutboxStore  # noqa: E402
+
+
+def disk_write_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def run(items, group_max, synchronous):
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteOutboxStore(
+            os.path.join(directory, "outbox.db"),
+            group_max=group_max,
+            group_window=0.002 if group_max > 1 else 0.0,
+            synchronous=synchronous,
+        )
+        store.open()
+        message = "Se ha procesado un pago de $100.0 con éxito."
+        payload = items * (len(message.encode()) + len("cust_00000") + len("pmt_") + 32)
+
+        written_before = disk_write_bytes()
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            store.append(f"pmt_{i:032x}", message, f"cust_{i:05d}") for i in range(items)
+        ))
+        elapsed = time.perf_counter() - start
+        written_after = disk_write_bytes()
+        store.close()
+
+    written = None if written_before is None else written_after - written_before
+    return {
+        "group_max": group_max,
+        "synchronous": synchronous,
+        "items": items,
+        "appends_per_s": round(items / elapsed),
+        "commits": store.commits,
+        "items_per_commit": round(items / store.commits, 1),
+        "disk_bytes": written,
+        "write_amplification": round(written / payload, 1) if written else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+
+    for synchronous in ("FULL", "NORMAL"):
+        for group_max in (1, 16, 256):
+            print(await run(args.items, group_max, synchronous))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
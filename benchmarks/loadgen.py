@@ -0,0 +1,315 @@
+"""
+Generador de carga de lazo abierto para todo el flujo de pagos.
+
+Reproduce un workload JSONL (un cuerpo de /payments por línea, se recorre en
+ciclo) a una tasa fija: cada solicitud sale en su instante programado aunque las
+anteriores no hayan terminado, y la latencia se mide desde ese instante, de modo
+que una cola en el servidor no se esconde ralentizando al cliente.
+
+Para cada combinación de ALDEAMO_FAILURE_RATE y TWILIO_FAILURE_RATE (se fijan con
+/toggle-failure) reinicia el circuito, ejecuta la carga y escribe una línea JSON
+con throughput, percentiles de latencia, errores, proporción de respaldos a
+Twilio y transiciones del circuito (leídas de /metrics), junto con el commit
+actual para comparar resultados entre versiones.
+
+Con --aldeamo-scenario / --twilio-scenario cada escenario carga además un
+escenario de fallos y latencia (JSON, ver app/scenarios.py de los simuladores)
+en lugar de la tasa de fallos; con una semilla fija los resultados son
+reproducibles.
+
+Con --deadline-ms cada pago envía X-Deadline-Ms y el cliente lo abandona al
+vencer (cuenta como error), como haría un cliente real con timeout. Para que
+payment-service lo respete hay que arrancarlo con DEADLINE_ENABLED=true.
+
+Modos:
+- inprocess: los tres servicios en este proceso conectados con ASGITransport
+  (sin red; mide el código de los servicios).
+- uvicorn: los tres servicios como procesos uvicorn en puertos locales.
+
+Uso:
+    python benchmarks/loadgen.py --rate 200 --duration 10 \\
+        --aldeamo-failure-rates 0,0.3,1 --twilio-failure-rates 0 --output results.jsonl
+    python benchmarks/loadgen.py --rate 200 --duration 90 \
+        --aldeamo-scenario benchmarks/scenarios/outage_recovery.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import sys
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKLOAD = os.path.join(ROOT, "benchmarks", "workloads", "payments.jsonl")
+PAYMENT_PORT = 18000
+ALDEAMO_PORT = 18001
+TWILIO_PORT = 18002
+
+
+def load_workload(path):
+    with open(path) as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+    if not payloads:
+        raise ValueError(f"El workload {path} está vacío")
+    return payloads
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ----------------------------------------------------------------------
+# Entornos: devuelven clientes para payment-service, Aldeamo y Twilio
+# ----------------------------------------------------------------------
+def _load_simulator(service_dir, alias):
+    """Importa el paquete `app` de un simulador con otro nombre para que no choque con payment-service"""
+    path = os.path.join(ROOT, service_dir, "app")
+    spec = importlib.util.spec_from_file_location(
+        alias, os.path.join(path, "__init__.py"), submodule_search_locations=[path]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[alias] = module
+    spec.loader.exec_module(module)
+    return importlib.import_module(f"{alias}.main").app
+
+
+class InProcessEnvironment:
+    async def __aenter__(self):
+        sys.path.insert(0, os.path.join(ROOT, "payment-service"))
+        from app.main import app as payment_app
+        from app.services.notification_service import notification_service
+        from app.services.providers import provider_registry
+
+        aldeamo_app = _load_simulator("aldeamo-service", "aldeamo_app")
+        twilio_app = _load_simulator("twilio-service", "twilio_app")
+        self._service = notification_service
+        await notification_service.shutdown()
+        provider_registry.get("Aldeamo").client = httpx.AsyncClient(transport=httpx.ASGITransport(app=aldeamo_app))
+        provider_registry.get("Twilio").client = httpx.AsyncClient(transport=httpx.ASGITransport(app=twilio_app))
+
+        self.payment = httpx.AsyncClient(transport=httpx.ASGITransport(app=payment_app), base_url="http://payment",
+                                         timeout=60.0)
+        self.aldeamo = httpx.AsyncClient(transport=httpx.ASGITransport(app=aldeamo_app), base_url="http://aldeamo")
+        self.twilio = httpx.AsyncClient(transport=httpx.ASGITransport(app=twilio_app), base_url="http://twilio")
+        return self
+
+    async def __aexit__(self, *exc):
+        for client in (self.payment, self.aldeamo, self.twilio):
+            await client.aclose()
+        await self._service.shutdown()
+
+
+class UvicornEnvironment:
+    async def __aenter__(self):
+        urls = {
+            "ALDEAMO_SERVICE_URL": f"http://127.0.0.1:{ALDEAMO_PORT}",
+            "TWILIO_SERVICE_URL": f"http://127.0.0.1:{TWILIO_PORT}",
+        }
+        self._processes = [
+            _start_uvicorn("aldeamo-service", ALDEAMO_PORT, {}),
+            _start_uvicorn("twilio-service", TWILIO_PORT, {}),
+            _start_uvicorn("payment-service", PAYMENT_PORT, urls),
+        ]
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+        self.payment = httpx.AsyncClient(base_url=f"http://127.0.0.1:{PAYMENT_PORT}", timeout=60.0, limits=limits)
+        self.aldeamo = httpx.AsyncClient(base_url=urls["ALDEAMO_SERVICE_URL"])
+        self.twilio = httpx.AsyncClient(base_url=urls["TWILIO_SERVICE_URL"])
+        try:
+            for client in (self.aldeamo, self.twilio, self.payment):
+                await _wait_ready(client)
+        except Exception:
+            await self.__aexit__()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        for client in (self.payment, self.aldeamo, self.twilio):
+            await client.aclose()
+        for process in self._processes:
+            process.terminate()
+            process.wait()
+
+
+def _start_uvicorn(service_dir, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, service_dir),
+        env=dict(os.environ, **env),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def _wait_ready(client):
+    for _ in range(100):
+        try:
+            await client.get("/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{client.base_url} no arrancó")
+
+
+# ----------------------------------------------------------------------
+# Ejecución
+# ----------------------------------------------------------------------
+async def breaker_transitions(payment):
+    """Lee circuit_breaker_transitions_total de /metrics como {"closed->open": n, ...}"""
+    text = (await payment.get("/metrics")).text
+    transitions = {}
+    for line in text.splitlines():
+        if not line.startswith("circuit_breaker_transitions_total{"):
+            continue
+        labels, value = line.rsplit(" ", 1)
+        fields = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        key = f"{fields['from_state']}->{fields['to_state']}"
+        transitions[key] = transitions.get(key, 0) + float(value)
+    return transitions
+
+
+async def configure_provider(client, failure_rate, scenario=None):
+    """Carga `scenario` o, sin él, el escenario por defecto con `failure_rate`"""
+    if scenario is not None:
+        response = await client.post("/toggle-failure", json=scenario)
+    else:
+        response = await client.post("/toggle-failure", params={"failure_rate": failure_rate}, json={})
+    response.raise_for_status()
+
+
+async def set_failure_rates(env, aldeamo_rate, twilio_rate, aldeamo_scenario=None, twilio_scenario=None):
+    await configure_provider(env.aldeamo, aldeamo_rate, aldeamo_scenario)
+    await configure_provider(env.twilio, twilio_rate, twilio_scenario)
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def run_scenario(env, payloads, rate, duration, aldeamo_rate, twilio_rate,
+                       aldeamo_scenario=None, twilio_scenario=None, deadline_ms=None):
+    # Cada escenario empieza con proveedores sanos y el circuito cerrado
+    await set_failure_rates(env, 0.0, 0.0)
+    await env.payment.post("/reset-circuit")
+    await set_failure_rates(env, aldeamo_rate, twilio_rate, aldeamo_scenario, twilio_scenario)
+    transitions_before = await breaker_transitions(env.payment)
+
+    loop = asyncio.get_running_loop()
+    total = int(rate * duration)
+    headers = {"X-Deadline-Ms": str(deadline_ms)} if deadline_ms else None
+    latencies = []
+    outcomes = {"ok": 0, "errors": 0, "fallbacks": 0}
+
+    async def one(payload, scheduled):
+        try:
+            request = env.payment.post("/payments", json=payload, headers=headers)
+            response = await (asyncio.wait_for(request, deadline_ms / 1000) if deadline_ms else request)
+        except (httpx.HTTPError, asyncio.TimeoutError):
+            outcomes["errors"] += 1
+            return
+        latencies.append(loop.time() - scheduled)
+        if response.status_code != 200:
+            outcomes["errors"] += 1
+            return
+        outcomes["ok"] += 1
+        if response.json().get("notification_service") == "Twilio":
+            outcomes["fallbacks"] += 1
+
+    tasks = []
+    started = loop.time()
+    for i, payload in zip(range(total), itertools.cycle(payloads)):
+        scheduled = started + i / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(payload, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+
+    transitions_after = await breaker_transitions(env.payment)
+    latencies.sort()
+    return {
+        "aldeamo_failure_rate": None if aldeamo_scenario else aldeamo_rate,
+        "twilio_failure_rate": None if twilio_scenario else twilio_rate,
+        "target_rps": rate,
+        "requests": total,
+        "completed": outcomes["ok"],
+        "errors": outcomes["errors"],
+        "throughput_rps": round(outcomes["ok"] / elapsed, 1),
+        **{
+            f"{name}_ms": round(percentile(latencies, q) * 1000, 2) if latencies else None
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+        },
+        "fallback_ratio": round(outcomes["fallbacks"] / outcomes["ok"], 4) if outcomes["ok"] else None,
+        "breaker_transitions": {
+            key: int(value - transitions_before.get(key, 0))
+            for key, value in transitions_after.items()
+            if value - transitions_before.get(key, 0) > 0
+        },
+    }
+
+
+def parse_rates(text):
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+def load_scenario(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="JSONL con un cuerpo de /payments por línea")
+    parser.add_argument("--rate", type=float, default=100.0, help="solicitudes por segundo (lazo abierto)")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos por escenario")
+    parser.add_argument("--aldeamo-failure-rates", type=parse_rates, default=[0.0])
+    parser.add_argument("--twilio-failure-rates", type=parse_rates, default=[0.0])
+    parser.add_argument("--aldeamo-scenario", help="JSON con el escenario de Aldeamo (sustituye a la tasa de fallos)")
+    parser.add_argument("--twilio-scenario", help="JSON con el escenario de Twilio (sustituye a la tasa de fallos)")
+    parser.add_argument("--deadline-ms", type=float, help="deadline de cada pago (X-Deadline-Ms y abandono del cliente)")
+    parser.add_argument("--output", help="archivo JSONL al que se añaden los resultados (además de stdout)")
+    args = parser.parse_args()
+
+    # Los fallos simulados generan muchas líneas de log; el resultado va en el JSON
+    logging.disable(logging.CRITICAL)
+    payloads = load_workload(args.workload)
+    aldeamo_scenario, twilio_scenario = load_scenario(args.aldeamo_scenario), load_scenario(args.twilio_scenario)
+    meta = {"commit": git_commit(), "mode": args.mode, "workload": os.path.basename(args.workload),
+            "duration_s": args.duration, "deadline_ms": args.deadline_ms,
+            "aldeamo_scenario": args.aldeamo_scenario and os.path.basename(args.aldeamo_scenario),
+            "twilio_scenario": args.twilio_scenario and os.path.basename(args.twilio_scenario)}
+    # Con un escenario, la tasa de fallos de ese proveedor no se recorre
+    aldeamo_rates = [0.0] if aldeamo_scenario else args.aldeamo_failure_rates
+    twilio_rates = [0.0] if twilio_scenario else args.twilio_failure_rates
+
+    environment = InProcessEnvironment() if args.mode == "inprocess" else UvicornEnvironment()
+    async with environment as env:
+        for aldeamo_rate, twilio_rate in itertools.product(aldeamo_rates, twilio_rates):
+            result = {**meta, **await run_scenario(env, payloads, args.rate, args.duration, aldeamo_rate, twilio_rate,
+                                                   aldeamo_scenario, twilio_scenario, args.deadline_ms)}
+            line = json.dumps(result, sort_keys=True)
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
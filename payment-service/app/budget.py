@@ -0,0 +1,24 @@
+"""
+Presupuesto de carga extra basado en un token bucket.
+
+Cada solicitud "normal" deposita `ratio` tokens (hasta `max_tokens`) y cada
+solicitud extra (hedge, reintento) consume un token. Así la carga adicional
+queda acotada a `ratio` veces el tráfico normal más una pequeña ráfaga.
+"""
+
+
+class TokenBudget:
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        tokens = self.tokens + self.ratio
+        self.tokens = tokens if tokens < self.max_tokens else self.max_tokens
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
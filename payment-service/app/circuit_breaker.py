@@ -1,47 +1,538 @@
-import pybreaker
 import logging
+import os
 import time
-from threading import Timer
+from functools import wraps
 from .config import settings
+from .deadline import DeadlineExceededError
+from .metrics import Counter, Gauge
+from .sliding_window import build_window
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Estados del circuito (mismos nombres que usaba pybreaker)
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
 
-# Configuración del Circuit Breaker para el servicio Aldeamo
-class CircuitBreakerListener(pybreaker.CircuitBreakerListener):
+BREAKER_STATE = Gauge("circuit_breaker_state", "1 si el circuito está en ese estado", ["breaker", "state"])
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Cambios de estado del circuito", ["breaker", "from_state", "to_state"]
+)
+
+
+class CircuitBreakerError(Exception):
+    """Se lanza cuando el circuito está abierto y la llamada se rechaza sin ejecutarse"""
+
+
+class BatchItemError(Exception):
+    """Fallo de elementos individuales dentro de un lote que el proveedor aceptó"""
+
+
+class BreakerListener:
+    """Interfaz de los observadores del circuit breaker; todos los métodos son opcionales"""
+
+    def state_change(self, cb, old_state, new_state):
+        pass
+
+    def failure(self, cb, exc):
+        pass
+
+    def success(self, cb):
+        pass
+
+
+class AsyncCircuitBreaker:
+    """
+    Circuit breaker nativo de asyncio.
+
+    A diferencia de pybreaker, espera (await) la corrutina protegida, de modo que los
+    errores y timeouts que ocurren durante la llamada se cuentan realmente. No usa
+    locks ni Timers: todo ocurre en el event loop y la transición de abierto a
+    semi-abierto se calcula de forma perezosa con un reloj monotónico.
+
+    El circuito se abre cuando, con al menos `minimum_calls` llamadas en la ventana
+    deslizante, la tasa de fallos supera `failure_rate_threshold` o la tasa de
+    llamadas lentas (más de `slow_call_duration` segundos) supera
+    `slow_call_rate_threshold`.
+
+    En semi-abierto solo `half_open_max_calls` llamadas concurrentes obtienen un
+    permiso de prueba; el resto se rechaza al instante con CircuitBreakerError para
+    que el llamador use el respaldo sin esperar. El circuito se cierra tras
+    `half_open_success_threshold` pruebas exitosas y un fallo o una llamada lenta
+    lo vuelven a abrir.
+
+    Las excepciones de `exclude` cuentan como éxito (igual que en pybreaker). Las de
+    `ignore` no cuentan ni como éxito ni como fallo, y tampoco la cancelación
+    (asyncio.CancelledError) salvo que llegue después de `slow_call_duration`: esa
+    llamada ya era lenta (p. ej. el primario que pierde un hedge) y se registra como
+    llamada lenta, para que un proveedor lento pero vivo acabe abriendo el circuito.
+
+    Con un `state_backend` (ver shared_state.py) la ventana y el estado cerrado/abierto
+    se comparten entre procesos: cada llamada compara un número de secuencia y solo
+    relee el estado cuando otro proceso lo cambió. El paso a semi-abierto se deriva
+    localmente del instante de apertura compartido y los permisos de prueba son por
+    proceso.
+    """
+
+    def __init__(self, name, reset_timeout, window=None, minimum_calls=10, failure_rate_threshold=0.5,
+                 slow_call_rate_threshold=1.0, slow_call_duration=float("inf"), half_open_max_calls=1,
+                 half_open_success_threshold=1, exclude=(), ignore=(), listeners=(), clock=time.monotonic,
+                 state_backend=None):
+        self.name = name
+        self.reset_timeout = reset_timeout
+        self.window = state_backend.window if state_backend is not None else window
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_success_threshold = half_open_success_threshold
+        self._exclude = tuple(exclude)
+        self._ignore = tuple(ignore)
+        self._listeners = tuple(listeners)
+        self._clock = clock
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._forced_open = False
+        self._half_open_generation = 0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._backend = state_backend
+        self._seen_seq = -1
+
+    # ------------------------------------------------------------------
+    # Introspección
+    # ------------------------------------------------------------------
+    @property
+    def current_state(self):
+        """Estado actual; un circuito abierto pasa a semi-abierto al vencer reset_timeout"""
+        if self._backend is not None and self._backend.state_seq() != self._seen_seq:
+            self._adopt_shared_state()
+        if (self._state == STATE_OPEN and not self._forced_open
+                and self._clock() - self._opened_at >= self.reset_timeout):
+            self._transition(STATE_HALF_OPEN, publish=False)
+        return self._state
+
+    @property
+    def current_failures(self):
+        """Fallos consecutivos desde el último éxito"""
+        return self._failures
+
+    def window_totals(self):
+        """Devuelve (llamadas, fallos, llamadas lentas) de la ventana deslizante"""
+        return self.window.totals(self._clock())
+
+    @property
+    def forced_open(self):
+        return self._forced_open
+
+    def remaining_open_time(self):
+        """Segundos que faltan para pasar a semi-abierto (0 si no está abierto)"""
+        if self.current_state != STATE_OPEN or self._forced_open:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def stats(self):
+        """Foto del estado interno, pensada para /health y para depuración"""
+        calls, failures, slow_calls = self.window_totals()
+        return {
+            "name": self.name,
+            "state": self.current_state,
+            "failures": self._failures,
+            "window_calls": calls,
+            "window_failures": failures,
+            "window_slow_calls": slow_calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(slow_calls / calls, 3) if calls else 0.0,
+            "half_open_in_flight": self._half_open_in_flight,
+            "half_open_successes": self._half_open_successes,
+            "reset_timeout": self.reset_timeout,
+            "forced_open": self._forced_open,
+            "remaining_open_time": round(self.remaining_open_time(), 3),
+        }
+
+    # ------------------------------------------------------------------
+    # Control manual
+    # ------------------------------------------------------------------
+    def add_listener(self, listener):
+        self._listeners = self._listeners + (listener,)
+
+    def reset(self):
+        """Cierra el circuito y reinicia los contadores"""
+        self._failures = 0
+        self._forced_open = False
+        self.window.reset()
+        if self._state != STATE_CLOSED:
+            self._transition(STATE_CLOSED)
+        else:
+            self._publish()
+
+    def force_open(self):
+        """Abre el circuito y lo mantiene abierto hasta que se llame a reset()"""
+        self._forced_open = True
+        self._open()
+
+    def half_open_early(self):
+        """
+        Pasa a semi-abierto sin esperar reset_timeout (p. ej. porque un chequeo de
+        salud externo indica que el proveedor se recuperó). Devuelve True si cambió.
+        """
+        if self.current_state != STATE_OPEN or self._forced_open:
+            return False
+        self._transition(STATE_HALF_OPEN, publish=False)
+        return True
+
+    def hold_open(self):
+        """
+        Reinicia la espera de un circuito abierto, o vuelve a abrir uno semi-abierto
+        sin pruebas en curso, porque un chequeo externo indica que el proveedor sigue
+        caído. Devuelve True si el circuito quedó abierto por este motivo.
+        """
+        state = self.current_state
+        if state == STATE_CLOSED or self._forced_open:
+            return False
+        if state == STATE_HALF_OPEN and self._half_open_in_flight:
+            return False
+        self._open()
+        return True
+
+    # ------------------------------------------------------------------
+    # Instantáneas para reinicios en caliente (ver services/breaker_snapshot.py)
+    # ------------------------------------------------------------------
+    def export_state(self):
+        """Estado serializable a JSON; el instante de apertura va en reloj de pared"""
+        now = self._clock()
+        state = self.current_state
+        return {
+            "state": state,
+            "forced_open": self._forced_open,
+            "failures": self._failures,
+            "opened_at": time.time() - (now - self._opened_at) if state != STATE_CLOSED else None,
+            # Con estado compartido la ventana vive en memoria compartida, no en este proceso
+            "window": self.window.export_state(now) if self._backend is None else None,
+        }
+
+    def restore_state(self, snapshot, age: float, restore_window: bool = True) -> bool:
+        """
+        Restaura un estado de export_state() tomado hace `age` segundos, quizá por otro
+        proceso. Un circuito abierto conserva su instante de apertura: si reset_timeout
+        ya pasó queda semi-abierto y la próxima llamada es una prueba. Un semi-abierto
+        vuelve como semi-abierto, con permisos de prueba nuevos.
+
+        Con estado compartido solo restaura el primer proceso en unirse; si otros
+        workers vivos ya lo usan, su estado es más reciente que cualquier instantánea
+        y se adopta sin publicar nada. Devuelve False en ese caso.
+        """
+        if self._backend is not None and not self._backend.attach():
+            self._adopt_shared_state()
+            return False
+
+        now = self._clock()
+        state = snapshot["state"]
+        self._failures = int(snapshot.get("failures", 0))
+        self._forced_open = bool(snapshot.get("forced_open")) and state != STATE_CLOSED
+
+        if state == STATE_CLOSED:
+            if self._state != STATE_CLOSED:
+                self._transition(STATE_CLOSED)
+            else:
+                # Sustituye lo que dejaron en la memoria compartida workers ya terminados
+                self._publish()
+            if restore_window and snapshot.get("window") and self._backend is None:
+                self.window.restore_state(snapshot["window"], now, age)
+            return True
+
+        if state == STATE_HALF_OPEN:
+            self._opened_at = now - self.reset_timeout
+        else:
+            self._opened_at = now - max(0.0, time.time() - snapshot["opened_at"])
+        if self._state != STATE_OPEN:
+            self._transition(STATE_OPEN)
+        else:
+            self._publish()
+        return True
+
+    # ------------------------------------------------------------------
+    # Llamadas protegidas
+    # ------------------------------------------------------------------
+    def __call__(self, func):
+        """Permite usar el breaker como decorador de funciones async"""
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call(func, *args, **kwargs)
+
+        return wrapper
+
+    async def call(self, func, *args, **kwargs):
+        """Ejecuta la corrutina `func` protegida por el circuito"""
+        probe = self._acquire_permission()
+
+        start = self._clock()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as exc:
+            if isinstance(exc, self._ignore):
+                self._release_permit(probe)
+            elif isinstance(exc, self._exclude):
+                self._on_success(start, probe)
+            else:
+                self._on_failure(start, probe, exc)
+            raise
+        except BaseException:
+            self._on_cancelled(start, probe)
+            raise
+
+        self._on_success(start, probe)
+        return result
+
+    async def call_batch(self, func, size, *args, **kwargs):
+        """
+        Ejecuta una llamada por lotes de `size` elementos protegida por el circuito.
+
+        `func` debe devolver una tupla (resultado, elementos_fallidos). Cada elemento
+        cuenta como una llamada en la ventana: si la llamada completa falla (error de
+        red, 5xx) se registran `size` fallos; si no, un fallo por elemento rechazado.
+        En semi-abierto el lote usa un único permiso y es una prueba exitosa solo si
+        ningún elemento falló.
+        """
+        probe = self._acquire_permission()
+
+        start = self._clock()
+        try:
+            result, failed = await func(*args, **kwargs)
+        except Exception as exc:
+            if isinstance(exc, self._ignore):
+                self._release_permit(probe)
+            elif isinstance(exc, self._exclude):
+                self._record_batch(start, probe, size, 0, None)
+            else:
+                self._record_batch(start, probe, size, size, exc)
+            raise
+        except BaseException:
+            self._release_permit(probe)
+            raise
+
+        self._record_batch(start, probe, size, failed, None)
+        return result
+
+    def _record_batch(self, start, probe, size, failed, exc):
+        if failed and exc is None:
+            exc = BatchItemError(f"{failed} de {size} elementos del lote fallaron")
+        if probe:
+            if failed:
+                self._on_failure(start, probe, exc)
+            else:
+                self._on_success(start, probe)
+            return
+        # Los fallos se reparten uniformemente para no concentrarlos al final de la ventana
+        for i in range(size):
+            if (i + 1) * failed // size > i * failed // size:
+                self._on_failure(start, 0, exc)
+            else:
+                self._on_success(start, 0)
+
+    def _acquire_permission(self):
+        """
+        Decide si la llamada puede ejecutarse. Devuelve 0 con el circuito cerrado o la
+        generación semi-abierta del permiso de prueba concedido.
+        """
+        state = self.current_state
+        if state == STATE_CLOSED:
+            return 0
+        if state == STATE_OPEN:
+            raise CircuitBreakerError(f"Circuito {self.name} abierto")
+        if self._half_open_in_flight >= self.half_open_max_calls:
+            raise CircuitBreakerError(f"Circuito {self.name} semi-abierto sin permisos de prueba libres")
+        self._half_open_in_flight += 1
+        return self._half_open_generation
+
+    def _owns_permit(self, probe):
+        """Indica si `probe` es un permiso de la fase semi-abierta en curso"""
+        return probe != 0 and probe == self._half_open_generation and self._state == STATE_HALF_OPEN
+
+    def _release_permit(self, probe):
+        if self._owns_permit(probe):
+            self._half_open_in_flight -= 1
+
+    def _on_success(self, start, probe):
+        now = self._clock()
+        slow = now - start >= self.slow_call_duration
+        for listener in self._listeners:
+            listener.success(self)
+        self._failures = 0
+        if probe:
+            if not self._owns_permit(probe):
+                return
+            self._half_open_in_flight -= 1
+            if slow:
+                self._open()
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_success_threshold:
+                self._transition(STATE_CLOSED)
+        elif self._state == STATE_CLOSED:
+            self.window.record(False, slow, now)
+            # Un éxito rápido solo puede bajar las tasas, salvo al alcanzar minimum_calls
+            if slow or self.window.calls <= self.minimum_calls:
+                self._check_rates()
+
+    def _on_cancelled(self, start, probe):
+        """Cancelación: solo cuenta, como llamada lenta, si ya superaba slow_call_duration"""
+        now = self._clock()
+        if now - start < self.slow_call_duration:
+            self._release_permit(probe)
+            return
+        if probe:
+            if self._owns_permit(probe):
+                self._half_open_in_flight -= 1
+                self._open()
+        elif self._state == STATE_CLOSED:
+            self.window.record(False, True, now)
+            self._check_rates()
+
+    def _on_failure(self, start, probe, exc):
+        now = self._clock()
+        self._failures += 1
+        for listener in self._listeners:
+            listener.failure(self, exc)
+        if probe:
+            if self._owns_permit(probe):
+                self._half_open_in_flight -= 1
+                self._open()
+        elif self._state == STATE_CLOSED:
+            self.window.record(True, now - start >= self.slow_call_duration, now)
+            self._check_rates()
+
+    def _check_rates(self):
+        """Abre el circuito si la ventana (recién actualizada) supera alguno de los umbrales"""
+        window = self.window
+        calls = window.calls
+        if calls < self.minimum_calls:
+            return
+        if (window.failures >= self.failure_rate_threshold * calls
+                or window.slow_calls >= self.slow_call_rate_threshold * calls):
+            self._open()
+
+    def _open(self):
+        self._opened_at = self._clock()
+        if self._state != STATE_OPEN:
+            self._transition(STATE_OPEN)
+        else:
+            self._publish()
+
+    def _transition(self, new_state, publish=True):
+        old_state = self._state
+        self._state = new_state
+        # Cada estado empieza con una ventana limpia
+        self.window.reset()
+        if new_state == STATE_HALF_OPEN:
+            # Nueva fase de pruebas: los permisos de fases anteriores dejan de contar
+            self._half_open_generation += 1
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        if publish:
+            self._publish()
+        for listener in self._listeners:
+            listener.state_change(self, old_state, new_state)
+
+    # ------------------------------------------------------------------
+    # Estado compartido entre procesos
+    # ------------------------------------------------------------------
+    def _publish(self):
+        if self._backend is not None:
+            # El estado semi-abierto se deriva de opened_at; se comparte como abierto
+            state = STATE_OPEN if self._state == STATE_HALF_OPEN else self._state
+            self._seen_seq = self._backend.publish_state(state, self._opened_at, self._forced_open)
+
+    def _adopt_shared_state(self):
+        state, opened_at, forced, seq = self._backend.load_state()
+        self._seen_seq = seq
+        self._opened_at = opened_at
+        self._forced_open = forced
+        if state != self._state:
+            self._transition(state, publish=False)
+
+
+def describe_state(state, service_name):
+    """Descripción legible del estado del circuito de un proveedor"""
+    return {
+        STATE_CLOSED: f'CERRADO (usando {service_name})',
+        STATE_OPEN: 'ABIERTO (usando el respaldo)',
+        STATE_HALF_OPEN: f'SEMI-ABIERTO (probando {service_name})'
+    }.get(str(state), str(state))
+
+
+# Observador que registra los cambios del circuito de un proveedor
+class CircuitBreakerListener(BreakerListener):
     def __init__(self, service_name):
         self.service_name = service_name
 
     def state_change(self, cb, old_state, new_state):
-        state_map = {
-            'closed': 'CERRADO (usando Aldeamo)',
-            'open': 'ABIERTO (usando Twilio)',
-            'half-open': 'SEMI-ABIERTO (probando Aldeamo)'
-        }
-        old_state_desc = state_map.get(str(old_state), str(old_state))
-        new_state_desc = state_map.get(str(new_state), str(new_state))
+        old_state_desc = describe_state(old_state, self.service_name)
+        new_state_desc = describe_state(new_state, self.service_name)
 
-        logger.info(f"🔄 Circuit Breaker para {self.service_name} cambió de {old_state_desc} a {new_state_desc}")
+        logger.info("🔄 Circuit Breaker para %s cambió de %s a %s", self.service_name, old_state_desc, new_state_desc,
+                    extra={"event": "breaker_state_change", "breaker": cb.name,
+                           "from_state": old_state, "to_state": new_state})
+        BREAKER_TRANSITIONS.labels(cb.name, old_state, new_state).inc()
 
     def failure(self, cb, exc):
-        logger.warning(f"❌ Fallo #{cb.current_failures} en {self.service_name}: {exc}")
-        if cb.current_failures < 3:  # 3 = fail_max
-            logger.info(f"⚠️ {3 - cb.current_failures} fallos más antes de abrir el Circuit Breaker")
+        calls, failures, _ = cb.window_totals()
+        logger.warning("❌ Fallo #%d en %s: %s", cb.current_failures, self.service_name, exc,
+                       extra={"event": "breaker_failure", "breaker": cb.name})
+        if calls + 1 < cb.minimum_calls:
+            logger.info("⚠️ %d llamadas más antes de evaluar la tasa de fallos", cb.minimum_calls - calls - 1)
 
     def success(self, cb):
         if cb.current_failures > 0:
-            logger.info(f"✅ Solicitud exitosa a {self.service_name} después de {cb.current_failures} fallos")
-        cb._failures = 0
-        cb.current_failures = 0
-            
-
-# Crear el circuit breaker para Aldeamo
-aldeamo_breaker = pybreaker.CircuitBreaker(
-    fail_max=3,  # 3 fallos consecutivos para abrir el circuito
-    reset_timeout=15,  # 15 segundos para pasar de open a half-open (tiempo razonable para pruebas)
-    exclude=[],  # No excluir ninguna excepción
-    name="aldeamo_service",
-    listeners=[CircuitBreakerListener("Aldeamo")]
-)
\ No newline at end of file
+            logger.info("✅ Solicitud exitosa a %s después de %d fallos", self.service_name, cb.current_failures,
+                        extra={"event": "breaker_recovered_call", "breaker": cb.name})
+
+
+def register_breaker_metrics(breaker):
+    """Exporta el estado del circuito como un gauge por estado (se evalúa al consultar /metrics)"""
+    for state in (STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN):
+        BREAKER_STATE.labels(breaker.name, state).set_function(
+            lambda state=state: int(breaker.current_state == state)
+        )
+
+
+def build_state_backend(name):
+    """Crea el almacén de estado configurado; None para estado local del proceso"""
+    if settings.BREAKER_STATE_BACKEND == "local":
+        return None
+    if settings.BREAKER_STATE_BACKEND == "shared":
+        from .shared_state import SharedMemoryStateBackend
+        if settings.BREAKER_WINDOW_TYPE != "time":
+            logger.warning("⚠️ El estado compartido usa siempre una ventana por tiempo de BREAKER_WINDOW_SIZE segundos")
+        return SharedMemoryStateBackend(
+            os.path.join(settings.BREAKER_SHARED_STATE_DIR, f"{name}.breaker"),
+            window_size=settings.BREAKER_WINDOW_SIZE,
+            max_workers=settings.BREAKER_SHARED_MAX_WORKERS
+        )
+    raise ValueError(f"Backend de estado desconocido: {settings.BREAKER_STATE_BACKEND}")
+
+
+def build_breaker(service_name):
+    """Crea el circuit breaker de un proveedor con la configuración BREAKER_* y exporta su estado"""
+    name = f"{service_name.lower()}_service"
+    breaker = AsyncCircuitBreaker(
+        reset_timeout=settings.RESET_TIMEOUT,  # Segundos para pasar de open a half-open
+        window=build_window(settings.BREAKER_WINDOW_TYPE, settings.BREAKER_WINDOW_SIZE),
+        state_backend=build_state_backend(name),
+        minimum_calls=settings.BREAKER_MINIMUM_CALLS,
+        failure_rate_threshold=settings.BREAKER_FAILURE_RATE_THRESHOLD,
+        slow_call_rate_threshold=settings.BREAKER_SLOW_CALL_RATE_THRESHOLD,
+        slow_call_duration=settings.BREAKER_SLOW_CALL_DURATION,
+        half_open_max_calls=settings.BREAKER_HALF_OPEN_MAX_CALLS,
+        half_open_success_threshold=settings.BREAKER_HALF_OPEN_SUCCESS_THRESHOLD,
+        exclude=[],  # No excluir ninguna excepción
+        ignore=[DeadlineExceededError],  # El deadline del cliente no dice nada del proveedor
+        name=name,
+        listeners=[CircuitBreakerListener(service_name)]
+    )
+    register_breaker_metrics(breaker)
+    return breaker
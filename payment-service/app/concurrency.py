@@ -0,0 +1,121 @@
+"""
+Límite de concurrencia adaptativo (bulkhead) por proveedor.
+
+El límite sigue un algoritmo de gradiente: con cada respuesta exitosa se compara
+la latencia medida con la mínima observada (la latencia "sin cola") y
+
+    gradiente = clamp(tolerancia × rtt_mínimo / rtt, 0.5, 1.0)
+    nuevo_límite = límite × gradiente + √límite
+
+de modo que el límite crece mientras la latencia se mantiene cerca de la mínima y
+se reduce en cuanto empiezan a formarse colas en el proveedor. Un timeout reduce
+el límite multiplicativamente. Las solicitudes que no obtienen un hueco no
+esperan: se rechazan al instante para que el llamador use el respaldo o descarte.
+
+El límite se actualiza como mucho una vez por latencia mínima, con la media de las
+muestras de ese intervalo: las respuestas que llegan justo después de bajar el
+límite fueron admitidas con el límite anterior y no deben volver a bajarlo.
+"""
+import math
+import time
+
+from .metrics import Counter, Gauge
+
+CONCURRENCY_LIMIT = Gauge("notification_concurrency_limit", "Límite de concurrencia por proveedor", ["provider"])
+CONCURRENCY_REJECTED = Counter(
+    "notification_concurrency_rejected_total", "Llamadas rechazadas por el límite de concurrencia", ["provider"]
+)
+
+
+class BulkheadFullError(Exception):
+    """El proveedor ya tiene tantas llamadas en curso como permite su límite"""
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, name: str, initial_limit: int = 100, min_limit: int = 5, max_limit: int = 1000,
+                 tolerance: float = 1.5, smoothing: float = 0.5, backoff_ratio: float = 0.9,
+                 min_rtt_reset_every: int = 1000, clock=time.monotonic):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff_ratio = backoff_ratio
+        self.min_rtt_reset_every = min_rtt_reset_every
+        self.min_rtt = None
+        self.in_flight = 0
+        self.rejected = 0
+        self._samples = 0
+        self._clock = clock
+        self._window_start = clock()
+        self._window_rtt = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+        self._window_dropped = False
+        self._rejected_metric = CONCURRENCY_REJECTED.labels(name)
+        CONCURRENCY_LIMIT.labels(name).set_function(lambda: int(self.limit))
+
+    def acquire(self):
+        """Reserva un hueco o lanza BulkheadFullError sin esperar"""
+        if self.in_flight >= int(self.limit):
+            self.rejected += 1
+            self._rejected_metric.value += 1
+            raise BulkheadFullError(f"Límite de concurrencia de {self.name} alcanzado ({int(self.limit)})")
+        self.in_flight += 1
+
+    def release(self, rtt: float = None, dropped: bool = False):
+        """
+        Libera el hueco. `rtt` es la latencia de una llamada exitosa (None si no debe
+        usarse como muestra) y `dropped` indica una llamada que venció su timeout.
+        """
+        in_flight = self.in_flight
+        self.in_flight = in_flight - 1
+        if dropped:
+            self._window_dropped = True
+        elif rtt is not None and rtt > 0:
+            # El mínimo se reinicia periódicamente por si la latencia base del proveedor cambió
+            self._samples += 1
+            if self.min_rtt is None or rtt < self.min_rtt or self._samples >= self.min_rtt_reset_every:
+                self.min_rtt = rtt
+                self._samples = 0
+            self._window_rtt += rtt
+            self._window_count += 1
+            if in_flight > self._window_in_flight:
+                self._window_in_flight = in_flight
+        else:
+            return
+
+        now = self._clock()
+        if self.min_rtt is not None and now - self._window_start < self.min_rtt:
+            return
+        self._update_limit()
+        self._window_start = now
+        self._window_rtt = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+        self._window_dropped = False
+
+    def _update_limit(self):
+        if self._window_dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            return
+        if not self._window_count:
+            return
+
+        rtt = self._window_rtt / self._window_count
+        gradient = max(0.5, min(1.0, self.tolerance * self.min_rtt / rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        if new_limit > self.limit and self._window_in_flight * 2 < self.limit:
+            # Sin demanda suficiente las muestras no dicen nada sobre un límite mayor
+            return
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "min_rtt_ms": round(self.min_rtt * 1000, 1) if self.min_rtt is not None else None,
+        }
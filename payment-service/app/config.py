@@ -6,14 +6,179 @@ class Settings(BaseSettings):
     ALDEAMO_SERVICE_URL: str = os.getenv("ALDEAMO_SERVICE_URL", "http://aldeamo-service:8001")
     TWILIO_SERVICE_URL: str = os.getenv("TWILIO_SERVICE_URL", "http://twilio-service:8002")
 
+    # Proveedores de notificaciones en orden de prioridad. Cada uno se configura con variables
+    # <NOMBRE>_SERVICE_URL, <NOMBRE>_MAX_CONNECTIONS, <NOMBRE>_COST_WEIGHT... (ver services/providers.py)
+    NOTIFICATION_PROVIDERS: str = os.getenv("NOTIFICATION_PROVIDERS", "Aldeamo,Twilio")
+    # Enrutamiento: "priority" (orden de NOTIFICATION_PROVIDERS) o "weighted" (por puntuación de salud)
+    NOTIFICATION_ROUTING: str = os.getenv("NOTIFICATION_ROUTING", "priority")
+    ROUTING_EWMA_ALPHA: float = float(os.getenv("ROUTING_EWMA_ALPHA", "0.1"))            # Peso de cada nueva muestra
+    ROUTING_ERROR_HALF_LIFE: float = float(os.getenv("ROUTING_ERROR_HALF_LIFE", "10.0"))  # Segundos para olvidar la mitad de los errores
+    ROUTING_DEFAULT_LATENCY: float = float(os.getenv("ROUTING_DEFAULT_LATENCY", "0.1"))   # Latencia supuesta sin muestras
+    ALDEAMO_COST_WEIGHT: float = float(os.getenv("ALDEAMO_COST_WEIGHT", "1.0"))          # Multiplica la puntuación
+    TWILIO_COST_WEIGHT: float = float(os.getenv("TWILIO_COST_WEIGHT", "1.0"))
+
     # Configuración del Circuit Breaker
-    FAILURE_THRESHOLD: int = int(os.getenv("FAILURE_THRESHOLD", "3"))  # Número de fallos antes de abrir el circuito
     RECOVERY_TIMEOUT: int = int(os.getenv("RECOVERY_TIMEOUT", "5"))    # Segundos entre verificaciones de recuperación
     RESET_TIMEOUT: int = int(os.getenv("RESET_TIMEOUT", "15"))         # Segundos que el circuito permanece abierto
 
+    # Ventana deslizante del Circuit Breaker (se abre por tasa de fallos o de llamadas lentas)
+    BREAKER_WINDOW_TYPE: str = os.getenv("BREAKER_WINDOW_TYPE", "count")  # "count" (llamadas) o "time" (segundos)
+    BREAKER_WINDOW_SIZE: int = int(os.getenv("BREAKER_WINDOW_SIZE", "20"))  # Llamadas o segundos según el tipo
+    BREAKER_MINIMUM_CALLS: int = int(os.getenv("BREAKER_MINIMUM_CALLS", "10"))  # Llamadas mínimas antes de evaluar
+    BREAKER_FAILURE_RATE_THRESHOLD: float = float(os.getenv("BREAKER_FAILURE_RATE_THRESHOLD", "0.5"))  # 0.0 - 1.0
+    BREAKER_SLOW_CALL_RATE_THRESHOLD: float = float(os.getenv("BREAKER_SLOW_CALL_RATE_THRESHOLD", "0.5"))  # 0.0 - 1.0
+    BREAKER_SLOW_CALL_DURATION: float = float(os.getenv("BREAKER_SLOW_CALL_DURATION", "1.0"))  # Segundos
+    BREAKER_HALF_OPEN_MAX_CALLS: int = int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", "2"))  # Pruebas concurrentes en semi-abierto
+    BREAKER_HALF_OPEN_SUCCESS_THRESHOLD: int = int(os.getenv("BREAKER_HALF_OPEN_SUCCESS_THRESHOLD", "3"))  # Éxitos para cerrar
+
+    # Estado del Circuit Breaker: "local" (por proceso) o "shared" (memoria compartida entre workers del host)
+    BREAKER_STATE_BACKEND: str = os.getenv("BREAKER_STATE_BACKEND", "local")
+    BREAKER_SHARED_STATE_DIR: str = os.getenv("BREAKER_SHARED_STATE_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp")
+    BREAKER_SHARED_MAX_WORKERS: int = int(os.getenv("BREAKER_SHARED_MAX_WORKERS", "64"))  # Ranuras de procesos
+
+    # Chequeos de salud activos en segundo plano (cada RECOVERY_TIMEOUT segundos, con jitter)
+    HEALTH_PROBE_ENABLED: bool = os.getenv("HEALTH_PROBE_ENABLED", "true").lower() == "true"
+    HEALTH_PROBE_JITTER: float = float(os.getenv("HEALTH_PROBE_JITTER", "0.2"))          # ± fracción del intervalo
+    HEALTH_PROBE_MAX_AGE: float = float(os.getenv("HEALTH_PROBE_MAX_AGE", "15.0"))       # Segundos que vale un resultado
+    HEALTH_PROBE_FEEDS_BREAKER: bool = os.getenv("HEALTH_PROBE_FEEDS_BREAKER", "false").lower() == "true"
+    HEALTH_PROBE_RECOVERY_THRESHOLD: int = int(os.getenv("HEALTH_PROBE_RECOVERY_THRESHOLD", "2"))  # Chequeos sanos para semi-abrir
+
+    # Configuración de los clientes HTTP (un pool de conexiones por proveedor)
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "5.0"))                  # Timeout de las notificaciones
+    HEALTH_CHECK_TIMEOUT: float = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2.0"))  # Timeout de los health checks
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"    # Requiere el paquete h2
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))  # Segundos que vive una conexión ociosa
+    ALDEAMO_MAX_CONNECTIONS: int = int(os.getenv("ALDEAMO_MAX_CONNECTIONS", "100"))
+    ALDEAMO_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("ALDEAMO_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    TWILIO_MAX_CONNECTIONS: int = int(os.getenv("TWILIO_MAX_CONNECTIONS", "100"))
+    TWILIO_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("TWILIO_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+    # Timeouts adaptativos: percentil de latencia de cada proveedor × multiplicador, acotado
+    # a [ADAPTIVE_TIMEOUT_MIN, HTTP_TIMEOUT]. HTTP_TIMEOUT se usa mientras no hay muestras
+    ADAPTIVE_TIMEOUTS_ENABLED: bool = os.getenv("ADAPTIVE_TIMEOUTS_ENABLED", "true").lower() == "true"
+    ADAPTIVE_TIMEOUT_PERCENTILE: float = float(os.getenv("ADAPTIVE_TIMEOUT_PERCENTILE", "0.99"))  # 0.0 - 1.0
+    ADAPTIVE_TIMEOUT_MULTIPLIER: float = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3.0"))
+    ADAPTIVE_TIMEOUT_MIN: float = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "0.25"))       # Segundos
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES: int = int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", "20"))
+    CONNECT_TIMEOUT: float = float(os.getenv("CONNECT_TIMEOUT", "1.0"))  # Nunca mayor que el de lectura
+
+    # Hedging: lanzar Twilio en paralelo cuando Aldeamo supera su percentil de latencia
+    HEDGING_ENABLED: bool = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+    HEDGE_LATENCY_PERCENTILE: float = float(os.getenv("HEDGE_LATENCY_PERCENTILE", "0.95"))  # 0.0 - 1.0
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))          # Segundos mínimos de espera
+    HEDGE_DEFAULT_DELAY: float = float(os.getenv("HEDGE_DEFAULT_DELAY", "0.5"))   # Espera mientras no hay muestras
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))            # Muestras antes de usar el percentil
+    HEDGE_BUDGET_RATIO: float = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))     # Máximo de carga extra (10%)
+    HEDGE_BUDGET_BURST: float = float(os.getenv("HEDGE_BUDGET_BURST", "10"))      # Hedges acumulables en ráfaga
+
+    # Reintentos con espera exponencial con jitter, acotados por un presupuesto por proveedor
+    ALDEAMO_MAX_RETRIES: int = int(os.getenv("ALDEAMO_MAX_RETRIES", "0"))  # Twilio ya actúa como respaldo
+    TWILIO_MAX_RETRIES: int = int(os.getenv("TWILIO_MAX_RETRIES", "2"))
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.05"))     # Espera máxima del primer reintento
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "1.0"))        # Tope de la espera exponencial
+    RETRY_BUDGET_RATIO: float = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))  # Máximo de reintentos (10% de las llamadas)
+    RETRY_BUDGET_BURST: float = float(os.getenv("RETRY_BUDGET_BURST", "10"))   # Reintentos acumulables en ráfaga
+
+    # Límite de concurrencia adaptativo por proveedor (bulkhead); sin hueco se usa el respaldo o se rechaza
+    BULKHEAD_ENABLED: bool = os.getenv("BULKHEAD_ENABLED", "true").lower() == "true"
+    BULKHEAD_INITIAL_LIMIT: int = int(os.getenv("BULKHEAD_INITIAL_LIMIT", "100"))
+    BULKHEAD_MIN_LIMIT: int = int(os.getenv("BULKHEAD_MIN_LIMIT", "5"))
+    BULKHEAD_MAX_LIMIT: int = int(os.getenv("BULKHEAD_MAX_LIMIT", "1000"))
+    BULKHEAD_RTT_TOLERANCE: float = float(os.getenv("BULKHEAD_RTT_TOLERANCE", "1.5"))  # Latencia tolerada sobre la mínima
+
+    # Envío por lotes y micro-batching de notificaciones individuales
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", "50"))                       # Elementos por llamada /notify/batch
+    COALESCING_ENABLED: bool = os.getenv("COALESCING_ENABLED", "false").lower() == "true"
+    COALESCE_MAX_DELAY: float = float(os.getenv("COALESCE_MAX_DELAY", "0.005"))        # Segundos que se espera para llenar un lote
+
+    # Modo de notificación: "sync" espera al proveedor, "async" encola y responde de inmediato
+    NOTIFICATION_MODE: str = os.getenv("NOTIFICATION_MODE", "sync")
+    OUTBOX_MAX_SIZE: int = int(os.getenv("OUTBOX_MAX_SIZE", "1000"))                 # Notificaciones en cola
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "10"))                     # Workers que drenan la cola
+    OUTBOX_ENQUEUE_TIMEOUT: float = float(os.getenv("OUTBOX_ENQUEUE_TIMEOUT", "0.0"))  # Espera con la cola llena (0 = 429 inmediato)
+    OUTBOX_STATUS_CAPACITY: int = int(os.getenv("OUTBOX_STATUS_CAPACITY", "10000"))  # Estados de entrega que se conservan
+
+    # Outbox durable en SQLite (modo WAL) con commits agrupados
+    OUTBOX_DURABLE: bool = os.getenv("OUTBOX_DURABLE", "false").lower() == "true"
+    OUTBOX_DB_PATH: str = os.getenv("OUTBOX_DB_PATH", "data/outbox.db")
+    OUTBOX_GROUP_COMMIT_MAX: int = int(os.getenv("OUTBOX_GROUP_COMMIT_MAX", "256"))           # Escrituras por fsync
+    OUTBOX_GROUP_COMMIT_WINDOW: float = float(os.getenv("OUTBOX_GROUP_COMMIT_WINDOW", "0.002"))  # Segundos para agrupar
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))                     # Intentos antes de descartar
+    OUTBOX_RETRY_BACKOFF: float = float(os.getenv("OUTBOX_RETRY_BACKOFF", "2.0"))             # Espera base entre reintentos
+    OUTBOX_SWEEP_INTERVAL: float = float(os.getenv("OUTBOX_SWEEP_INTERVAL", "5.0"))           # Segundos entre barridos
+    OUTBOX_COMPACT_INTERVAL: float = float(os.getenv("OUTBOX_COMPACT_INTERVAL", "60.0"))      # Segundos entre compactaciones
+
+    # Claves de idempotencia de /payments: "memory" (por proceso) o "sqlite" (compartido por los workers)
+    IDEMPOTENCY_STORE: str = os.getenv("IDEMPOTENCY_STORE", "memory")
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", "86400"))                # Segundos que se recuerda una clave
+    IDEMPOTENCY_MAX_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(32 * 1024 * 1024)))  # Tope del almacén en memoria
+    IDEMPOTENCY_DB_PATH: str = os.getenv("IDEMPOTENCY_DB_PATH", "data/idempotency.db")
+
+    # Límite de pagos por cliente (token bucket por customer_id) en la entrada de /payments
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    RATE_LIMIT_RATE: float = float(os.getenv("RATE_LIMIT_RATE", "10.0"))          # Pagos por segundo sostenidos
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "20"))              # Ráfaga máxima por cliente
+    RATE_LIMIT_SHARDS: int = int(os.getenv("RATE_LIMIT_SHARDS", "64"))            # Potencia de dos
+    RATE_LIMIT_MAX_ENTRIES: int = int(os.getenv("RATE_LIMIT_MAX_ENTRIES", "1000000"))  # Clientes activos recordados
+
+    # Deadlines de extremo a extremo: cabecera X-Deadline-Ms del cliente (o DEADLINE_DEFAULT),
+    # propagada a los proveedores; se cancela el trabajo si el cliente se desconecta
+    DEADLINE_ENABLED: bool = os.getenv("DEADLINE_ENABLED", "false").lower() == "true"
+    DEADLINE_DEFAULT: float = float(os.getenv("DEADLINE_DEFAULT", "10.0"))    # Segundos sin cabecera
+    DEADLINE_MAX: float = float(os.getenv("DEADLINE_MAX", "60.0"))            # Tope del deadline del cliente
+    DEADLINE_LATENCY_PERCENTILE: float = float(os.getenv("DEADLINE_LATENCY_PERCENTILE", "0.5"))  # Latencia esperada
+    DEADLINE_MIN_SAMPLES: int = int(os.getenv("DEADLINE_MIN_SAMPLES", "20"))  # Muestras antes de saltar proveedores
+
+    # Instantánea del circuit breaker para reinicios en caliente: estado, ventana y latencias
+    # por proveedor se guardan en un archivo local y se restauran al arrancar
+    BREAKER_SNAPSHOT_ENABLED: bool = os.getenv("BREAKER_SNAPSHOT_ENABLED", "false").lower() == "true"
+    BREAKER_SNAPSHOT_PATH: str = os.getenv("BREAKER_SNAPSHOT_PATH", "data/breaker_snapshot.json")
+    BREAKER_SNAPSHOT_INTERVAL: float = float(os.getenv("BREAKER_SNAPSHOT_INTERVAL", "5.0"))    # Segundos entre escrituras
+    BREAKER_SNAPSHOT_MAX_AGE: float = float(os.getenv("BREAKER_SNAPSHOT_MAX_AGE", "300"))      # Más antigua se ignora
+    BREAKER_SNAPSHOT_WINDOW_MAX_AGE: float = float(os.getenv("BREAKER_SNAPSHOT_WINDOW_MAX_AGE", "60"))  # Restaurar la ventana
+
+    # Flujo de eventos por SSE en GET /events (transiciones del circuito, estadísticas y entregas)
+    EVENTS_ENABLED: bool = os.getenv("EVENTS_ENABLED", "true").lower() == "true"
+    EVENTS_BUFFER_SIZE: int = int(os.getenv("EVENTS_BUFFER_SIZE", "256"))              # Eventos por suscriptor antes de descartar
+    EVENTS_MAX_SUBSCRIBERS: int = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "500"))
+    EVENTS_STATS_INTERVAL: float = float(os.getenv("EVENTS_STATS_INTERVAL", "1.0"))    # Segundos entre provider_stats
+    EVENTS_DELIVERY_SAMPLE_RATE: float = float(os.getenv("EVENTS_DELIVERY_SAMPLE_RATE", "0.0"))  # Entregas publicadas
+    EVENTS_KEEPALIVE: float = float(os.getenv("EVENTS_KEEPALIVE", "15.0"))             # Segundos entre keepalives
+
+    # Camino rápido de /payments y de las llamadas a los proveedores: orjson y
+    # estructuras con __slots__ en lugar de Pydantic; las respuestas de los proveedores
+    # solo se decodifican si se leen sus campos
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "false").lower() == "true"
+
+    # Desglose de la latencia por fases en la cabecera Server-Timing, /metrics y /health
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+    # Perfilado bajo demanda con POST /profile (pilas colapsadas de CPU, retraso del loop o tareas)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # Segundos entre muestras
+    PROFILE_LAG_THRESHOLD: float = float(os.getenv("PROFILE_LAG_THRESHOLD", "0.05"))      # Retraso del loop que se muestrea
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))            # Duración máxima de una sesión
+
+    # Logging: JSON a través de una cola drenada por un hilo; los eventos de éxito se muestrean
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")                       # "json" o "text"
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))     # Fracción de eventos de éxito que se registran
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))         # Registros en cola antes de descartar
+
     model_config = {
         "env_file": ".env"
     }
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
+
+
+def provider_setting(provider: str, key: str, default=None):
+    """
+    Valor de `<PROVEEDOR>_<CLAVE>`: el campo de Settings si está declarado (Aldeamo,
+    Twilio) o la variable de entorno para los demás proveedores.
+    """
+    name = f"{provider.upper()}_{key}"
+    if hasattr(settings, name):
+        return getattr(settings, name)
+    return os.getenv(name, default)
\ No newline at end of file
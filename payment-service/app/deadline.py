@@ -0,0 +1,116 @@
+"""
+Deadlines de extremo a extremo.
+
+El cliente de /payments indica cuánto está dispuesto a esperar con la cabecera
+X-Deadline-Ms (milisegundos); sin ella se usa DEADLINE_DEFAULT. El deadline viaja
+por NotificationService hasta cada llamada a un proveedor, que recibe en la misma
+cabecera el presupuesto que queda en ese momento. Se propaga como tiempo
+restante y no como instante absoluto para no depender de que los relojes de los
+servicios estén sincronizados.
+
+Cada capa usa solo lo que queda:
+- el timeout de una llamada nunca supera el presupuesto restante;
+- un proveedor cuya latencia esperada no cabe en el presupuesto se salta sin
+  llamarlo (DeadlineExceededError, se pasa al siguiente);
+- una llamada cortada por el deadline no cuenta como fallo del proveedor en el
+  circuit breaker ni en el límite de concurrencia: la prisa es del cliente.
+
+Si el cliente se desconecta, `cancel_on_disconnect` cancela el trabajo en curso,
+incluidas las llamadas a los proveedores.
+"""
+import asyncio
+import math
+import time
+from typing import Optional
+
+from .config import settings
+from .metrics import Counter
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total", "Intentos abandonados por el deadline del cliente", ["stage"]
+)
+DEADLINE_SKIPPED = DEADLINE_EXCEEDED.labels("skipped")  # Proveedor saltado sin llamarlo
+DEADLINE_EXPIRED = DEADLINE_EXCEEDED.labels("expired")  # Llamada o espera cortada al vencer
+CLIENT_DISCONNECTS = Counter("client_disconnects_total", "Solicitudes canceladas porque el cliente se desconectó")
+
+
+class DeadlineExceededError(Exception):
+    """No queda presupuesto para completar el trabajo antes del deadline del cliente"""
+
+
+class ClientDisconnectedError(Exception):
+    """El cliente se desconectó antes de recibir la respuesta"""
+
+
+class Deadline:
+    __slots__ = ("expires_at",)
+
+    def __init__(self, timeout: float):
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float, maximum: float) -> "Deadline":
+        """Deadline de una solicitud a partir de X-Deadline-Ms; ValueError si no es válido"""
+        if value is None:
+            return cls(default)
+        milliseconds = float(value)
+        if not math.isfinite(milliseconds) or milliseconds < 0:
+            raise ValueError(f"{DEADLINE_HEADER} debe ser un número de milisegundos no negativo")
+        return cls(min(milliseconds / 1000, maximum))
+
+    def remaining(self) -> float:
+        """Segundos que quedan (negativo si ya venció)"""
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def header(self) -> str:
+        """Valor de X-Deadline-Ms para una llamada saliente"""
+        return str(max(0, int(self.remaining() * 1000)))
+
+
+async def _wait_for_disconnect(request):
+    # Con el cuerpo ya leído, el servidor solo entrega http.disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request, coro):
+    """
+    Ejecuta `coro` y la cancela si el cliente se desconecta antes de que termine
+    (ClientDisconnectedError). El cuerpo de la solicitud debe estar ya leído.
+    """
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((work, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        watcher.cancel()
+        work.cancel()
+        raise
+    watcher.cancel()
+
+    if not work.done():
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        if work.cancelled():
+            CLIENT_DISCONNECTS.inc()
+            raise ClientDisconnectedError("El cliente se desconectó antes de recibir la respuesta")
+    # Terminó (quizá mientras se cancelaba): su resultado o su excepción
+    return work.result()
+
+
+def deadline_stats():
+    return {
+        "enabled": settings.DEADLINE_ENABLED,
+        "default_ms": round(settings.DEADLINE_DEFAULT * 1000),
+        "max_ms": round(settings.DEADLINE_MAX * 1000),
+        "skipped": DEADLINE_SKIPPED.value,
+        "expired": DEADLINE_EXPIRED.value,
+        "client_disconnects": CLIENT_DISCONNECTS.labels().value,
+    }
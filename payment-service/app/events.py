@@ -0,0 +1,245 @@
+"""
+Flujo de eventos de payment-service por Server-Sent Events (GET /events).
+
+Publica tres tipos de eventos:
+- `breaker`: cada transición de estado del circuito de un proveedor;
+- `provider_stats`: cada EVENTS_STATS_INTERVAL segundos, el estado y las
+  estadísticas recientes de cada proveedor, calculados una sola vez para todos
+  los suscriptores;
+- `delivery`: una muestra (EVENTS_DELIVERY_SAMPLE_RATE) del resultado de cada
+  notificación.
+
+Publicar es O(1) y no espera: el evento se añade a una cola acotada y una única
+tarea de reparto lo codifica una vez y lo copia al buffer de cada suscriptor. Los
+buffers son acotados y descartan los eventos más antiguos, de modo que un
+cliente lento pierde eventos (se le avisa con un evento `dropped`) pero nunca
+frena el camino de los pagos. Sin suscriptores, publicar no hace nada.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+
+from .circuit_breaker import BreakerListener, describe_state
+from .config import settings
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("breaker", "provider_stats", "delivery")
+
+EVENTS_PUBLISHED = Counter("events_published_total", "Eventos publicados en /events por tipo", ["type"])
+EVENTS_DROPPED = Counter(
+    "events_dropped_total", "Eventos descartados por suscriptor (suscriptor lento o cola de reparto llena)"
+)
+
+
+class SubscriberLimitError(Exception):
+    """Se alcanzó EVENTS_MAX_SUBSCRIBERS"""
+
+
+class Subscriber:
+    __slots__ = ("types", "buffer", "dropped", "reported_dropped", "wakeup", "closed")
+
+    def __init__(self, types, buffer_size: int):
+        self.types = types
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.wakeup = asyncio.Event()
+        self.closed = False
+
+
+def encode_event(seq: int, event_type: str, data) -> bytes:
+    """Trama SSE de un evento"""
+    return f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+class EventBus:
+    def __init__(self, buffer_size: int = 256, max_subscribers: int = 500, stats_interval: float = 1.0,
+                 delivery_sample_rate: float = 0.0, keepalive: float = 15.0, max_pending: int = 10000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.stats_interval = stats_interval
+        self.delivery_sample_rate = delivery_sample_rate
+        self.keepalive = keepalive
+        self._pending = deque(maxlen=max_pending)
+        self._subscribers = set()
+        self._wakeup = None
+        self._task = None
+        self._stats_source = None
+        self._seq = 0
+        self.published = {event_type: EVENTS_PUBLISHED.labels(event_type) for event_type in EVENT_TYPES}
+        self.dropped = 0
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data):
+        """Encola un evento para los suscriptores; no hace nada si no hay ninguno"""
+        if not self._subscribers:
+            return
+        self._seq += 1
+        pending = self._pending
+        if len(pending) == pending.maxlen:
+            # El deque descarta el más antiguo al añadir: lo pierden todos sus destinatarios
+            self._drop(pending[0][1])
+        pending.append((self._seq, event_type, data))
+        self.published[event_type].inc()
+        self._wakeup.set()
+
+    def sample_delivery(self) -> bool:
+        """Si el resultado de esta notificación debe publicarse"""
+        return bool(self._subscribers) and self.delivery_sample_rate > 0 and random.random() < self.delivery_sample_rate
+
+    # ------------------------------------------------------------------
+    # Suscriptores
+    # ------------------------------------------------------------------
+    def subscribe(self, types=None) -> Subscriber:
+        if self._task is None:
+            raise SubscriberLimitError("El flujo de eventos no está activo")
+        if len(self._subscribers) >= self.max_subscribers:
+            raise SubscriberLimitError(f"Se alcanzó el máximo de {self.max_subscribers} suscriptores")
+        subscriber = Subscriber(frozenset(types) if types else None, self.buffer_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def stream(self, subscriber: Subscriber):
+        """Tramas SSE para un suscriptor; al terminar (desconexión) se da de baja"""
+        try:
+            yield f"retry: 2000\n: conectado, tipos {sorted(subscriber.types or EVENT_TYPES)}\n\n".encode()
+            while not subscriber.closed:
+                if not subscriber.buffer:
+                    subscriber.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(subscriber.wakeup.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        # Comentario SSE para que los proxies no cierren la conexión inactiva
+                        yield b": keepalive\n\n"
+                        continue
+                frames = []
+                if subscriber.dropped != subscriber.reported_dropped:
+                    frames.append(encode_event(0, "dropped", {"dropped": subscriber.dropped}))
+                    subscriber.reported_dropped = subscriber.dropped
+                frames.extend(subscriber.buffer)
+                subscriber.buffer.clear()
+                yield b"".join(frames)
+        finally:
+            self.unsubscribe(subscriber)
+
+    # ------------------------------------------------------------------
+    # Tarea de reparto
+    # ------------------------------------------------------------------
+    async def start(self, stats_source=None):
+        """Arranca la tarea de reparto; `stats_source()` produce los eventos provider_stats"""
+        if self._task is not None:
+            return
+        self._stats_source = stats_source
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Las conexiones abiertas terminan su respuesta
+        for subscriber in self._subscribers:
+            subscriber.closed = True
+            subscriber.wakeup.set()
+        self._subscribers.clear()
+
+    async def _run(self):
+        next_stats = time.monotonic() + self.stats_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, next_stats - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + self.stats_interval
+                if self._subscribers and self._stats_source is not None:
+                    try:
+                        self.publish("provider_stats", self._stats_source())
+                    except Exception as e:
+                        logger.error("No se pudieron calcular las estadísticas de los proveedores: %s", e)
+            self._fan_out()
+
+    def _drop(self, event_type: str):
+        """Cuenta un evento de la cola de reparto descartado para cada suscriptor que lo iba a recibir"""
+        for subscriber in self._subscribers:
+            if subscriber.types is None or event_type in subscriber.types:
+                subscriber.dropped += 1
+                self.dropped += 1
+                EVENTS_DROPPED.inc()
+                subscriber.wakeup.set()
+
+    def _fan_out(self):
+        pending = self._pending
+        while pending:
+            seq, event_type, data = pending.popleft()
+            frame = encode_event(seq, event_type, data)
+            for subscriber in self._subscribers:
+                if subscriber.types is not None and event_type not in subscriber.types:
+                    continue
+                buffer = subscriber.buffer
+                if len(buffer) == buffer.maxlen:
+                    # El deque descarta el más antiguo al añadir
+                    subscriber.dropped += 1
+                    self.dropped += 1
+                    EVENTS_DROPPED.inc()
+                buffer.append(frame)
+                subscriber.wakeup.set()
+
+    def stats(self):
+        return {
+            "enabled": self.running,
+            "subscribers": self.subscribers,
+            "pending": len(self._pending),
+            "published": {event_type: child.value for event_type, child in self.published.items()},
+            "dropped": self.dropped,
+            "delivery_sample_rate": self.delivery_sample_rate,
+        }
+
+
+class BreakerEventListener(BreakerListener):
+    """Publica las transiciones del circuito de un proveedor en el flujo de eventos"""
+
+    def __init__(self, bus: EventBus, service_name: str):
+        self.bus = bus
+        self.service_name = service_name
+
+    def state_change(self, cb, old_state, new_state):
+        self.bus.publish("breaker", {
+            "provider": self.service_name,
+            "breaker": cb.name,
+            "from_state": old_state,
+            "to_state": new_state,
+            "description": describe_state(new_state, self.service_name),
+            "forced_open": cb.forced_open,
+            "ts": time.time(),
+        })
+
+
+# Instancia global del flujo de eventos
+event_bus = EventBus(
+    buffer_size=settings.EVENTS_BUFFER_SIZE,
+    max_subscribers=settings.EVENTS_MAX_SUBSCRIBERS,
+    stats_interval=settings.EVENTS_STATS_INTERVAL,
+    delivery_sample_rate=settings.EVENTS_DELIVERY_SAMPLE_RATE,
+    keepalive=settings.EVENTS_KEEPALIVE
+)
+Gauge("events_subscribers", "Suscriptores conectados a /events").set_function(lambda: event_bus.subscribers)
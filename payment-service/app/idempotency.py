@@ -0,0 +1,270 @@
+"""
+Claves de idempotencia para /payments.
+
+Un cliente que reintenta un pago con el mismo `Idempotency-Key` recibe la
+respuesta original en lugar de procesar el pago y notificar otra vez. Las
+solicitudes duplicadas concurrentes se agrupan (single-flight): solo la primera
+ejecuta el trabajo y las demás esperan su resultado. Los errores no se guardan,
+así que un pago fallido puede reintentarse con la misma clave.
+
+El almacén es intercambiable:
+- MemoryIdempotencyStore: LRU con TTL y un tope de memoria, por proceso.
+- SQLiteIdempotencyStore: en disco, compartido por los workers de un host. El
+  single-flight sigue siendo por proceso; entre workers se deduplican los
+  reintentos que llegan después de que el primero terminó.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Coste fijo aproximado de una entrada en memoria (tupla, nodo del OrderedDict, cadenas)
+_ENTRY_OVERHEAD = 200
+
+
+class IdempotencyKeyReusedError(Exception):
+    """La clave ya se usó con un cuerpo de solicitud distinto"""
+
+
+class _OwnerCancelled(Exception):
+    """La ejecución que esperaban los duplicados se canceló; deben volver a intentarlo"""
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyStore:
+    """Interfaz de los almacenes de respuestas; `get` devuelve (huella, respuesta) o None"""
+
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def put(self, key: str, body_fingerprint: str, response: dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """LRU con TTL; al superar `max_bytes` se descartan primero las entradas menos usadas"""
+
+    def __init__(self, ttl: float, max_bytes: int, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries = OrderedDict()  # clave -> (expira, huella, respuesta, tamaño)
+        self.bytes = 0
+        self.evictions = 0
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1], entry[2]
+
+    async def put(self, key: str, body_fingerprint: str, response: dict):
+        size = _ENTRY_OVERHEAD + len(key) + len(body_fingerprint) + len(json.dumps(response))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self._clock() + self.ttl, body_fingerprint, response, size)
+        self.bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        self.bytes -= self._entries.pop(key)[3]
+
+    def _evict(self):
+        entries = self._entries
+        now = self._clock()
+        # Las entradas vencidas y, si hace falta, las menos usadas salen por el principio
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry[0] > now and self.bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "store": "memory",
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Respuestas en una base SQLite (modo WAL); las consultas se ejecutan fuera del event loop"""
+
+    def __init__(self, path: str, ttl: float, purge_every: int = 1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._conn = None
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        def locked():
+            with self._lock:
+                return func(self._connection(), *args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, locked)
+
+    async def get(self, key: str):
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT fingerprint, response FROM idempotency_keys WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone())
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    async def put(self, key: str, body_fingerprint: str, response: dict):
+        self._puts += 1
+        purge = self._puts % self.purge_every == 0
+
+        def write(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?, ?, ?, ?)",
+                (key, body_fingerprint, json.dumps(response), now + self.ttl)
+            )
+            if purge:
+                conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+
+        await self._run(write)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        return {"store": "sqlite", "path": self.path}
+
+
+class IdempotencyCache:
+    """Single-flight por clave sobre un IdempotencyStore"""
+
+    def __init__(self, store: IdempotencyStore):
+        self.store = store
+        self._in_flight = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def run(self, key: str, body_fingerprint: str, func, admit=None):
+        """
+        Devuelve (respuesta, repetida). Ejecuta `func()` solo si la clave no tiene una
+        respuesta guardada ni una ejecución en curso. `admit()` se llama justo antes
+        de ejecutar `func` (no en las respuestas repetidas) y puede lanzar una
+        excepción para rechazar la solicitud, p. ej. el límite por cliente.
+        """
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            pending_fingerprint, future = pending
+            if pending_fingerprint != body_fingerprint:
+                raise IdempotencyKeyReusedError(key)
+            self.coalesced += 1
+            try:
+                # shield: si este llamador se cancela, la ejecución original sigue para los demás
+                return await asyncio.shield(future), True
+            except _OwnerCancelled:
+                # El primero se canceló (p. ej. su cliente se desconectó): uno de los que
+                # esperaban toma el relevo y los demás se agrupan con él
+                return await self.run(key, body_fingerprint, func, admit)
+
+        stored = await self.store.get(key)
+        if stored is not None:
+            stored_fingerprint, response = stored
+            if stored_fingerprint != body_fingerprint:
+                raise IdempotencyKeyReusedError(key)
+            self.hits += 1
+            return response, True
+
+        # Otra solicitud pudo registrarse mientras se consultaba el almacén
+        if key in self._in_flight:
+            return await self.run(key, body_fingerprint, func, admit)
+
+        if admit is not None:
+            admit()
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (body_fingerprint, future)
+        try:
+            response = await func()
+        except asyncio.CancelledError:
+            future.set_exception(_OwnerCancelled(key))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el aviso de "exception was never retrieved" si nadie esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+        finally:
+            del self._in_flight[key]
+
+        try:
+            await self.store.put(key, body_fingerprint, response)
+        except Exception as e:
+            # El pago ya se procesó: un fallo del almacén no debe convertirlo en error
+            logger.error("❌ No se pudo guardar la respuesta de la clave de idempotencia %s: %s", key, e)
+        return response, False
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "in_flight": len(self._in_flight),
+            **self.store.stats(),
+        }
+
+
+def build_idempotency_store() -> IdempotencyStore:
+    if settings.IDEMPOTENCY_STORE == "memory":
+        return MemoryIdempotencyStore(settings.IDEMPOTENCY_TTL, settings.IDEMPOTENCY_MAX_BYTES)
+    if settings.IDEMPOTENCY_STORE == "sqlite":
+        return SQLiteIdempotencyStore(settings.IDEMPOTENCY_DB_PATH, settings.IDEMPOTENCY_TTL)
+    raise ValueError(f"Almacén de idempotencia desconocido: {settings.IDEMPOTENCY_STORE}")
+
+
+# Instancia global de la caché de idempotencia
+idempotency_cache = IdempotencyCache(build_idempotency_store())
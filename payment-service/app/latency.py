@@ -0,0 +1,157 @@
+"""
+Seguimiento de latencias por proveedor.
+
+LatencyTracker combina una media móvil exponencial (EWMA) con un histograma de
+cubetas logarítmicas que se "olvida" a la mitad cada `decay_every` observaciones,
+de modo que los cuantiles reflejan el comportamiento reciente. Registrar una
+observación es O(log n) sobre un número fijo de cubetas y no reserva memoria.
+
+Las llamadas cortadas antes de terminar (timeouts, cancelaciones) solo se
+cuentan en `censored`: su duración es la del corte, no la del proveedor, y si
+entraran en el histograma el timeout adaptativo se alimentaría de sí mismo.
+"""
+import math
+from bisect import bisect_left
+
+
+class LatencyTracker:
+    def __init__(self, alpha=0.1, min_latency=0.001, max_latency=60.0, growth=1.1, decay_every=1000):
+        self.alpha = alpha
+        self.decay_every = decay_every
+        steps = int(math.ceil(math.log(max_latency / min_latency) / math.log(growth)))
+        self._bounds = [min_latency * growth ** i for i in range(steps + 1)]
+        self._counts = [0.0] * len(self._bounds)
+        self._total = 0.0
+        self._since_decay = 0
+        self.count = 0
+        self.censored = 0
+        self.ewma = 0.0
+
+    def observe(self, seconds: float):
+        index = bisect_left(self._bounds, seconds)
+        if index == len(self._bounds):
+            index -= 1
+        self._counts[index] += 1.0
+        self._total += 1.0
+        self.count += 1
+        if self.count == 1:
+            self.ewma = seconds
+        else:
+            self.ewma += self.alpha * (seconds - self.ewma)
+
+        self._since_decay += 1
+        if self._since_decay >= self.decay_every:
+            self._decay()
+
+    def observe_censored(self):
+        """Llamada cortada antes de terminar: su latencia real es desconocida, solo se cuenta"""
+        self.censored += 1
+
+    def _decay(self):
+        counts = self._counts
+        for i in range(len(counts)):
+            counts[i] *= 0.5
+        self._total *= 0.5
+        self._since_decay = 0
+
+    def quantile(self, q: float) -> float:
+        """Cota superior de la cubeta que contiene el cuantil q (0.0 - 1.0); 0.0 sin datos"""
+        if self._total <= 0.0:
+            return 0.0
+        target = q * self._total
+        cumulative = 0.0
+        for bound, count in zip(self._bounds, self._counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self._bounds[-1]
+
+    def export_state(self):
+        """Histograma (solo cubetas no vacías) y EWMA, serializables a JSON"""
+        return {
+            "buckets": len(self._bounds),
+            "counts": [[i, count] for i, count in enumerate(self._counts) if count],
+            "total": self._total,
+            "since_decay": self._since_decay,
+            "count": self.count,
+            "censored": self.censored,
+            "ewma": self.ewma,
+        }
+
+    def restore_state(self, data):
+        """Restaura un export_state(); se ignora si el histograma tiene otra forma"""
+        if data.get("buckets") != len(self._bounds):
+            return
+        counts = self._counts
+        for i in range(len(counts)):
+            counts[i] = 0.0
+        for i, count in data["counts"]:
+            counts[i] = float(count)
+        self._total = float(data["total"])
+        self._since_decay = int(data["since_decay"])
+        self.count = int(data["count"])
+        self.censored = int(data.get("censored", 0))
+        self.ewma = float(data["ewma"])
+
+    def stats(self):
+        return {
+            "samples": self.count,
+            "censored": self.censored,
+            "ewma_ms": round(self.ewma * 1000, 1),
+            "p50_ms": round(self.quantile(0.5) * 1000, 1),
+            "p95_ms": round(self.quantile(0.95) * 1000, 1),
+            "p99_ms": round(self.quantile(0.99) * 1000, 1),
+        }
+
+
+class AdaptiveTimeout:
+    """
+    Timeout derivado de la latencia observada: percentil × multiplicador, acotado a
+    [min_timeout, max_timeout]. Mientras no hay `min_samples` observaciones se usa
+    max_timeout. El valor se recalcula cada `refresh_every` llamadas (completadas o
+    cortadas) para no recorrer el histograma en cada llamada.
+
+    Solo las llamadas completadas entran en el percentil: los timeouts no suben el
+    timeout, así que en un brownout la cola se sigue cortando. Pero si más de
+    `max_censored_ratio` de las llamadas desde el último cálculo se cortó, el timeout
+    se ha quedado corto (p. ej. la latencia normal del proveedor pasó de 80 a 400 ms)
+    y sin completadas nunca se corregiría: se duplica hacia max_timeout hasta que
+    vuelven a completarse. Para no oscilar, al bajar el valor se reduce como mucho
+    a la mitad en cada cálculo.
+    """
+
+    def __init__(self, tracker: LatencyTracker, percentile: float, multiplier: float, min_timeout: float,
+                 max_timeout: float, min_samples: int = 20, refresh_every: int = 20, max_censored_ratio: float = 0.5):
+        self.tracker = tracker
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.max_censored_ratio = max_censored_ratio
+        self.widened = 0
+        self._computed_at = None
+        self._censored_at = 0
+        self._value = max_timeout
+
+    def value(self) -> float:
+        tracker = self.tracker
+        calls = tracker.count + tracker.censored
+        if self._computed_at is not None and calls - self._computed_at < self.refresh_every:
+            return self._value
+
+        if tracker.count < self.min_samples:
+            value = self.max_timeout
+        else:
+            derived = tracker.quantile(self.percentile) * self.multiplier
+            value = min(self.max_timeout, max(self.min_timeout, derived, self._value / 2))
+            if self._computed_at is not None:
+                cut = tracker.censored - self._censored_at
+                if cut > (calls - self._computed_at) * self.max_censored_ratio:
+                    value = max(value, min(self.max_timeout, self._value * 2))
+                    self.widened += 1
+        self._computed_at = calls
+        self._censored_at = tracker.censored
+        self._value = value
+        return value
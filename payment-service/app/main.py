@@ -1,26 +1,85 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 import logging
+import math
+import uuid
 from .services.notification_service import notification_service
+from .services.outbox import notification_outbox, OutboxFullError
+from .services.health_prober import health_prober
+from .services.breaker_snapshot import breaker_snapshot
+from .circuit_breaker import CircuitBreakerError
+from .concurrency import BulkheadFullError
+from .deadline import (DEADLINE_HEADER, ClientDisconnectedError, Deadline, DeadlineExceededError,
+                       cancel_on_disconnect, deadline_stats)
+from .idempotency import idempotency_cache, fingerprint, IdempotencyKeyReusedError
+from .rate_limit import customer_rate_limiter
+from .config import settings
+from .events import EVENT_TYPES, SubscriberLimitError, event_bus
+from .metrics import instrument_app
+from .serialization import CodecError, RawJSONResponse, StructField, dumps, struct, validation_error_response
+from .structured_logging import setup_logging
+from .timing import handler_span, instrument_timing, phase_stats
+from .profiling import PROFILE_MODES, ProfilerBusyError, profiler
 from fastapi.openapi.utils import get_openapi
-from .reset import force_circuit_closed
-
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from .reset import force_circuit_closed, force_circuit_open
+
+# Configurar logging (cola no bloqueante; los eventos del camino de éxito se muestrean)
+log_pipeline = setup_logging(
+    "payment-service",
+    level=settings.LOG_LEVEL,
+    log_format=settings.LOG_FORMAT,
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    sampled_events=("payment_processed", "payment_batch", "notification_sent"),
+    queue_size=settings.LOG_QUEUE_SIZE
 )
+# httpx registra en INFO cada llamada a los proveedores; ya quedan en las métricas
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los pools de conexiones a los proveedores viven lo mismo que la aplicación
+    await notification_service.startup()
+    if settings.BREAKER_SNAPSHOT_ENABLED:
+        # Antes del chequeo de salud y del tráfico, para arrancar con el circuito que había
+        breaker_snapshot.restore()
+        await breaker_snapshot.start()
+    if settings.HEALTH_PROBE_ENABLED:
+        await health_prober.start()
+    if settings.EVENTS_ENABLED:
+        await event_bus.start(notification_service.get_provider_stats)
+    if settings.NOTIFICATION_MODE == "async":
+        await notification_outbox.start()
+    yield
+    await notification_outbox.stop()
+    await health_prober.stop()
+    await event_bus.stop()
+    await breaker_snapshot.stop()
+    await notification_service.shutdown()
+    idempotency_cache.store.close()
+    log_pipeline.stop()
+
+
 app = FastAPI(
     title="Servicio de Pagos",
     description="API para procesar pagos y enviar notificaciones usando el patrón Circuit Breaker",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan
 )
 
+# Middleware de métricas y endpoint /metrics
+instrument_app(app)
+if settings.SERVER_TIMING_ENABLED:
+    # Desglose por fases en Server-Timing; el tiempo de logging cuenta como fase `log`
+    instrument_timing(app, log_pipeline.handler)
+
 
 class PaymentRequest(BaseModel):
     amount: float
@@ -56,6 +115,18 @@ class PaymentResponse(BaseModel):
     }
 
 
+# Estructura compilada equivalente a PaymentRequest para el camino rápido
+PaymentIn = struct("PaymentIn", amount=StructField(float), customer_id=StructField(str), message=StructField(str, None))
+
+
+class BatchPaymentRequest(BaseModel):
+    payments: List[PaymentRequest]
+
+
+class BatchPaymentResponse(BaseModel):
+    results: List[PaymentResponse]
+
+
 @app.get("/")
 async def read_root():
     return {"message": "Servicio de Pagos", "status": "online"}
@@ -70,97 +141,464 @@ async def health_check():
     return {
         "status": "healthy",
         "current_notification_service": notification_service.get_current_service(),
-        "circuit_breaker": circuit_state
+        "circuit_breaker": circuit_state,
+        "bulkheads": notification_service.get_bulkhead_stats(),
+        "hedging": notification_service.get_hedging_stats(),
+        "timeouts": notification_service.get_timeout_stats(),
+        "retries": notification_service.get_retry_stats(),
+        "batching": notification_service.get_batching_stats(),
+        "routing": notification_service.get_routing_stats(),
+        "provider_health": health_prober.snapshot(),
+        "breaker_snapshot": breaker_snapshot.stats(),
+        "notification_mode": settings.NOTIFICATION_MODE,
+        "outbox": notification_outbox.stats(),
+        "idempotency": idempotency_cache.stats(),
+        "rate_limit": customer_rate_limiter.stats(),
+        "deadlines": deadline_stats(),
+        "events": event_bus.stats(),
+        "timing": phase_stats.stats(),
+        "profiling": profiler.stats(),
+        "logging": log_pipeline.stats()
     }
 
 
-@app.post("/payments", response_model=PaymentResponse)
-async def process_payment(payment: PaymentRequest):
+async def process_payment(
+    payment: PaymentRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    deadline_ms: Optional[str] = Header(None, alias=DEADLINE_HEADER,
+                                        description="Milisegundos que el cliente está dispuesto a esperar")
+):
+    result, replayed = await _run_with_deadline(
+        request, deadline_ms,
+        lambda deadline: _handle_payment(payment, idempotency_key, lambda: payment.model_dump_json().encode(), deadline)
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def process_payment_fast(request: Request):
+    """/payments sin Pydantic: decodifica a PaymentIn y devuelve los bytes de la respuesta"""
+    try:
+        payment = PaymentIn.decode(await request.body())
+    except CodecError as e:
+        return validation_error_response(e)
+
+    headers = request.headers
+    result, replayed = await _run_with_deadline(
+        request, headers.get(DEADLINE_HEADER),
+        lambda deadline: _handle_payment(payment, headers.get("idempotency-key"), payment.encode, deadline)
+    )
+    return RawJSONResponse(dumps(result), headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+
+async def _run_with_deadline(request: Request, deadline_ms: Optional[str], handler):
+    """
+    Con DEADLINE_ENABLED construye el deadline de la solicitud (cabecera X-Deadline-Ms o
+    DEADLINE_DEFAULT) y ejecuta `handler(deadline)` cancelándolo si el cliente se
+    desconecta; sin él, `handler(None)`.
+    """
+    with handler_span():
+        if not settings.DEADLINE_ENABLED:
+            return await handler(None)
+        try:
+            deadline = Deadline.from_header(deadline_ms, settings.DEADLINE_DEFAULT, settings.DEADLINE_MAX)
+        except ValueError:
+            raise HTTPException(status_code=400,
+                                detail=f"{DEADLINE_HEADER} debe ser un número de milisegundos no negativo")
+        try:
+            return await cancel_on_disconnect(request, handler(deadline))
+        except ClientDisconnectedError as e:
+            # Nadie leerá la respuesta; el código queda en las métricas y los logs
+            logger.info("Cliente desconectado, trabajo cancelado", extra={"event": "client_disconnected"})
+            raise HTTPException(status_code=499, detail=str(e))
+
+
+# Con FAST_PATH_ENABLED el mismo endpoint se sirve sin validación de Pydantic
+if settings.FAST_PATH_ENABLED:
+    app.post(
+        "/payments",
+        response_model=PaymentResponse,
+        response_class=RawJSONResponse,
+        openapi_extra={"requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": PaymentRequest.model_json_schema()}}
+        }}
+    )(process_payment_fast)
+else:
+    app.post("/payments", response_model=PaymentResponse)(process_payment)
+
+
+async def _handle_payment(payment, idempotency_key: Optional[str], encode, deadline=None):
+    """
+    Límite por cliente e idempotencia comunes a los dos caminos de /payments.
+    `encode` devuelve el cuerpo canónico del pago, del que sale su huella.
+    Devuelve (respuesta, si es una respuesta repetida).
+    """
+    if idempotency_key is None:
+        _charge_rate_limit(payment)
+        return await _process_payment(payment, deadline), False
+
+    if not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key debe tener entre 1 y 255 caracteres")
+
+    # Un reintento con la misma clave recibe la respuesta original (o espera a la que está
+    # en curso) sin consumir cuota: el límite solo se cobra si el pago se va a procesar
+    try:
+        return await idempotency_cache.run(
+            idempotency_key,
+            fingerprint(encode()),
+            lambda: _process_payment(payment, deadline),
+            admit=lambda: _charge_rate_limit(payment)
+        )
+    except IdempotencyKeyReusedError:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key ya se usó con una solicitud de pago distinta"
+        )
+
+
+def _charge_rate_limit(payment):
+    """Con RATE_LIMIT_ENABLED, 429 si el cliente excede su cuota de pagos"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    # Antes que cualquier otro trabajo: un cliente que excede su cuota no toca a los proveedores
+    wait = customer_rate_limiter.try_acquire(payment.customer_id)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Límite de pagos excedido para el cliente {payment.customer_id}",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+
+
+def new_payment_id() -> str:
+    """Identificador único del pago; con él se consulta el estado de su notificación"""
+    return "pmt_" + uuid.uuid4().hex
+
+
+async def _process_payment(payment, deadline=None):
     try:
         # Simular procesamiento de pago
-        logger.info(f"Procesando pago de {payment.amount} para el cliente {payment.customer_id}")
+        logger.debug("Procesando pago de %s para el cliente %s", payment.amount, payment.customer_id)
 
         # Preparar mensaje de notificación
         message = payment.message or f"Se ha procesado un pago de ${payment.amount} con éxito."
+        payment_id = new_payment_id()
+
+        if settings.NOTIFICATION_MODE == "async":
+            # Confirmar el pago de inmediato; los workers del outbox envían la notificación
+            await notification_outbox.enqueue(
+                payment_id,
+                message,
+                payment.customer_id,
+                timeout=settings.OUTBOX_ENQUEUE_TIMEOUT
+            )
+            return {
+                "payment_id": payment_id,
+                "status": "completed",
+                "notification_service": "pending",
+                "notification_status": "queued"
+            }
 
         # Enviar notificación utilizando el servicio apropiado con circuit breaker
         notification_result = await notification_service.send_notification(
             message,
-            payment.customer_id
+            payment.customer_id,
+            deadline
         )
 
-        # Obtener qué servicio de notificación se utilizó
-        current_service = notification_service.get_current_service()
-        logger.info(f"Pago procesado y notificado a través de {current_service}")
+        # Obtener qué servicio de notificación se utilizó (con solicitudes concurrentes
+        # o lotes, el servicio "actual" puede haber cambiado mientras esperábamos)
+        current_service = notification_result.get("provider") or notification_service.get_current_service()
+        logger.info("Pago %s procesado y notificado a través de %s", payment_id, current_service,
+                    extra={"event": "payment_processed", "customer_id": payment.customer_id,
+                           "provider": current_service})
 
         return {
-            "payment_id": "pmt_" + payment.customer_id,
+            "payment_id": payment_id,
             "status": "completed",
             "notification_service": current_service,
             "notification_status": "sent"
         }
 
+    except OutboxFullError as e:
+        logger.warning("Outbox lleno, rechazando el pago del cliente %s", payment.customer_id,
+                       extra={"event": "payment_rejected", "reason": "outbox_full"})
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+    except DeadlineExceededError as e:
+        # Ningún proveedor pudo responder dentro del deadline del cliente
+        logger.warning("Deadline vencido, abandonando el pago del cliente %s", payment.customer_id,
+                       extra={"event": "payment_rejected", "reason": "deadline"})
+        raise HTTPException(status_code=504, detail=str(e))
+
+    except BulkheadFullError as e:
+        # Todos los proveedores están saturados: se descarta en lugar de encolar
+        logger.warning("Proveedores saturados, rechazando el pago del cliente %s", payment.customer_id,
+                       extra={"event": "payment_rejected", "reason": "bulkhead"})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    except CircuitBreakerError as e:
+        # Los circuitos de todos los proveedores están abiertos
+        logger.warning("Sin proveedores disponibles, rechazando el pago del cliente %s", payment.customer_id,
+                       extra={"event": "payment_rejected", "reason": "circuit_open"})
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(notification_service.retry_after())}
+        )
+
     except Exception as e:
-        logger.error(f"Error al procesar el pago: {str(e)}")
+        logger.error("Error al procesar el pago: %s", e, extra={"event": "payment_failed"})
         raise HTTPException(status_code=500, detail=f"Error al procesar el pago: {str(e)}")
 
 
+@app.post("/payments/batch",
+          response_model=BatchPaymentResponse,
+          summary="Procesar pagos por lotes",
+          description="Procesa varios pagos y envía sus notificaciones en llamadas por lotes a los proveedores",
+          tags=["Pagos"])
+async def process_payment_batch(
+    batch: BatchPaymentRequest,
+    request: Request,
+    deadline_ms: Optional[str] = Header(None, alias=DEADLINE_HEADER,
+                                        description="Milisegundos que el cliente está dispuesto a esperar")
+):
+    return await _run_with_deadline(request, deadline_ms, lambda deadline: _process_payment_batch(batch, deadline))
+
+
+async def _process_payment_batch(batch: BatchPaymentRequest, deadline=None):
+    logger.info("Procesando lote de %d pagos", len(batch.payments),
+                extra={"event": "payment_batch", "size": len(batch.payments)})
+
+    # Los pagos que exceden el límite de su cliente se rechazan individualmente
+    limited = [
+        settings.RATE_LIMIT_ENABLED and customer_rate_limiter.try_acquire(payment.customer_id) > 0
+        for payment in batch.payments
+    ]
+    if settings.NOTIFICATION_MODE == "async":
+        return {"results": await _enqueue_payment_batch(batch.payments, limited)}
+
+    items = [
+        (payment.message or f"Se ha procesado un pago de ${payment.amount} con éxito.", payment.customer_id)
+        for payment, rejected in zip(batch.payments, limited) if not rejected
+    ]
+    results = iter(await notification_service.send_batch(items, deadline))
+
+    responses = []
+    for payment, rejected in zip(batch.payments, limited):
+        if rejected:
+            responses.append(_rejected_payment(new_payment_id(), "rate_limited"))
+            continue
+        result = next(results)
+        if isinstance(result, Exception):
+            logger.error("Error al notificar el pago del cliente %s: %s", payment.customer_id, result,
+                         extra={"event": "notification_failed"})
+            notification = {"notification_service": "none", "notification_status": "failed"}
+        else:
+            notification = {"notification_service": result["provider"], "notification_status": "sent"}
+        responses.append({
+            "payment_id": new_payment_id(),
+            "status": "completed",
+            **notification
+        })
+
+    return {"results": responses}
+
+
+async def _enqueue_payment_batch(payments, limited):
+    """
+    Con NOTIFICATION_MODE=async cada pago del lote pasa por el outbox, como en
+    /payments. Si la cola se llena, los pagos restantes solo entran si hay hueco
+    sin esperar, y los demás se rechazan uno a uno.
+    """
+    responses = []
+    timeout = settings.OUTBOX_ENQUEUE_TIMEOUT
+    for payment, rejected in zip(payments, limited):
+        payment_id = new_payment_id()
+        if rejected:
+            responses.append(_rejected_payment(payment_id, "rate_limited"))
+            continue
+        try:
+            await notification_outbox.enqueue(
+                payment_id,
+                payment.message or f"Se ha procesado un pago de ${payment.amount} con éxito.",
+                payment.customer_id,
+                timeout=timeout
+            )
+        except OutboxFullError:
+            timeout = 0.0
+            responses.append(_rejected_payment(payment_id, "outbox_full"))
+            continue
+        responses.append({
+            "payment_id": payment_id,
+            "status": "completed",
+            "notification_service": "pending",
+            "notification_status": "queued"
+        })
+    rejected = sum(1 for response in responses if response["notification_status"] == "outbox_full")
+    if rejected:
+        logger.warning("Outbox lleno, %d pagos del lote rechazados", rejected,
+                       extra={"event": "payment_rejected", "reason": "outbox_full"})
+    return responses
+
+
+def _rejected_payment(payment_id: str, reason: str):
+    return {
+        "payment_id": payment_id,
+        "status": "rejected",
+        "notification_service": "none",
+        "notification_status": reason
+    }
+
+
+@app.get("/events",
+         summary="Flujo de eventos",
+         description="Server-Sent Events con las transiciones del circuito, las estadísticas de cada proveedor "
+                     "y una muestra de las entregas. Los clientes lentos pierden los eventos más antiguos.",
+         tags=["Información"])
+async def stream_events(types: Optional[str] = Query(
+    None, description=f"Tipos separados por comas ({', '.join(EVENT_TYPES)}); todos si se omite"
+)):
+    selected = [event_type.strip() for event_type in types.split(",") if event_type.strip()] if types else None
+    unknown = set(selected or ()) - set(EVENT_TYPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Tipos de evento desconocidos: {', '.join(sorted(unknown))}")
+
+    try:
+        subscriber = event_bus.subscribe(selected)
+    except SubscriberLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return StreamingResponse(
+        event_bus.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/payments/{payment_id}/notification",
+         summary="Estado de la notificación",
+         description="Consulta el resultado de la entrega de la notificación de un pago (modo asíncrono)",
+         tags=["Pagos"])
+async def get_notification_status(payment_id: str):
+    status = await notification_outbox.lookup_status(payment_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No hay notificaciones registradas para {payment_id}")
+    return {"payment_id": payment_id, **status}
+
+
+def _get_provider(name: Optional[str]):
+    try:
+        return notification_service.get_provider(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Proveedor desconocido: {name}")
+
+
 @app.post("/force-recovery",
           summary="Forzar recuperación",
-          description="Fuerza un intento de usar Aldeamo independientemente del estado del circuito",
+          description="Verifica si un proveedor (el principal por defecto) responde, independientemente del estado de su circuito",
           tags=["Administración"])
-async def force_recovery():
+async def force_recovery(provider: Optional[str] = None):
     """
-    Fuerza un intento de verificar y recuperar la conexión con Aldeamo.
-    Útil para administradores cuando saben que Aldeamo está funcionando nuevamente.
+    Verifica la conexión con un proveedor usando el último chequeo de salud en segundo
+    plano (o uno nuevo si no hay uno reciente).
+    Útil para administradores cuando saben que el proveedor está funcionando nuevamente.
     """
+    target = _get_provider(provider)
     try:
-        aldeamo_health = await notification_service.check_aldeamo_health()
-        if aldeamo_health:
-            return {"status": "success", "message": "Aldeamo está funcionando correctamente"}
+        healthy = await health_prober.is_healthy(target)
+        if healthy:
+            return {"status": "success", "message": f"{target.name} está funcionando correctamente"}
         else:
-            return {"status": "warning", "message": "Aldeamo sigue sin responder"}
+            return {"status": "warning", "message": f"{target.name} sigue sin responder"}
     except Exception as e:
-        return {"status": "error", "message": f"Error al verificar Aldeamo: {str(e)}"}
+        return {"status": "error", "message": f"Error al verificar {target.name}: {str(e)}"}
 
 
 @app.post("/reset-circuit",
           summary="Reiniciar Circuit Breaker",
-          description="Reinicia el estado del Circuit Breaker a cerrado (usar con precaución)",
+          description="Reinicia a cerrado el Circuit Breaker de un proveedor, o de todos si no se indica (usar con precaución)",
           tags=["Administración"])
-async def reset_circuit():
+async def reset_circuit(provider: Optional[str] = None):
     """
-    Reinicia manualmente el estado del Circuit Breaker.
-    Usar con precaución, ya que puede generar más fallos si Aldeamo no está realmente recuperado.
+    Reinicia manualmente el estado del Circuit Breaker de cada proveedor que responde.
+    Usar con precaución, ya que puede generar más fallos si el proveedor no está realmente recuperado.
     """
+    targets = [_get_provider(provider)] if provider else list(notification_service.providers)
     try:
-        # Verificar primero si Aldeamo está funcionando
-        aldeamo_health = await notification_service.check_aldeamo_health()
-
-        if aldeamo_health:
+        reset, unhealthy = [], []
+        for target in targets:
+            # Verificar primero si el proveedor está funcionando
+            if not await health_prober.is_healthy(target):
+                unhealthy.append(target.name)
+                continue
             # Forzar reinicio del Circuit Breaker
-            notification_service.current_service = "Aldeamo"
-            success = force_circuit_closed()
-
-            if success:
-                return {
-                    "status": "success", 
-                    "message": "Circuit Breaker reiniciado. Aldeamo establecido como servicio predeterminado."
-                }
-            else:
+            if not force_circuit_closed(target.breaker):
                 return {
                     "status": "error",
-                    "message": "No se pudo reiniciar el Circuit Breaker"
+                    "message": f"No se pudo reiniciar el Circuit Breaker de {target.name}"
                 }
-        else:
+            reset.append(target.name)
+
+        if reset:
+            notification_service.current_service = reset[0]
+        if not unhealthy:
             return {
-                "status": "warning",
-                "message": "No se puede restablecer Aldeamo porque sigue fallando. Arregle primero Aldeamo."
+                "status": "success",
+                "message": f"Circuit Breaker reiniciado: {', '.join(reset)}. {reset[0]} establecido como servicio predeterminado."
             }
+        return {
+            "status": "warning",
+            "message": f"No se puede restablecer {', '.join(unhealthy)} porque sigue fallando. Arréglelo primero.",
+            "reset": reset
+        }
     except Exception as e:
         return {"status": "error", "message": f"Error al reiniciar circuit breaker: {str(e)}"}
 
 
+@app.post("/open-circuit",
+          summary="Abrir Circuit Breaker",
+          description="Abre manualmente el Circuit Breaker de un proveedor (el principal por defecto) y desvía su tráfico",
+          tags=["Administración"])
+async def open_circuit(provider: Optional[str] = None):
+    """
+    Abre manualmente el Circuit Breaker (por ejemplo, durante un mantenimiento del proveedor).
+    El circuito permanece abierto hasta llamar a /reset-circuit.
+    """
+    target = _get_provider(provider)
+    if force_circuit_open(target.breaker):
+        message = f"Circuit Breaker de {target.name} abierto."
+        fallback = next((p for p in notification_service.providers if p.available()), None)
+        if fallback is not None:
+            notification_service.current_service = fallback.name
+            message += f" {fallback.name} establecido como servicio predeterminado."
+        return {"status": "success", "message": message}
+    return {"status": "error", "message": f"No se pudo abrir el Circuit Breaker de {target.name}"}
+
+
+@app.post("/profile",
+          summary="Perfilado bajo demanda",
+          description="Perfila el proceso durante `seconds` segundos y devuelve las pilas colapsadas "
+                      "(formato de flamegraph.pl): `cpu` muestrea el hilo del event loop, `lag` mide su "
+                      "retraso y muestrea lo que lo bloquea, `tasks` muestra dónde esperan las tareas",
+          tags=["Administración"])
+async def profile(
+    mode: str = Query("cpu", description=f"Modo: {', '.join(PROFILE_MODES)}"),
+    seconds: float = Query(5.0, gt=0, description="Duración de la sesión (acotada a PROFILE_MAX_SECONDS)"),
+    interval: Optional[float] = Query(None, ge=0.001, le=1.0, description="Segundos entre muestras")
+):
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="El perfilado está desactivado (PROFILING_ENABLED=false)")
+    try:
+        return await profiler.profile(mode, seconds, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -177,14 +615,14 @@ def custom_openapi():
 
         * Procesamiento de pagos
         * Envío de notificaciones utilizando el patrón Circuit Breaker
-        * Alternancia automática entre servicios de notificación (Aldeamo y Twilio)
+        * Alternancia automática entre servicios de notificación (Aldeamo, Twilio u otros configurados)
 
         ## Flujo de trabajo
 
         1. La API recibe una solicitud de pago con un monto, ID de cliente y mensaje opcional
         2. Procesa el pago 
-        3. Envía una notificación a través de Aldeamo (servicio principal)
-        4. Si Aldeamo falla, utiliza Twilio como servicio de respaldo
+        3. Envía una notificación a través del primer proveedor (Aldeamo por defecto, o el mejor puntuado)
+        4. Si ese proveedor falla, utiliza el siguiente como respaldo (Twilio por defecto)
         5. Registra qué proveedor de notificaciones está utilizando
         """,
         routes=app.routes,
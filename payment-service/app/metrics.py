@@ -0,0 +1,281 @@
+"""
+Métricas en el formato de texto de Prometheus, sin dependencias externas.
+
+Las métricas se declaran una vez a nivel de módulo y sus hijos con etiquetas se
+enlazan de antemano con `labels(...)`, de modo que actualizar una métrica en el
+camino caliente es una suma sobre un atributo: sin formateo de cadenas ni
+búsquedas por etiquetas. Todas las actualizaciones ocurren en el hilo del event
+loop, así que no hacen falta locks; el texto solo se genera al consultar /metrics.
+
+Este módulo es idéntico en los tres servicios.
+"""
+import math
+import time
+from bisect import bisect_left
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Cubetas por defecto para latencias en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        registry.register(self)
+
+    def labels(self, *values):
+        """Devuelve (creándolo la primera vez) el hijo con esos valores de etiqueta"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _labelsets(self):
+        for key, child in self._children.items():
+            yield list(zip(self.labelnames, key)), child
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def samples(self):
+        for labels, child in self._labelsets():
+            yield self.name, labels, child.value
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_function")
+
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """El valor se calcula con `function()` al exportar (p. ej. el tamaño de una cola)"""
+        self._function = function
+
+    def get(self):
+        return self._function() if self._function is not None else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.value = value
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def dec(self, amount=1):
+        self._default.value -= amount
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def samples(self):
+        for labels, child in self._labelsets():
+            yield self.name, labels, child.get()
+
+
+class _HistogramChild:
+    __slots__ = ("_upper", "counts", "sum")
+
+    def __init__(self, upper):
+        self._upper = upper
+        # Conteos no acumulados por cubeta; la última es +Inf
+        self.counts = [0] * (len(upper) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self._upper, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS,
+                 registry=REGISTRY):
+        self._upper = tuple(float(b) for b in sorted(buckets) if b != math.inf)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self):
+        for labels, child in self._labelsets():
+            cumulative = 0
+            for bound, count in zip(self._upper + (math.inf,), child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", bound)], cumulative
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, cumulative
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        if isinstance(value, float):
+            value = _format_value(value)
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# ----------------------------------------------------------------------
+# Métricas HTTP comunes a los tres servicios
+# ----------------------------------------------------------------------
+HTTP_REQUESTS = Counter("http_requests_total", "Solicitudes HTTP atendidas", ["handler", "method", "status"])
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Duración de las solicitudes HTTP", ["handler"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Solicitudes HTTP en curso")
+
+
+# Métodos HTTP estándar; el resto se agrupa en "other" para acotar las series
+_HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "CONNECT", "TRACE"))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware) que cuenta solicitudes por
+    endpoint, método y código de estado y mide su duración. Los hijos de cada
+    combinación se guardan en caché tras la primera solicitud. Las rutas que no
+    existen van a la etiqueta "none" y los métodos no estándar a "other", para
+    que un cliente no pueda crear series sin límite.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = HTTP_IN_FLIGHT.labels()
+        self._children = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self._in_flight.value += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._in_flight.value -= 1
+            # El router de Starlette añade el endpoint al scope al resolver la ruta
+            method = scope["method"]
+            if method not in _HTTP_METHODS:
+                method = "other"
+            key = (scope.get("endpoint"), method, status)
+            children = self._children.get(key)
+            if children is None:
+                children = self._children[key] = self._bind(*key)
+            children[0].value += 1
+            children[1].observe(elapsed)
+
+    @staticmethod
+    def _bind(endpoint, method, status):
+        # Sin ruta (404) el endpoint es None
+        handler = getattr(endpoint, "__name__", "none")
+        return HTTP_REQUESTS.labels(handler, method, status), HTTP_REQUEST_DURATION.labels(handler)
+
+
+def instrument_app(app: FastAPI, registry: Registry = REGISTRY):
+    """Registra el middleware de métricas y el endpoint /metrics"""
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
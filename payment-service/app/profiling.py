@@ -0,0 +1,193 @@
+"""
+Perfilado bajo demanda del proceso.
+
+POST /profile activa durante unos segundos uno de tres muestreadores y devuelve
+lo observado como pilas colapsadas ("marco;marco;marco cuenta" por línea, el
+formato de entrada de flamegraph.pl y speedscope):
+
+- `cpu`: un hilo muestrea cada `interval` segundos la pila del hilo del event
+  loop (sys._current_frames), esté ocupado o esperando en el selector;
+- `lag`: una tarea mide el retraso del event loop despertándose cada `interval`
+  segundos, y un hilo vigía muestrea la pila del loop solo mientras lleva más de
+  `lag_threshold` segundos sin responder: las pilas son el código que lo bloquea;
+- `tasks`: cada `interval` segundos se recorre la cadena de await de cada tarea
+  de asyncio; las pilas muestran dónde están esperando las tareas.
+
+Fuera de una sesión no hay hilos ni tareas: el coste es nulo.
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from .config import settings
+from .latency import LatencyTracker
+
+PROFILE_MODES = ("cpu", "lag", "tasks")
+
+
+class ProfilerBusyError(Exception):
+    """Ya hay una sesión de perfilado en curso"""
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _collapse_frame(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def _collapse_coroutine(coro) -> str:
+    """Cadena de await de una corrutina, de la más externa a lo que espera"""
+    names = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            # Un futuro, o una corrutina que ya terminó
+            names.append(type(coro).__name__)
+            break
+        names.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return ";".join(names)
+
+
+class Profiler:
+    """Sesiones de perfilado de una en una, de hasta `max_seconds` segundos"""
+
+    def __init__(self, interval: float, lag_threshold: float, max_seconds: float):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.max_seconds = max_seconds
+        self.sessions = 0
+        self._running = None
+
+    @property
+    def running(self):
+        return self._running
+
+    async def profile(self, mode: str, seconds: float, interval: float = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfilado desconocido: {mode}")
+        if self._running is not None:
+            raise ProfilerBusyError(f"Ya hay un perfilado '{self._running}' en curso")
+        seconds = min(seconds, self.max_seconds)
+        interval = interval or self.interval
+
+        self._running = mode
+        self.sessions += 1
+        stacks = StackCounter()
+        try:
+            extra = await getattr(self, f"_profile_{mode}")(seconds, interval, stacks)
+        finally:
+            self._running = None
+
+        result = {
+            "mode": mode,
+            "seconds": seconds,
+            "interval_s": interval,
+            "samples": sum(stacks.values()),
+            "collapsed": "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+        }
+        result.update(extra)
+        return result
+
+    @staticmethod
+    async def _sample_thread(seconds: float, sample):
+        """Ejecuta `sample()` en un hilo mientras el event loop espera `seconds`"""
+        stop = threading.Event()
+        thread = threading.Thread(target=sample, args=(stop,), name="profiler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    async def _profile_cpu(self, seconds: float, interval: float, stacks):
+        loop_thread = threading.get_ident()
+
+        def sample(stop):
+            while not stop.wait(interval):
+                frame = sys._current_frames().get(loop_thread)
+                if frame is not None:
+                    stacks[_collapse_frame(frame)] += 1
+
+        await self._sample_thread(seconds, sample)
+        return {}
+
+    async def _profile_lag(self, seconds: float, interval: float, stacks):
+        loop_thread = threading.get_ident()
+        lag = LatencyTracker(min_latency=1e-5)
+        stalls = 0
+        max_lag = 0.0
+        heartbeat = time.perf_counter()
+        threshold = self.lag_threshold
+
+        def watch(stop):
+            while not stop.wait(interval):
+                if time.perf_counter() - heartbeat > interval + threshold:
+                    frame = sys._current_frames().get(loop_thread)
+                    if frame is not None:
+                        stacks[_collapse_frame(frame)] += 1
+
+        async def beat():
+            nonlocal heartbeat, stalls, max_lag
+            while True:
+                await asyncio.sleep(interval)
+                now = time.perf_counter()
+                late = max(0.0, now - heartbeat - interval)
+                heartbeat = now
+                lag.observe(late)
+                max_lag = max(max_lag, late)
+                if late > threshold:
+                    stalls += 1
+
+        beater = asyncio.ensure_future(beat())
+        try:
+            await self._sample_thread(seconds, watch)
+        finally:
+            beater.cancel()
+            await asyncio.gather(beater, return_exceptions=True)
+        return {
+            "lag": {
+                **lag.stats(),
+                "max_ms": round(max_lag * 1000, 1),
+                "threshold_ms": round(threshold * 1000, 1),
+                "stalls": stalls,
+            }
+        }
+
+    async def _profile_tasks(self, seconds: float, interval: float, stacks):
+        me = asyncio.current_task()
+        deadline = time.monotonic() + seconds
+        max_tasks = 0
+        while time.monotonic() < deadline:
+            tasks = asyncio.all_tasks()
+            max_tasks = max(max_tasks, len(tasks))
+            for task in tasks:
+                if task is not me:
+                    stacks[_collapse_coroutine(task.get_coro())] += 1
+            await asyncio.sleep(interval)
+        return {"max_tasks": max_tasks}
+
+    def stats(self):
+        return {
+            "enabled": settings.PROFILING_ENABLED,
+            "running": self._running,
+            "sessions": self.sessions,
+        }
+
+
+# Instancia global del perfilador
+profiler = Profiler(
+    interval=settings.PROFILE_SAMPLE_INTERVAL,
+    lag_threshold=settings.PROFILE_LAG_THRESHOLD,
+    max_seconds=settings.PROFILE_MAX_SECONDS
+)
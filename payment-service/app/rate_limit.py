@@ -0,0 +1,113 @@
+"""
+Límite de solicitudes por cliente en la entrada de /payments.
+
+Cada customer_id tiene un token bucket de `rate` tokens por segundo y capacidad
+`burst`, implementado como GCRA: en lugar de (tokens, último relleno) se guarda
+un único float por cliente, el instante teórico en que su bucket volverá a estar
+lleno. El relleno es perezoso (se calcula al admitir) y admitir es O(1).
+
+Una entrada cuyo instante ya pasó equivale a un bucket lleno, así que puede
+borrarse sin cambiar el comportamiento. La tabla se divide en `shards`
+diccionarios y cada uno se barre cuando duplica su tamaño desde el último
+barrido: el coste se amortiza y cada pausa del event loop recorre solo un shard.
+Si un shard supera su parte de `max_entries` con clientes todos activos, se
+descartan los más antiguos (que vuelven a empezar con el bucket lleno), de modo
+que la memoria queda acotada aunque haya millones de clientes distintos.
+"""
+import time
+from itertools import islice
+
+from .config import settings
+from .metrics import Counter
+
+RATE_LIMITED = Counter("payments_rate_limited_total", "Pagos rechazados por el límite por cliente")
+
+
+class CustomerRateLimiter:
+    def __init__(self, rate: float, burst: int, shards: int = 64, max_entries: int = 1000000,
+                 min_sweep_size: int = 1024, clock=time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError("El límite por cliente necesita rate > 0 y burst >= 1")
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError("El número de shards debe ser una potencia de dos")
+        self.rate = rate
+        self.burst = burst
+        self._interval = 1.0 / rate
+        self._burst_window = burst * self._interval
+        self._mask = shards - 1
+        self._shards = [{} for _ in range(shards)]
+        self._max_per_shard = max(1, max_entries // shards)
+        # Tras un barrido cada shard queda como mucho en 7/8 de su tope
+        self._low_water = self._max_per_shard - self._max_per_shard // 8
+        self._min_sweep_size = min(min_sweep_size, self._max_per_shard)
+        self._sweep_sizes = [self._min_sweep_size] * shards
+        self._clock = clock
+        self.admitted = 0
+        self.rejected = 0
+        self.evicted_idle = 0
+        self.evicted_active = 0
+        self.sweeps = 0
+
+    def try_acquire(self, key: str) -> float:
+        """Consume un token de `key`; devuelve 0.0 si se admite o los segundos hasta el próximo token"""
+        now = self._clock()
+        index = hash(key) & self._mask
+        shard = self._shards[index]
+
+        tat = shard.get(key)
+        if tat is None or tat < now:
+            tat = now
+        allow_at = tat + self._interval - self._burst_window
+        if allow_at > now:
+            self.rejected += 1
+            RATE_LIMITED.inc()
+            return allow_at - now
+
+        shard[key] = tat + self._interval
+        self.admitted += 1
+        if len(shard) > self._sweep_sizes[index]:
+            self._sweep(index, now)
+        return 0.0
+
+    def _sweep(self, index: int, now: float):
+        shard = self._shards[index]
+        idle = [key for key, tat in shard.items() if tat <= now]
+        for key in idle:
+            del shard[key]
+        self.evicted_idle += len(idle)
+
+        overflow = len(shard) - self._low_water
+        if overflow > 0:
+            # Todos activos: se descartan los insertados hace más tiempo
+            for key in list(islice(shard, overflow)):
+                del shard[key]
+            self.evicted_active += overflow
+
+        self._sweep_sizes[index] = min(self._max_per_shard, max(self._min_sweep_size, 2 * len(shard)))
+        self.sweeps += 1
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self):
+        return {
+            "enabled": settings.RATE_LIMIT_ENABLED,
+            "rate": self.rate,
+            "burst": self.burst,
+            "entries": len(self),
+            "shards": len(self._shards),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evicted_idle": self.evicted_idle,
+            "evicted_active": self.evicted_active,
+            "sweeps": self.sweeps,
+        }
+
+
+# Instancia global del límite por cliente (solo se aplica con RATE_LIMIT_ENABLED)
+customer_rate_limiter = CustomerRateLimiter(
+    rate=settings.RATE_LIMIT_RATE,
+    burst=settings.RATE_LIMIT_BURST,
+    shards=settings.RATE_LIMIT_SHARDS,
+    max_entries=settings.RATE_LIMIT_MAX_ENTRIES
+)
@@ -1,31 +1,33 @@
 """
-Módulo para reiniciar el estado del circuit breaker.
+Módulo para reiniciar el estado del circuit breaker de un proveedor.
 """
 import logging
-from .circuit_breaker import aldeamo_breaker
-from pybreaker import CircuitClosedState
 
 logger = logging.getLogger(__name__)
 
 
-def force_circuit_closed():
+def force_circuit_closed(breaker):
     """
-    Fuerza el reinicio del circuit breaker para Aldeamo, cambiando su estado a cerrado.
+    Fuerza el reinicio del circuit breaker, cambiando su estado a cerrado.
     """
     try:
-        logger.info("🔄 Forzando reinicio del Circuit Breaker a estado CERRADO")
-
-        # Reiniciar los contadores internos
-        aldeamo_breaker._last_failure = None
-        aldeamo_breaker._failures = 0
-        aldeamo_breaker.current_failures = 0
+        logger.info("🔄 Forzando reinicio del Circuit Breaker %s a estado CERRADO", breaker.name)
+        breaker.reset()
+        logger.info("✅ Circuit Breaker %s forzado a estado CERRADO exitosamente", breaker.name)
+        return True
+    except Exception as e:
+        logger.error("❌ Error al forzar reinicio del Circuit Breaker %s: %s", breaker.name, e)
+        return False
 
-        # Forzar cambio de estado a cerrado
-        if aldeamo_breaker._state and not isinstance(aldeamo_breaker._state, CircuitClosedState):
-            aldeamo_breaker._state = CircuitClosedState(aldeamo_breaker)
-            logger.info("✅ Circuit Breaker forzado a estado CERRADO exitosamente")
 
+def force_circuit_open(breaker):
+    """
+    Fuerza la apertura del circuit breaker; permanece abierto hasta un reinicio manual.
+    """
+    try:
+        logger.info("🔄 Forzando apertura del Circuit Breaker %s", breaker.name)
+        breaker.force_open()
         return True
     except Exception as e:
-        logger.error(f"❌ Error al forzar reinicio del Circuit Breaker: {str(e)}")
-        return False
\ No newline at end of file
+        logger.error("❌ Error al forzar apertura del Circuit Breaker %s: %s", breaker.name, e)
+        return False
@@ -0,0 +1,79 @@
+"""
+Reintentos de llamadas a proveedores con espera exponencial con jitter completo.
+
+Cada proveedor tiene su propia política: un máximo de reintentos por llamada y un
+presupuesto de tokens (TokenBudget) que acota los reintentos a una fracción del
+tráfico normal, de modo que durante una caída de ambos proveedores la carga
+saliente no se multiplica. Solo se reintentan los errores transitorios: 5xx,
+timeouts y errores de conexión; los 4xx y el circuito abierto fallan de inmediato.
+"""
+import asyncio
+import random
+
+import httpx
+
+from .budget import TokenBudget
+from .metrics import Counter
+
+RETRIES = Counter("notification_retries_total", "Reintentos a proveedores por resultado", ["provider", "outcome"])
+
+
+class ProviderError(Exception):
+    """El proveedor respondió con un código de estado de error"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, ProviderError):
+        return exc.status_code is not None and exc.status_code >= 500
+    # Timeouts, conexiones rechazadas o reiniciadas y errores de protocolo
+    return isinstance(exc, httpx.TransportError)
+
+
+class RetryPolicy:
+    def __init__(self, name: str, max_retries: int, budget: TokenBudget, base_delay: float, max_delay: float):
+        self.name = name
+        self.max_retries = max_retries
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self._retried_metric = RETRIES.labels(name, "retried")
+        self._exhausted_metric = RETRIES.labels(name, "budget_exhausted")
+
+    def backoff(self, attempt: int) -> float:
+        """Jitter completo: un valor uniforme entre 0 y la espera exponencial del intento"""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(self, func, *args, **kwargs):
+        self.calls += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                if not self.budget.try_spend():
+                    self.budget_exhausted += 1
+                    self._exhausted_metric.inc()
+                    raise
+            attempt += 1
+            self.retries += 1
+            self._retried_metric.inc()
+            await asyncio.sleep(self.backoff(attempt))
+
+    def stats(self):
+        return {
+            "max_retries": self.max_retries,
+            "calls": self.calls,
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "budget_tokens": round(self.budget.tokens, 2),
+        }
@@ -0,0 +1,107 @@
+"""
+Enrutamiento ponderado entre proveedores de notificaciones.
+
+Cada proveedor lleva una media móvil exponencial (EWMA) de la latencia de todas
+sus llamadas, exitosas o no, y de su tasa de error. La tasa de error se olvida
+con el tiempo (se reduce a la mitad cada `error_half_life` segundos sin nuevas
+observaciones) para que un proveedor que dejó de recibir tráfico pueda volver a
+competir. La puntuación estima el coste de una entrega exitosa:
+
+    puntuación = peso_de_coste × latencia × (llamadas_en_curso + 1) / (1 - tasa_de_error)
+
+El router elige con potencia de dos elecciones: toma dos proveedores disponibles
+al azar y se queda con uno de ellos con probabilidad inversamente proporcional a
+su puntuación. Así la carga se desplaza de forma gradual a medida que un
+proveedor se degrada, en lugar de saltar de golpe de uno a otro, y todos los
+proveedores sanos siguen recibiendo muestras. El resto queda como respaldo,
+ordenado por puntuación.
+"""
+import random
+import time
+
+# Tope de la tasa de error en la puntuación, para que no se divida por cero
+_MAX_ERROR_RATE = 0.99
+
+
+class RoutingStats:
+    """EWMA de latencia y tasa de error de un proveedor, tal como las ve el router"""
+
+    __slots__ = ("alpha", "error_half_life", "latency", "_error_rate", "_updated_at", "_clock")
+
+    def __init__(self, alpha: float = 0.1, error_half_life: float = 10.0, clock=time.monotonic):
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.latency = None
+        self._error_rate = 0.0
+        self._updated_at = 0.0
+        self._clock = clock
+
+    def observe(self, seconds: float, failed: bool):
+        now = self._clock()
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+        error_rate = self.error_rate(now)
+        self._error_rate = error_rate + self.alpha * ((1.0 if failed else 0.0) - error_rate)
+        self._updated_at = now
+
+    def error_rate(self, now: float = None) -> float:
+        """Tasa de error con el olvido acumulado desde la última observación"""
+        if self._error_rate == 0.0:
+            return 0.0
+        if now is None:
+            now = self._clock()
+        return self._error_rate * 0.5 ** ((now - self._updated_at) / self.error_half_life)
+
+    def export_state(self):
+        return {"latency": self.latency, "error_rate": self.error_rate()}
+
+    def restore_state(self, data, age: float):
+        """Restaura un export_state() tomado hace `age` segundos, con el olvido de ese tiempo"""
+        self.latency = data.get("latency")
+        self._error_rate = float(data.get("error_rate", 0.0)) * 0.5 ** (age / self.error_half_life)
+        self._updated_at = self._clock()
+
+
+class WeightedRouter:
+    """
+    Ordena los proveedores para una notificación. Los proveedores deben exponer
+    `routing` (RoutingStats), `cost_weight`, `in_flight` y `available()`; los no
+    disponibles (circuito abierto) van al final, en su orden configurado.
+    """
+
+    def __init__(self, default_latency: float = 0.1, rng=None, clock=time.monotonic):
+        self.default_latency = default_latency
+        self._rng = rng or random.Random()
+        self._clock = clock
+
+    def score(self, provider, now: float = None) -> float:
+        stats = provider.routing
+        latency = stats.latency if stats.latency is not None else self.default_latency
+        error_rate = min(_MAX_ERROR_RATE, stats.error_rate(self._clock() if now is None else now))
+        return provider.cost_weight * latency * (provider.in_flight + 1) / (1.0 - error_rate)
+
+    def order(self, providers):
+        available = []
+        unavailable = []
+        for provider in providers:
+            (available if provider.available() else unavailable).append(provider)
+        if len(available) < 2:
+            return available + unavailable
+
+        now = self._clock()
+        scores = {id(provider): self.score(provider, now) for provider in available}
+        first, second = self._rng.sample(available, 2)
+        # Elección ponderada entre los dos candidatos: peso = 1 / puntuación
+        first_score = scores[id(first)]
+        second_score = scores[id(second)]
+        if first_score <= 0.0 or second_score <= 0.0:
+            chosen = first if first_score <= second_score else second
+        elif self._rng.random() * (first_score + second_score) < second_score:
+            chosen = first
+        else:
+            chosen = second
+
+        rest = sorted((p for p in available if p is not chosen), key=lambda p: scores[id(p)])
+        return [chosen] + rest + unavailable
@@ -0,0 +1,249 @@
+"""
+Instantánea del estado de los circuit breakers para reinicios en caliente.
+
+Sin ella, un proceso recién arrancado (despliegue, reinicio por OOM) parte con
+todos los circuitos cerrados y las ventanas vacías, y vuelve a descubrir con
+tráfico real que un proveedor sigue caído. BreakerSnapshotter guarda cada
+`interval` segundos, en cada transición del circuito y al apagarse un archivo
+JSON pequeño con, por proveedor, el estado del circuito (con su instante de
+apertura), la ventana deslizante, el histograma de latencias y las estadísticas
+de enrutamiento; al arrancar lo restaura si no es demasiado antiguo.
+
+La escritura es atómica (archivo temporal, fsync y os.replace), de modo que un
+corte a mitad deja la instantánea anterior intacta, y se hace en un hilo para no
+bloquear el event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from ..circuit_breaker import BreakerListener
+from ..config import settings
+from ..metrics import Counter
+from .providers import provider_registry
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_WRITES = Counter("breaker_snapshot_writes_total", "Escrituras de la instantánea del circuito", ["outcome"])
+
+
+class SnapshotListener(BreakerListener):
+    """Pide una escritura en cada transición para no perder una apertura reciente"""
+
+    def __init__(self, snapshotter):
+        self._snapshotter = snapshotter
+
+    def state_change(self, cb, old_state, new_state):
+        self._snapshotter.request_write()
+
+
+class BreakerSnapshotter:
+    """
+    Guarda y restaura el estado de los proveedores de `registry` en `path`.
+
+    Al restaurar se descarta una instantánea de más de `max_age` segundos: el
+    mundo ya cambió y es mejor empezar de cero. Entre `window_max_age` y `max_age`
+    se restaura el estado del circuito (un circuito abierto sigue abierto hasta
+    cumplir su reset_timeout) y las latencias, pero no la ventana por conteo, que
+    no tiene marcas de tiempo; la ventana por tiempo descarta sola las cubetas
+    que ya quedaron fuera.
+    """
+
+    def __init__(self, registry, path: str, interval: float, max_age: float, window_max_age: float):
+        self._registry = registry
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.window_max_age = window_max_age
+        self._task = None
+        self._wake = None
+        self._inflight = None
+        self.restored = None  # Resultado de restore(): "restored", "missing", "stale", "invalid"
+        self.restored_age = None
+        self.last_written_at = None
+        self.write_errors = 0
+        for provider in registry:
+            provider.breaker.add_listener(SnapshotListener(self))
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    # ------------------------------------------------------------------
+    # Restauración
+    # ------------------------------------------------------------------
+    def restore(self) -> str:
+        """Restaura la instantánea de `path` si existe y es válida; devuelve el resultado"""
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = json.loads(f.read())
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(f"versión {snapshot.get('version')} no soportada")
+            age = time.time() - float(snapshot["written_at"])
+            providers = snapshot["providers"]
+            if not isinstance(providers, dict):
+                raise ValueError("'providers' no es un objeto")
+        except FileNotFoundError:
+            self.restored = "missing"
+            return self.restored
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Instantánea del circuito inválida en %s, se ignora: %s", self.path, e)
+            self.restored = "invalid"
+            return self.restored
+
+        # Un reloj que retrocedió no debe hacer la instantánea más fresca de lo que es
+        age = max(0.0, age)
+        self.restored_age = age
+        if age > self.max_age:
+            logger.info("Instantánea del circuito de hace %.0fs (máximo %.0fs), se ignora", age, self.max_age)
+            self.restored = "stale"
+            return self.restored
+
+        restore_window = age <= self.window_max_age
+        for provider in self._registry:
+            state = providers.get(provider.key)
+            if state is None:
+                continue
+            try:
+                restored = provider.breaker.restore_state(state["breaker"], age, restore_window)
+                provider.latency.restore_state(state["latency"])
+                provider.routing.restore_state(state["routing"], age)
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                logger.warning("No se pudo restaurar el estado de %s: %s", provider.name, e)
+                continue
+            if not restored:
+                logger.info(
+                    "Otros workers ya comparten el circuito de %s: "
+                    "se adopta su estado (%s) en lugar de la instantánea",
+                    provider.name, provider.breaker.current_state
+                )
+                continue
+            logger.info(
+                "Estado de %s restaurado de hace %.1fs: circuito %s",
+                provider.name, age, provider.breaker.current_state
+            )
+        self.restored = "restored"
+        return self.restored
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def export(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "written_at": time.time(),
+            "pid": os.getpid(),
+            "providers": {
+                provider.key: {
+                    "breaker": provider.breaker.export_state(),
+                    "latency": provider.latency.export_state(),
+                    "routing": provider.routing.export_state(),
+                }
+                for provider in self._registry
+            },
+        }
+
+    def _write_file(self, data: bytes):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Temporal por proceso: varios workers pueden escribir a la vez, gana el último
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        # fsync del directorio para que el rename sobreviva a un corte de luz
+        try:
+            fd = os.open(directory or ".", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    async def _write(self):
+        # El estado se captura en el event loop; solo el I/O va al hilo
+        data = json.dumps(self.export(), separators=(",", ":")).encode()
+        self._inflight = asyncio.get_running_loop().run_in_executor(None, self._write_file, data)
+        # shield: si se cancela el bucle, la escritura sigue y stop() la espera
+        try:
+            await asyncio.shield(self._inflight)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            SNAPSHOT_WRITES.labels("error").inc()
+            self.write_errors += 1
+            logger.warning("No se pudo escribir la instantánea del circuito en %s: %s", self.path, e)
+        else:
+            SNAPSHOT_WRITES.labels("success").inc()
+            self.last_written_at = time.time()
+        self._inflight = None
+
+    def request_write(self):
+        """Adelanta la próxima escritura (p. ej. tras una transición del circuito)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._write()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Detiene las escrituras periódicas y guarda una última instantánea"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if self._inflight is not None:
+            # Dos escrituras a la vez compartirían el archivo temporal
+            await asyncio.gather(self._inflight, return_exceptions=True)
+        self._task = None
+        self._wake = None
+        await self._write()
+
+    def stats(self):
+        return {
+            "enabled": self.running,
+            "path": self.path,
+            "interval_s": self.interval,
+            "restored": self.restored,
+            "restored_age_s": round(self.restored_age, 1) if self.restored_age is not None else None,
+            "last_written_at": self.last_written_at,
+            "write_errors": self.write_errors,
+        }
+
+
+# Instancia global de la instantánea del circuito
+breaker_snapshot = BreakerSnapshotter(
+    provider_registry,
+    path=settings.BREAKER_SNAPSHOT_PATH,
+    interval=settings.BREAKER_SNAPSHOT_INTERVAL,
+    max_age=settings.BREAKER_SNAPSHOT_MAX_AGE,
+    window_max_age=settings.BREAKER_SNAPSHOT_WINDOW_MAX_AGE
+)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCoalescer:
+    """
+    Agrupa notificaciones individuales concurrentes en un solo envío por lotes.
+
+    Las notificaciones se acumulan hasta `max_batch_size` elementos o `max_delay`
+    segundos (lo que ocurra primero) y se envían con `flush`, una corrutina que
+    recibe la lista de (mensaje, customer_id) y devuelve, en el mismo orden, el
+    resultado de cada elemento o la excepción con la que falló. Cada llamador
+    recibe solo su resultado.
+    """
+
+    def __init__(self, flush, max_batch_size: int, max_delay: float):
+        self._flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._in_flight = set()
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    async def submit(self, message: str, customer_id: str):
+        """Encola una notificación y espera el resultado de su lote"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((message, customer_id), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_pending)
+
+        return await future
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        self.batches_sent += 1
+        self.items_sent += len(batch)
+        try:
+            results = await self._flush([item for item, _ in batch])
+        except Exception as e:
+            logger.error("❌ Error al enviar lote de %d notificaciones: %s", len(batch), e,
+                         extra={"event": "notification_failed"})
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # El llamador pudo haberse cancelado mientras esperaba
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Envía lo pendiente y espera los lotes en vuelo"""
+        self._flush_pending()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "batches_in_flight": len(self._in_flight),
+            "batches_sent": self.batches_sent,
+            "items_sent": self.items_sent,
+            "avg_batch_size": round(self.items_sent / self.batches_sent, 2) if self.batches_sent else 0.0,
+        }
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import random
+import time
+from ..config import settings
+from ..metrics import Counter, Gauge
+from .providers import Provider, provider_registry
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBES = Counter("provider_health_probes_total", "Chequeos de salud activos por resultado", ["provider", "outcome"])
+PROVIDER_HEALTHY = Gauge("provider_healthy", "1 si el último chequeo de salud del proveedor fue exitoso", ["provider"])
+
+
+class ProviderHealth:
+    """Resultado más reciente de los chequeos de salud de un proveedor"""
+
+    __slots__ = ("healthy", "latency", "checked_at", "checked_at_wall", "error",
+                 "consecutive_successes", "consecutive_failures")
+
+    def __init__(self):
+        self.healthy = None
+        self.latency = None
+        self.checked_at = None
+        self.checked_at_wall = None
+        self.error = None
+        self.consecutive_successes = 0
+        self.consecutive_failures = 0
+
+    def record(self, healthy: bool, latency: float, error: str = None):
+        self.healthy = healthy
+        self.latency = latency
+        self.checked_at = time.monotonic()
+        self.checked_at_wall = time.time()
+        self.error = error
+        if healthy:
+            self.consecutive_successes += 1
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            self.consecutive_successes = 0
+
+    def age(self):
+        return None if self.checked_at is None else time.monotonic() - self.checked_at
+
+    def to_dict(self):
+        age = self.age()
+        return {
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "checked_at": self.checked_at_wall,
+            "age_s": round(age, 3) if age is not None else None,
+            "consecutive_successes": self.consecutive_successes,
+            "consecutive_failures": self.consecutive_failures,
+            "error": self.error,
+        }
+
+
+class HealthProber:
+    """
+    Chequea el /health de cada proveedor en segundo plano cada `interval` segundos
+    (± `jitter` para que los procesos no se sincronicen) y guarda el resultado, de
+    modo que /health y los endpoints de administración responden sin hacer I/O.
+
+    Con `feed_breaker`, tras `recovery_threshold` chequeos sanos seguidos un
+    circuito abierto pasa a semi-abierto sin esperar a reset_timeout, y cada
+    chequeo fallido mantiene abierto el circuito: las notificaciones reales no se
+    usan para descubrir que el proveedor sigue caído.
+    """
+
+    def __init__(self, registry, interval: float, timeout: float, jitter: float = 0.2, max_age: float = 15.0,
+                 feed_breaker: bool = False, recovery_threshold: int = 2):
+        self._registry = registry
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.max_age = max_age
+        self.feed_breaker = feed_breaker
+        self.recovery_threshold = recovery_threshold
+        self._health = {provider.key: ProviderHealth() for provider in registry}
+        self._tasks = []
+        for provider in registry:
+            PROVIDER_HEALTHY.labels(provider.name).set_function(
+                lambda key=provider.key: int(bool(self._health[key].healthy))
+            )
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._run(provider)) for provider in self._registry]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, provider: Provider):
+        while True:
+            await self.probe(provider)
+            await asyncio.sleep(self.interval * random.uniform(1.0 - self.jitter, 1.0 + self.jitter))
+
+    async def probe(self, provider: Provider) -> bool:
+        """Chequea `provider` ahora, guarda el resultado y lo aplica a su circuito"""
+        start = time.monotonic()
+        error = None
+        try:
+            client = await provider.get_client()
+            response = await asyncio.wait_for(
+                client.get(provider.health_url, timeout=self.timeout), self.timeout
+            )
+            healthy = response.status_code == 200
+            if not healthy:
+                error = f"HTTP {response.status_code}"
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            healthy, error = False, f"Sin respuesta en {self.timeout:.3f}s"
+        except Exception as e:
+            healthy, error = False, str(e) or type(e).__name__
+
+        health = self._health[provider.key]
+        was_healthy = health.healthy
+        health.record(healthy, time.monotonic() - start, error)
+        HEALTH_PROBES.labels(provider.name, "healthy" if healthy else "unhealthy").inc()
+        if was_healthy is not None and was_healthy != healthy:
+            logger.info("🩺 %s %s a los chequeos de salud", provider.name, "responde" if healthy else "dejó de responder")
+
+        if self.feed_breaker:
+            self._feed_breaker(provider, health)
+        return healthy
+
+    def _feed_breaker(self, provider: Provider, health: ProviderHealth):
+        breaker = provider.breaker
+        if health.healthy:
+            if health.consecutive_successes >= self.recovery_threshold and breaker.half_open_early():
+                logger.info("🩺 %s sano en %s chequeos, probando su circuito", provider.name, health.consecutive_successes)
+        else:
+            breaker.hold_open()
+
+    def cached(self, provider: Provider):
+        """Resultado del último chequeo si es reciente; None si no hay o está vencido"""
+        health = self._health[provider.key]
+        age = health.age()
+        if age is None or age > self.max_age:
+            return None
+        return health.healthy
+
+    async def is_healthy(self, provider: Provider) -> bool:
+        """Resultado en caché si es reciente; si no, chequea ahora"""
+        cached = self.cached(provider)
+        if cached is not None:
+            return cached
+        return await self.probe(provider)
+
+    def snapshot(self):
+        return {
+            "enabled": self.running,
+            "interval_s": self.interval,
+            "feeds_breaker": self.feed_breaker,
+            "providers": {key: health.to_dict() for key, health in self._health.items()},
+        }
+
+
+# Instancia global del chequeo de salud de los proveedores
+health_prober = HealthProber(
+    provider_registry,
+    interval=settings.RECOVERY_TIMEOUT,
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+    jitter=settings.HEALTH_PROBE_JITTER,
+    max_age=settings.HEALTH_PROBE_MAX_AGE,
+    feed_breaker=settings.HEALTH_PROBE_FEEDS_BREAKER,
+    recovery_threshold=settings.HEALTH_PROBE_RECOVERY_THRESHOLD
+)
@@ -1,142 +1,656 @@
 import httpx
 import logging
-import pybreaker
 import asyncio
+import math
 import time
-import random
 from ..config import settings
-from ..circuit_breaker import aldeamo_breaker
+from ..circuit_breaker import CircuitBreakerError, STATE_CLOSED, describe_state
+from ..concurrency import BulkheadFullError
+from ..deadline import DEADLINE_HEADER, DEADLINE_EXPIRED, DEADLINE_SKIPPED, DeadlineExceededError
+from ..events import event_bus
+from ..budget import TokenBudget
+from ..metrics import Counter, Gauge
+from ..retry import ProviderError
+from ..routing import WeightedRouter
+from ..serialization import JSON_HEADERS, dumps, loads
+from ..timing import current_timings, phase
+from .coalescer import NotificationCoalescer
+from .providers import PROVIDER_SCORE, Provider, ProviderMetrics, provider_registry
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FALLBACKS = Counter("notification_fallbacks_total", "Notificaciones desviadas al siguiente proveedor", ["reason"])
+FALLBACK_CIRCUIT_OPEN = FALLBACKS.labels("circuit_open")
+FALLBACK_ERROR = FALLBACKS.labels("error")
+FALLBACK_BULKHEAD = FALLBACKS.labels("bulkhead")
+FALLBACK_DEADLINE = FALLBACKS.labels("deadline")
+
+
+class ProviderResponse:
+    """
+    Resultado de /notify en el camino rápido: el cuerpo solo se decodifica si se
+    lee un campo distinto de `provider` (p. ej. el message_id que guarda el outbox)
+    """
+
+    __slots__ = ("provider", "_response", "_body")
+
+    def __init__(self, provider: str, response: httpx.Response):
+        self.provider = provider
+        self._response = response
+        self._body = None
+
+    def _fields(self):
+        if self._body is None:
+            self._body = loads(self._response.content)
+        return self._body
+
+    def get(self, key, default=None):
+        if key == "provider":
+            return self.provider
+        return self._fields().get(key, default)
+
+    def __getitem__(self, key):
+        if key == "provider":
+            return self.provider
+        return self._fields()[key]
+
 
 class NotificationService:
-    def __init__(self):
-        self.aldeamo_url = "http://aldeamo-service:8001/notify"
-        self.twilio_url = "http://twilio-service:8002/notify"
-        self.current_service = "Aldeamo"  # Servicio predeterminado
-        self.recovery_check_interval = 5  # Verificar cada 5 segundos si Aldeamo se recuperó
-        self.last_check_time = 0
-
-    @aldeamo_breaker
-    async def notify_with_aldeamo(self, message: str, customer_id: str):
-        """Enviar notificación utilizando Aldeamo con Circuit Breaker"""
-        logger.info(f"Intentando notificar con Aldeamo: {message}")
-
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.post(
-                self.aldeamo_url,
-                json={"message": message, "customer_id": customer_id}
+    def __init__(self, registry=provider_registry):
+        self.providers = registry
+        self.current_service = registry.primary.name  # Servicio predeterminado
+
+        # Orden de los proveedores: fijo ("priority") o por puntuación ("weighted")
+        self.router = WeightedRouter(default_latency=settings.ROUTING_DEFAULT_LATENCY)
+        for provider in registry:
+            PROVIDER_SCORE.labels(provider.name).set_function(
+                lambda provider=provider: self.router.score(provider)
             )
 
-            if response.status_code != 200:
-                logger.error(f"Error en respuesta de Aldeamo: {response.status_code}")
-                raise Exception(f"Error en Aldeamo: {response.text}")
+        # Hedging: el segundo proveedor en paralelo si el primero tarda más que su percentil de latencia
+        self.hedge_budget = TokenBudget(settings.HEDGE_BUDGET_RATIO, settings.HEDGE_BUDGET_BURST)
+        self.hedge_stats = {
+            "requests": 0,
+            "hedges_fired": 0,
+            "budget_exhausted": 0,
+            "won_by_primary": 0,
+            "won_by_hedge": 0,
+        }
 
-            logger.info("✅ Notificación enviada con éxito a través de Aldeamo")
-            self.current_service = "Aldeamo"
-            return response.json()
+        # Micro-batching: agrupa notificaciones concurrentes en una sola llamada por lotes
+        self.coalescer = NotificationCoalescer(
+            self.send_batch,
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            max_delay=settings.COALESCE_MAX_DELAY
+        )
 
-    async def notify_with_twilio(self, message: str, customer_id: str):
-        """Enviar notificación utilizando Twilio como respaldo"""
-        logger.info(f"Intentando notificar con Twilio: {message}")
+    async def startup(self):
+        """Crear los pools de conexiones de los proveedores"""
+        await self.providers.startup()
 
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.post(
-                self.twilio_url,
-                json={"message": message, "customer_id": customer_id}
+    async def shutdown(self):
+        """Cerrar los pools de conexiones de los proveedores"""
+        await self.coalescer.close()
+        await self.providers.shutdown()
+
+    def get_provider(self, name: str = None) -> Provider:
+        """Proveedor por nombre (el principal si no se indica); KeyError si no existe"""
+        return self.providers.primary if name is None else self.providers.get(name)
+
+    def _route(self):
+        """Proveedores en el orden en que se intentarán para la próxima notificación"""
+        if settings.NOTIFICATION_ROUTING == "weighted":
+            return self.router.order(self.providers)
+        return list(self.providers)
+
+    @staticmethod
+    def _request_timeout(provider: Provider, deadline=None) -> httpx.Timeout:
+        """
+        Timeout de una llamada: el adaptativo para lectura y espera de conexión del
+        pool, sin pasar del presupuesto que queda hasta el `deadline`. Las pruebas del
+        circuito semi-abierto usan HTTP_TIMEOUT: si el adaptativo se quedó corto
+        porque el proveedor se volvió más lento, lo cortaría y no volvería a cerrarse.
+        """
+        adaptive = settings.ADAPTIVE_TIMEOUTS_ENABLED and provider.breaker.current_state == STATE_CLOSED
+        read = provider.timeout.value() if adaptive else settings.HTTP_TIMEOUT
+        if deadline is not None:
+            read = max(0.001, min(read, deadline.remaining()))
+        elif not settings.ADAPTIVE_TIMEOUTS_ENABLED:
+            return httpx.Timeout(read)
+        return httpx.Timeout(read, connect=min(settings.CONNECT_TIMEOUT, read))
+
+    @staticmethod
+    def _expected_latency(provider: Provider) -> float:
+        """Latencia con la que se cuenta para decidir si un intento cabe en el deadline"""
+        if provider.latency.count < settings.DEADLINE_MIN_SAMPLES:
+            return 0.0
+        return provider.latency.quantile(settings.DEADLINE_LATENCY_PERCENTILE)
+
+    def _check_deadline(self, provider: Provider, deadline):
+        """DeadlineExceededError si el presupuesto restante no cubre la latencia esperada de `provider`"""
+        if deadline is None:
+            return
+        remaining = deadline.remaining()
+        if remaining <= 0 or remaining < self._expected_latency(provider):
+            DEADLINE_SKIPPED.inc()
+            raise DeadlineExceededError(
+                f"Quedan {max(0.0, remaining) * 1000:.0f} ms, insuficientes para {provider.name}"
+            )
+
+    async def _call_limited(self, provider: Provider, func, *args, sample: bool = True):
+        """
+        Ejecuta `func` dentro del límite de concurrencia del proveedor. Solo las
+        llamadas exitosas individuales (`sample`) alimentan el gradiente de latencia;
+        los rechazos del circuito y los errores rápidos no dicen nada sobre colas.
+        """
+        if not settings.BULKHEAD_ENABLED:
+            return await func(*args)
+
+        limiter = provider.limiter
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            result = await func(*args)
+        except httpx.TimeoutException:
+            limiter.release(dropped=True)
+            raise
+        except BaseException:
+            limiter.release()
+            raise
+        limiter.release(time.monotonic() - start if sample else None)
+        return result
+
+    async def _send(self, provider: Provider, message: str, customer_id: str, deadline=None):
+        """
+        Una notificación por `provider`: límite de concurrencia y circuit breaker. Cada
+        intento (también los reintentos) se salta si ya no cabe en el `deadline`.
+        """
+        self._check_deadline(provider, deadline)
+        attempt = self._call_limited(
+            provider, provider.breaker.call, self.notify_with, provider, message, customer_id, deadline
+        )
+        timings = current_timings()
+        if timings is None:
+            return await attempt
+
+        # Fase `breaker`: lo que dura el intento fuera de la llamada HTTP al proveedor
+        start = time.perf_counter()
+        http_before = timings.get(provider.key)
+        try:
+            return await attempt
+        finally:
+            timings.add("breaker", time.perf_counter() - start - (timings.get(provider.key) - http_before))
+
+    async def notify_with(self, provider: Provider, message: str, customer_id: str, deadline=None):
+        """Enviar notificación utilizando `provider` (sin pasar por su Circuit Breaker)"""
+        logger.debug("Intentando notificar con %s", provider.name)
+
+        client = await provider.get_client()
+        with phase(provider.key):
+            response = await self._post(
+                client, provider.notify_url, {"message": message, "customer_id": customer_id},
+                provider.metrics, provider.latency, self._request_timeout(provider, deadline), provider.routing,
+                deadline
             )
 
-            if response.status_code != 200:
-                raise Exception(f"Error en Twilio: {response.text}")
+        if response.status_code != 200:
+            if response.status_code == 504 and deadline is not None and deadline.expired():
+                # El proveedor abandonó el trabajo porque venció el deadline que le enviamos
+                DEADLINE_EXPIRED.inc()
+                raise DeadlineExceededError(f"{provider.name} abandonó la notificación al vencer el deadline")
+            logger.error("Error en respuesta de %s: %d", provider.name, response.status_code,
+                         extra={"event": "notification_failed", "provider": provider.name})
+            raise ProviderError(f"Error en {provider.name}: {response.text}", response.status_code)
 
-            logger.info("✅ Notificación enviada con éxito a través de Twilio")
-            self.current_service = "Twilio"
-            return response.json()
+        logger.info("✅ Notificación enviada con éxito a través de %s", provider.name,
+                    extra={"event": "notification_sent", "provider": provider.name})
+        self.current_service = provider.name
+        if settings.FAST_PATH_ENABLED:
+            return ProviderResponse(provider.name, response)
+        return response.json()
 
-    async def check_aldeamo_health(self):
-        """Verificar si Aldeamo está funcionando"""
+    @staticmethod
+    async def _post(client: httpx.AsyncClient, url: str, payload, metrics: ProviderMetrics, tracker=None,
+                    timeout=httpx.USE_CLIENT_DEFAULT, routing=None, deadline=None):
+        """
+        POST a un proveedor registrando latencia, resultado y llamadas en curso. El
+        LatencyTracker (usado por el hedging y los timeouts adaptativos) solo recibe la
+        latencia de las respuestas 200; los timeouts, los cortes por deadline y las
+        llamadas canceladas (p. ej. los hedges perdedores) se cuentan como censurados,
+        porque su duración es la del corte y no la del proveedor.
+        Las estadísticas de enrutamiento (`routing`) reciben todas las llamadas
+        completadas, marcando como fallo los errores, los timeouts y los códigos no 200.
+
+        Con `deadline` el proveedor recibe el presupuesto restante en X-Deadline-Ms, y
+        si es el deadline (y no el timeout del proveedor) lo que corta la llamada se
+        lanza DeadlineExceededError, que se registra como una cancelación.
+        """
+        if settings.FAST_PATH_ENABLED:
+            body = {"content": dumps(payload), "headers": JSON_HEADERS}
+        else:
+            body = {"json": payload}
+        bounded_by_deadline = False
+        if deadline is not None:
+            body["headers"] = {**body.get("headers", {}), DEADLINE_HEADER: deadline.header()}
+            bounded_by_deadline = isinstance(timeout, httpx.Timeout) and deadline.remaining() <= timeout.read
+        metrics.in_flight.value += 1
+        start = time.monotonic()
         try:
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get("http://aldeamo-service:8001/health")
-                return response.status_code == 200
+            if isinstance(timeout, httpx.Timeout):
+                # El timeout de lectura de httpx es por operación de lectura; wait_for acota
+                # la llamada completa (también una respuesta que llega gota a gota)
+                try:
+                    response = await asyncio.wait_for(client.post(url, timeout=timeout, **body), timeout.read)
+                except asyncio.TimeoutError:
+                    raise httpx.ReadTimeout(f"Sin respuesta de {url} en {timeout.read:.3f}s")
+            else:
+                response = await client.post(url, **body)
+        except asyncio.CancelledError:
+            # Llamada cancelada (p. ej. perdió un hedge): solo una cota inferior de la latencia
+            if tracker is not None:
+                tracker.observe_censored()
+            metrics.cancelled.value += 1
+            raise
+        except httpx.TimeoutException:
+            elapsed = time.monotonic() - start
+            if bounded_by_deadline:
+                # Venció el deadline del cliente, no el timeout del proveedor: como una cancelación
+                if tracker is not None:
+                    tracker.observe_censored()
+                metrics.cancelled.value += 1
+                DEADLINE_EXPIRED.inc()
+                raise DeadlineExceededError(f"Venció el deadline esperando a {url}") from None
+            # El timeout cuenta como fallo en el circuit breaker (la excepción se propaga)
+            if tracker is not None:
+                tracker.observe_censored()
+            if routing is not None:
+                routing.observe(elapsed, True)
+            metrics.timeout.value += 1
+            raise
         except Exception:
-            return False
+            if routing is not None:
+                routing.observe(time.monotonic() - start, True)
+            metrics.error.value += 1
+            raise
+        finally:
+            metrics.in_flight.value -= 1
+
+        elapsed = time.monotonic() - start
+        metrics.latency.observe(elapsed)
+        if response.status_code == 200:
+            metrics.success.value += 1
+            if tracker is not None:
+                tracker.observe(elapsed)
+        else:
+            metrics.error.value += 1
+        if routing is not None:
+            routing.observe(elapsed, response.status_code != 200)
+        return response
+
+    @staticmethod
+    def _parse_batch_response(provider: str, response, size: int):
+        """
+        Convierte la respuesta de /notify/batch en una lista con el resultado de cada
+        elemento o la excepción con la que falló, más el número de elementos fallidos.
+        """
+        if response.status_code != 200:
+            raise ProviderError(f"Error en {provider}: {response.text}", response.status_code)
+
+        results = []
+        failed = 0
+        for item in loads(response.content)["results"]:
+            if item["status"] == "delivered":
+                results.append({
+                    "provider": provider,
+                    "status": item["status"],
+                    "message_id": item["message_id"]
+                })
+            else:
+                failed += 1
+                results.append(Exception(f"Error en {provider}: {item.get('error')}"))
+
+        if len(results) != size:
+            raise Exception(f"Error en {provider}: se esperaban {size} resultados y llegaron {len(results)}")
+        return results, failed
+
+    async def notify_batch_with(self, provider: Provider, items, deadline=None):
+        """Enviar un lote de (mensaje, customer_id) a `provider`; devuelve (resultados, fallidos)"""
+        logger.debug("Intentando notificar un lote de %d con %s", len(items), provider.name)
+
+        client = await provider.get_client()
+        timeout = httpx.USE_CLIENT_DEFAULT
+        if deadline is not None:
+            timeout = httpx.Timeout(max(0.001, min(settings.HTTP_TIMEOUT, deadline.remaining())))
+        with phase(provider.key):
+            response = await self._post(
+                client, provider.batch_url,
+                {"notifications": [{"message": m, "customer_id": c} for m, c in items]},
+                provider.batch_metrics, timeout=timeout, deadline=deadline
+            )
+        return self._parse_batch_response(provider.name, response, len(items))
 
-    async def send_notification(self, message: str, customer_id: str):
+    async def send_batch(self, items, deadline=None):
         """
-        Intenta enviar notificación a través de Aldeamo,
-        si falla o el circuito está abierto, utiliza Twilio como respaldo
+        Envía un lote de (mensaje, customer_id) por el primer proveedor y reintenta con
+        el siguiente solo los elementos que fallaron (o todo el lote si la llamada falló
+        por completo o el circuito está abierto). Devuelve, en orden, el resultado de
+        cada elemento o la excepción con la que falló.
         """
-        current_time = time.time()
-        circuit_state = aldeamo_breaker.current_state
+        results = []
+        for offset in range(0, len(items), settings.BATCH_MAX_SIZE):
+            results.extend(await self._send_batch_chunk(items[offset:offset + settings.BATCH_MAX_SIZE], deadline))
+        return results
+
+    async def _send_batch_chunk(self, items, deadline=None):
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+        order = self._route()
+
+        for index, provider in enumerate(order):
+            chunk = [items[i] for i in pending]
+            has_next = index + 1 < len(order)
+            try:
+                self._check_deadline(provider, deadline)
+                chunk_results = await provider.retry.call(
+                    self._call_limited, provider, provider.breaker.call_batch, self.notify_batch_with, len(chunk),
+                    provider, chunk, deadline, sample=False
+                )
+            except Exception as e:
+                self._log_fallback(provider, e, len(chunk) if has_next else 0, "el lote")
+                chunk_results = [e] * len(chunk)
+            else:
+                if has_next:
+                    FALLBACK_ERROR.value += sum(1 for result in chunk_results if isinstance(result, Exception))
+
+            still_pending = []
+            for i, result in zip(pending, chunk_results):
+                results[i] = result
+                if isinstance(result, Exception):
+                    still_pending.append(i)
+            if len(still_pending) < len(pending):
+                self.current_service = provider.name
+            pending = still_pending
+            if not pending:
+                break
+        return results
+
+    @staticmethod
+    def _log_fallback(provider: Provider, error: Exception, count: int = 1, what: str = "la notificación"):
+        """Registra por qué se abandona `provider`; `count` elementos pasan al siguiente proveedor"""
+        if isinstance(error, DeadlineExceededError):
+            # El presupuesto del cliente no alcanza para este proveedor: el siguiente puede ser más rápido
+            logger.warning("⏱️ %s, enviando %s por el siguiente proveedor", error, what,
+                           extra={"event": "fallback", "provider": provider.name, "reason": "deadline"})
+            FALLBACK_DEADLINE.value += count
+        elif isinstance(error, BulkheadFullError):
+            # El proveedor ya tiene tantas llamadas en curso como admite: siguiente sin esperar
+            logger.warning("🔄 %s, enviando %s por el siguiente proveedor", error, what,
+                           extra={"event": "fallback", "provider": provider.name, "reason": "bulkhead"})
+            FALLBACK_BULKHEAD.value += count
+        elif isinstance(error, CircuitBreakerError):
+            # Circuito abierto o semi-abierto sin permisos: siguiente sin esperar
+            logger.warning("🔄 %s, enviando %s por el siguiente proveedor", error, what,
+                           extra={"event": "fallback", "provider": provider.name, "reason": "circuit_open"})
+            FALLBACK_CIRCUIT_OPEN.value += count
+        else:
+            logger.error("❌ Error al notificar %s con %s: %s", what, provider.name, error,
+                         extra={"event": "fallback", "provider": provider.name, "reason": "error"})
+            FALLBACK_ERROR.value += count
 
-        # Si el circuito está en estado 'half-open', vamos a intentar con Aldeamo
-        # para ver si se ha recuperado
-        if circuit_state == 'half-open':
-            logger.info("🔄 Circuito en estado semi-abierto, probando si Aldeamo se ha recuperado...")
+    async def send_notification(self, message: str, customer_id: str, deadline=None):
+        """
+        Intenta enviar la notificación por los proveedores en el orden del router; si
+        uno falla, su circuito está abierto, no tiene hueco o no cabe en el `deadline`
+        (ver deadline.py), pasa al siguiente
+        """
+        if not event_bus.sample_delivery():
+            return await self._dispatch(message, customer_id, deadline)
 
+        # Entrega muestreada: se publica su resultado en el flujo de eventos
+        start = time.monotonic()
         try:
-            # Intentar con Aldeamo (protegido por el Circuit Breaker)
-            # Si el circuito está cerrado o semi-abierto, intentará con Aldeamo
-            # Si está abierto, lanzará CircuitBreakerError
-            result = await self.notify_with_aldeamo(message, customer_id)
-            
-            # Si llegamos aquí, la notificación con Aldeamo fue exitosa
-            if circuit_state == 'half-open':
-                logger.info("✅ Aldeamo se ha recuperado! Circuito cerrado nuevamente.")
-            
-            return result
-            
-        except pybreaker.CircuitBreakerError:
-            # Circuit Breaker está abierto, usar Twilio como respaldo
-            logger.warning("🔄 Circuit Breaker abierto para Aldeamo, usando Twilio como respaldo")
-            return await self.notify_with_twilio(message, customer_id)
-            
+            result = await self._dispatch(message, customer_id, deadline)
         except Exception as e:
-            # Error al intentar con Aldeamo, pero el circuito aún no está abierto
-            # Esto incrementa el contador de fallos en el CircuitBreaker
-            logger.error(f"❌ Error al notificar con Aldeamo: {str(e)}")
-            
-            # Intentar con Twilio como fallback
-            return await self.notify_with_twilio(message, customer_id)
-
-    async def try_aldeamo_directly(self, message: str, customer_id: str):
-        """Intenta enviar una notificación directamente a Aldeamo, sin pasar por el circuit breaker"""
+            event_bus.publish("delivery", {
+                "customer_id": customer_id, "status": "failed", "error": str(e) or type(e).__name__,
+                "latency_ms": round((time.monotonic() - start) * 1000, 1), "ts": time.time(),
+            })
+            raise
+        event_bus.publish("delivery", {
+            "customer_id": customer_id, "status": "sent", "provider": result.get("provider"),
+            "latency_ms": round((time.monotonic() - start) * 1000, 1), "ts": time.time(),
+        })
+        return result
+
+    async def _dispatch(self, message: str, customer_id: str, deadline=None):
+        if settings.COALESCING_ENABLED:
+            if deadline is None:
+                return await self.coalescer.submit(message, customer_id)
+            # El lote es compartido: solo se deja de esperar su resultado
+            try:
+                return await asyncio.wait_for(self.coalescer.submit(message, customer_id), max(0.0, deadline.remaining()))
+            except asyncio.TimeoutError:
+                DEADLINE_EXPIRED.inc()
+                raise DeadlineExceededError("Venció el deadline esperando al lote de notificaciones") from None
+
+        order = self._route()
+
+        if settings.HEDGING_ENABLED and len(order) > 1 and order[0].breaker.current_state == STATE_CLOSED:
+            return await self._send_hedged(order, message, customer_id, deadline)
+
+        return await self._send_in_order(order, message, customer_id, deadline)
+
+    async def _send_in_order(self, order, message: str, customer_id: str, deadline=None):
+        """Prueba los proveedores de `order` uno tras otro; propaga el error del último"""
+        for index, provider in enumerate(order):
+            try:
+                return await provider.retry.call(self._send, provider, message, customer_id, deadline)
+            except Exception as e:
+                if index + 1 == len(order):
+                    raise
+                self._log_fallback(provider, e)
+
+    def _hedge_delay(self, provider: Provider):
+        """Tiempo que se espera a `provider` antes de lanzar el siguiente en paralelo"""
+        if provider.latency.count < settings.HEDGE_MIN_SAMPLES:
+            return settings.HEDGE_DEFAULT_DELAY
+        return max(settings.HEDGE_MIN_DELAY, provider.latency.quantile(settings.HEDGE_LATENCY_PERCENTILE))
+
+    async def _send_hedged(self, order, message: str, customer_id: str, deadline=None):
+        """
+        Envía por el primer proveedor y, si no responde dentro de su percentil de
+        latencia y el presupuesto de hedging lo permite, lanza el segundo en paralelo.
+        Gana la primera respuesta exitosa y la otra solicitud se cancela; si el primario
+        perdedor ya superaba BREAKER_SLOW_CALL_DURATION, su circuit breaker lo registra
+        como llamada lenta al cancelarlo.
+        """
+        self.hedge_stats["requests"] += 1
+        self.hedge_budget.deposit()
+
+        first, second = order[0], order[1]
+        primary = asyncio.ensure_future(self._send(first, message, customer_id, deadline))
+        tasks = [primary]
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post(
-                    self.aldeamo_url,
-                    json={"message": message, "customer_id": customer_id}
-                )
-                return response.status_code == 200
+            done, _ = await asyncio.wait((primary,), timeout=self._hedge_delay(first))
+
+            if not done and not self.hedge_budget.try_spend():
+                self.hedge_stats["budget_exhausted"] += 1
+                await asyncio.wait((primary,))
+                done = (primary,)
+
+            if done:
+                try:
+                    return primary.result()
+                except Exception as e:
+                    self._log_fallback(first, e)
+                return await self._send_in_order(order[1:], message, customer_id, deadline)
+
+            logger.info("⏱️ %s excede su presupuesto de latencia, lanzando %s en paralelo", first.name, second.name,
+                        extra={"event": "hedge_fired", "provider": first.name})
+            self.hedge_stats["hedges_fired"] += 1
+            hedge = asyncio.ensure_future(self._send(second, message, customer_id, deadline))
+            tasks.append(hedge)
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "won_by_primary" if task is primary else "won_by_hedge"
+                        self.hedge_stats[winner] += 1
+                        return task.result()
+        finally:
+            # Pierda el hedge o se cancele quien llama (desconexión, deadline), no quedan
+            # llamadas a los proveedores sin nadie que las espere
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        # Ambos fallaron: se sigue con el resto de proveedores o se propaga el error del hedge
+        if len(order) > 2:
+            self._log_fallback(second, hedge.exception())
+            return await self._send_in_order(order[2:], message, customer_id, deadline)
+        return hedge.result()
+
+    def get_batching_stats(self):
+        """Estado del agrupador de notificaciones"""
+        return {
+            "enabled": settings.COALESCING_ENABLED,
+            "max_batch_size": settings.BATCH_MAX_SIZE,
+            "max_delay_ms": settings.COALESCE_MAX_DELAY * 1000,
+            **self.coalescer.stats(),
+        }
+
+    def get_hedging_stats(self):
+        """Contadores de hedging y latencias usadas para decidir cuándo lanzarlo"""
+        return {
+            "enabled": settings.HEDGING_ENABLED,
+            "hedge_delay_ms": round(self._hedge_delay(self.providers.primary) * 1000, 1),
+            "budget_tokens": round(self.hedge_budget.tokens, 2),
+            **self.hedge_stats,
+            **{f"{provider.key}_latency": provider.latency.stats() for provider in self.providers},
+        }
+
+    async def try_provider_directly(self, provider: Provider, message: str, customer_id: str):
+        """Intenta enviar una notificación directamente a `provider`, sin pasar por su circuit breaker"""
+        try:
+            client = await provider.get_client()
+            response = await client.post(
+                provider.notify_url,
+                json={"message": message, "customer_id": customer_id}
+            )
+            return response.status_code == 200
         except Exception:
             return False
 
+    def get_bulkhead_stats(self):
+        """Límite de concurrencia vigente y rechazos de cada proveedor"""
+        return {
+            "enabled": settings.BULKHEAD_ENABLED,
+            **{provider.key: provider.limiter.stats() for provider in self.providers},
+        }
+
+    def get_retry_stats(self):
+        """Reintentos y presupuesto de cada proveedor"""
+        return {provider.key: provider.retry.stats() for provider in self.providers}
+
+    def get_timeout_stats(self):
+        """Timeouts de lectura vigentes por proveedor"""
+        stats = {"adaptive": settings.ADAPTIVE_TIMEOUTS_ENABLED}
+        for provider in self.providers:
+            stats[f"{provider.key}_timeout_ms"] = round(self._request_timeout(provider).read * 1000, 1)
+            stats[f"{provider.key}_timeouts"] = provider.metrics.timeout.value
+            stats[f"{provider.key}_widened"] = provider.timeout.widened
+        return stats
+
+    def get_routing_stats(self):
+        """Orden de enrutamiento y puntuación de cada proveedor"""
+        now = time.monotonic()
+        return {
+            "mode": settings.NOTIFICATION_ROUTING,
+            "providers": {
+                provider.key: {
+                    "url": provider.url,
+                    "cost_weight": provider.cost_weight,
+                    "circuit_state": provider.breaker.current_state,
+                    "in_flight": provider.in_flight,
+                    "ewma_latency_ms": round(provider.routing.latency * 1000, 1)
+                    if provider.routing.latency is not None else None,
+                    "error_rate": round(provider.routing.error_rate(now), 3),
+                    "score": round(self.router.score(provider, now), 6),
+                }
+                for provider in self.providers
+            },
+        }
+
+    def get_provider_stats(self):
+        """Estado y estadísticas recientes de cada proveedor (eventos provider_stats)"""
+        now = time.monotonic()
+        stats = {}
+        for provider in self.providers:
+            breaker = provider.breaker
+            calls, failures, slow_calls = breaker.window_totals()
+            metrics = provider.metrics
+            stats[provider.key] = {
+                "state": breaker.current_state,
+                "remaining_open_time": round(breaker.remaining_open_time(), 3),
+                "window_calls": calls,
+                "window_failures": failures,
+                "window_slow_calls": slow_calls,
+                "in_flight": provider.in_flight,
+                "concurrency_limit": int(provider.limiter.limit),
+                "timeout_ms": round(self._request_timeout(provider).read * 1000, 1),
+                "latency": provider.latency.stats(),
+                "error_rate": round(provider.routing.error_rate(now), 3),
+                "score": round(self.router.score(provider, now), 6),
+                "requests": {
+                    "success": metrics.success.value,
+                    "error": metrics.error.value,
+                    "timeout": metrics.timeout.value,
+                    "cancelled": metrics.cancelled.value,
+                },
+            }
+        return {"ts": time.time(), "current_service": self.current_service, "providers": stats}
+
     def get_current_service(self):
         """Obtener el servicio de notificación actual"""
         return self.current_service
 
-    def get_circuit_state(self):
-        """Obtener el estado actual del Circuit Breaker"""
-        state = str(aldeamo_breaker.current_state)
-        state_map = {
-            'closed': 'CERRADO (usando Aldeamo)',
-            'open': 'ABIERTO (usando Twilio)',
-            'half-open': 'SEMI-ABIERTO (probando Aldeamo)'
-        }
+    def get_circuit_state(self, provider: Provider = None):
+        """Obtener el estado actual del Circuit Breaker de un proveedor (el principal por defecto)"""
+        provider = provider or self.providers.primary
+        breaker = provider.breaker
+        state = breaker.current_state
+        calls, failures, slow_calls = breaker.window_totals()
 
         return {
+            "provider": provider.name,
             "state": state,
-            "description": state_map.get(state, state),
-            "failures": aldeamo_breaker.current_failures,
-            "threshold": 3,  # Matches the setting in circuit_breaker.py
+            "description": describe_state(state, provider.name),
+            "failures": breaker.current_failures,
+            "window_calls": calls,
+            "window_failures": failures,
+            "window_slow_calls": slow_calls,
+            "minimum_calls": breaker.minimum_calls,
+            "failure_rate_threshold": breaker.failure_rate_threshold,
+            "slow_call_rate_threshold": breaker.slow_call_rate_threshold,
+            "half_open_max_calls": breaker.half_open_max_calls,
+            "half_open_success_threshold": breaker.half_open_success_threshold,
             "current_service": self.current_service,
-            "reset_timeout": 15  # Matches the reset_timeout in circuit_breaker.py
+            "reset_timeout": breaker.reset_timeout,
+            "forced_open": breaker.forced_open,
+            "remaining_open_time": round(breaker.remaining_open_time(), 3)
         }
 
+    def retry_after(self) -> int:
+        """Segundos hasta que algún circuito abierto pase a semi-abierto (mínimo 1)"""
+        remaining = [provider.breaker.remaining_open_time() for provider in self.providers]
+        remaining = [seconds for seconds in remaining if seconds > 0]
+        return max(1, math.ceil(min(remaining))) if remaining else 1
+
 
 # Instancia global del servicio de notificación
-notification_service = NotificationService()
\ No newline at end of file
+notification_service = NotificationService()
+Gauge("notification_coalescer_pending", "Notificaciones esperando a formar un lote").set_function(
+    lambda: notification_service.coalescer.stats()["pending"]
+)
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from ..config import settings
+from ..metrics import Gauge
+from .notification_service import notification_service
+from .outbox_store import SQLiteOutboxStore
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxFullError(Exception):
+    """La cola de notificaciones está llena y no se liberó espacio a tiempo"""
+
+
+class NotificationOutbox:
+    """
+    Cola acotada de notificaciones pendientes drenada por un pool de workers.
+
+    Permite confirmar el pago sin esperar al proveedor de SMS: el pago encola la
+    notificación y los workers la envían a través de `send` (que aplica el circuit
+    breaker y el respaldo a Twilio). El resultado de cada entrega se guarda por
+    payment_id en una tabla acotada (se descartan los más antiguos).
+
+    Con un `store` durable, cada notificación se persiste antes de confirmar el
+    pago. Un barrido periódico reencola lo que quedó sin entregar (tras un
+    reinicio) y los reintentos de las notificaciones que ambos proveedores
+    rechazaron, con espera exponencial hasta `max_attempts`, y compacta el
+    almacén eliminando las ya entregadas.
+    """
+
+    def __init__(self, send, max_size: int, workers: int, status_capacity: int, store=None,
+                 max_attempts: int = 5, retry_backoff: float = 2.0, sweep_interval: float = 5.0,
+                 compact_interval: float = 60.0):
+        self._send = send
+        self.max_size = max_size
+        self.worker_count = workers
+        self.status_capacity = status_capacity
+        self._store = store
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.sweep_interval = sweep_interval
+        self.compact_interval = compact_interval
+        self._queue = None
+        self._workers = []
+        self._sweeper = None
+        self._tracked = set()  # ids persistidos que ya están en la cola o en un worker
+        self._statuses = OrderedDict()
+        self.enqueued = 0
+        self.rejected = 0
+        self.delivered = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [asyncio.ensure_future(self._worker(i)) for i in range(self.worker_count)]
+        if self._store is not None:
+            self._store.open()
+            # El primer barrido reencola lo que quedó pendiente antes del reinicio
+            self._sweeper = asyncio.ensure_future(self._sweep_loop())
+        logger.info("📬 Outbox de notificaciones iniciado con %s workers", self.worker_count)
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Espera a que se vacíe la cola (como mucho `drain_timeout` segundos) y detiene los workers"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Se detiene el outbox con %s notificaciones sin enviar", self._queue.qsize())
+        tasks = self._workers + ([self._sweeper] if self._sweeper is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+        self._tracked.clear()
+        if self._store is not None:
+            self._store.close()
+
+    async def enqueue(self, payment_id: str, message: str, customer_id: str, timeout: float = 0.0):
+        """
+        Encola una notificación. Si la cola está llena espera hasta `timeout` segundos
+        a que haya espacio y, si no lo hay, lanza OutboxFullError.
+        """
+        if not self._workers:
+            await self.start()
+
+        if self._store is not None:
+            await self._enqueue_durable(payment_id, message, customer_id, timeout)
+            return
+
+        item = (None, payment_id, message, customer_id, 0)
+        # El estado se registra antes de insertar para que ningún worker se adelante
+        self._set_status(payment_id, {"status": "queued", "queued_at": time.time()}, replace=True)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                if timeout <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(self._queue.put(item), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                self._set_status(payment_id, {"status": "rejected"}, replace=True)
+                raise OutboxFullError("La cola de notificaciones está llena")
+        self.enqueued += 1
+
+    async def _enqueue_durable(self, payment_id: str, message: str, customer_id: str, timeout: float):
+        # La contrapresión se aplica antes de persistir: lo rechazado no llega al disco
+        if self._queue.full() and timeout > 0:
+            deadline = time.monotonic() + timeout
+            while self._queue.full() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        if self._queue.full():
+            self.rejected += 1
+            raise OutboxFullError("La cola de notificaciones está llena")
+
+        record_id = await self._store.append(payment_id, message, customer_id)
+        self.enqueued += 1
+        self._set_status(payment_id, {"status": "queued", "queued_at": time.time()}, replace=True)
+        if record_id in self._tracked:
+            # Un barrido concurrente ya la encoló
+            return
+        try:
+            self._queue.put_nowait((record_id, payment_id, message, customer_id, 0))
+            self._tracked.add(record_id)
+        except asyncio.QueueFull:
+            # Ya es durable: el siguiente barrido la encolará
+            pass
+
+    def get_status(self, payment_id: str):
+        return self._statuses.get(payment_id)
+
+    async def lookup_status(self, payment_id: str):
+        """Estado en memoria o, si se perdió (p. ej. tras un reinicio), el del almacén durable"""
+        status = self._statuses.get(payment_id)
+        if status is None and self._store is not None and self._workers:
+            status = await self._store.get_latest(payment_id)
+        return status
+
+    def _set_status(self, payment_id: str, status: dict, replace: bool = False):
+        statuses = self._statuses
+        if payment_id in statuses and not replace:
+            statuses[payment_id].update(status)
+            statuses.move_to_end(payment_id)
+            return
+        statuses[payment_id] = status
+        statuses.move_to_end(payment_id)
+        if len(statuses) > self.status_capacity:
+            statuses.popitem(last=False)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            record_id, payment_id, message, customer_id, attempts = await self._queue.get()
+            try:
+                self._set_status(payment_id, {"status": "sending"})
+                try:
+                    result = await self._send(message, customer_id)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error("❌ Worker %d no pudo entregar la notificación de %s: %s", worker_id, payment_id, e,
+                                 extra={"event": "notification_failed"})
+                    await self._record_failure(record_id, payment_id, attempts + 1, e)
+                    continue
+
+                self.delivered += 1
+                if record_id is not None:
+                    await self._store.mark_delivered(record_id, result.get("provider"))
+                self._set_status(payment_id, {
+                    "status": "delivered",
+                    "provider": result.get("provider"),
+                    "message_id": result.get("message_id"),
+                    "completed_at": time.time()
+                })
+            except Exception as e:
+                logger.error("❌ Worker %s no pudo registrar el resultado de %s: %s", worker_id, payment_id, e)
+            finally:
+                self._tracked.discard(record_id)
+                self._queue.task_done()
+
+    async def _record_failure(self, record_id, payment_id: str, attempts: int, error: Exception):
+        status = {"status": "failed", "error": str(error), "attempts": attempts, "completed_at": time.time()}
+        if record_id is not None:
+            dead = attempts >= self.max_attempts
+            next_attempt_at = time.time() + self.retry_backoff * 2 ** (attempts - 1)
+            await self._store.mark_failed(record_id, str(error), next_attempt_at, dead)
+            if dead:
+                status["status"] = "dead"
+            else:
+                status["next_attempt_at"] = next_attempt_at
+        self._set_status(payment_id, status)
+
+    async def _sweep_loop(self):
+        last_compaction = time.monotonic()
+        while True:
+            try:
+                await self._sweep()
+                if time.monotonic() - last_compaction >= self.compact_interval:
+                    deleted = await self._store.compact()
+                    last_compaction = time.monotonic()
+                    if deleted:
+                        logger.info("🧹 Outbox compactado: %s notificaciones entregadas eliminadas", deleted)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Error en el barrido del outbox durable: %s", e)
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _sweep(self):
+        """Encola las notificaciones persistidas cuyo próximo intento ya venció"""
+        free = self.max_size - self._queue.qsize()
+        if free <= 0:
+            return
+        rows = await self._store.load_due(time.time(), free + len(self._tracked))
+        replayed = 0
+        for record_id, payment_id, message, customer_id, attempts in rows:
+            if record_id in self._tracked:
+                continue
+            if self._queue.full():
+                break
+            self._tracked.add(record_id)
+            self._queue.put_nowait((record_id, payment_id, message, customer_id, attempts))
+            replayed += 1
+        if replayed:
+            logger.info("🔁 %s notificaciones pendientes reencoladas desde el outbox durable", replayed)
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.max_size,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "durable": self._store is not None,
+            "durable_commits": self._store.commits if self._store is not None else 0,
+            "durable_writes": self._store.writes if self._store is not None else 0,
+        }
+
+
+# Instancia global del outbox de notificaciones
+notification_outbox = NotificationOutbox(
+    notification_service.send_notification,
+    max_size=settings.OUTBOX_MAX_SIZE,
+    workers=settings.OUTBOX_WORKERS,
+    status_capacity=settings.OUTBOX_STATUS_CAPACITY,
+    store=SQLiteOutboxStore(
+        settings.OUTBOX_DB_PATH,
+        group_max=settings.OUTBOX_GROUP_COMMIT_MAX,
+        group_window=settings.OUTBOX_GROUP_COMMIT_WINDOW
+    ) if settings.OUTBOX_DURABLE else None,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    retry_backoff=settings.OUTBOX_RETRY_BACKOFF,
+    sweep_interval=settings.OUTBOX_SWEEP_INTERVAL,
+    compact_interval=settings.OUTBOX_COMPACT_INTERVAL
+)
+
+OUTBOX_DEPTH = Gauge("notification_outbox_depth", "Notificaciones encoladas en el outbox")
+OUTBOX_DEPTH.set_function(lambda: notification_outbox.stats()["depth"])
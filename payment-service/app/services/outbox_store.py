@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    provider TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_payment ON notifications (payment_id);
+"""
+
+# Estados de una notificación persistida
+STATUS_PENDING = "pending"      # Encolada, todavía sin resultado
+STATUS_FAILED = "failed"        # Falló en ambos proveedores; se reintentará en next_attempt_at
+STATUS_DELIVERED = "delivered"  # Entregada; la compactación la elimina
+STATUS_DEAD = "dead"            # Agotó los reintentos
+
+
+class SQLiteOutboxStore:
+    """
+    Almacén durable de notificaciones pendientes en SQLite (modo WAL).
+
+    Todas las escrituras pasan por un único hilo escritor que agrupa las operaciones
+    que llegan juntas (hasta `group_max` o durante `group_window` segundos) en una
+    sola transacción, de modo que un fsync cubre muchas notificaciones. Los
+    llamadores reciben un future de asyncio que se resuelve cuando su escritura ya
+    es durable. Las lecturas usan una conexión aparte y no bloquean al escritor.
+    """
+
+    def __init__(self, path: str, group_max: int = 256, group_window: float = 0.002,
+                 synchronous: str = "FULL"):
+        self.path = path
+        self.group_max = group_max
+        self.group_window = group_window
+        self.synchronous = synchronous
+        self._ops = queue.Queue()
+        self._writer = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def open(self):
+        if self._writer is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        # auto_vacuum solo tiene efecto si se fija antes de crear las tablas
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        self._reader = self._connect()
+
+        self._writer = threading.Thread(target=self._writer_loop, args=(conn,), name="outbox-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._ops.put(None)
+        self._writer.join()
+        self._writer = None
+        self._reader.close()
+        self._reader = None
+
+    # ------------------------------------------------------------------
+    # Escrituras (agrupadas en el hilo escritor)
+    # ------------------------------------------------------------------
+    def _submit(self, sql, params):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._ops.put((sql, params, loop, future))
+        return future
+
+    async def append(self, payment_id: str, message: str, customer_id: str) -> int:
+        """Persiste una notificación pendiente y devuelve su id cuando ya es durable"""
+        now = time.time()
+        return await self._submit(
+            "INSERT INTO notifications (payment_id, message, customer_id, status, next_attempt_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (payment_id, message, customer_id, STATUS_PENDING, now, now, now)
+        )
+
+    async def mark_delivered(self, record_id: int, provider: str):
+        await self._submit(
+            "UPDATE notifications SET status = ?, provider = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (STATUS_DELIVERED, provider, time.time(), record_id)
+        )
+
+    async def mark_failed(self, record_id: int, error: str, next_attempt_at: float, dead: bool):
+        await self._submit(
+            "UPDATE notifications SET status = ?, last_error = ?, attempts = attempts + 1,"
+            " next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (STATUS_DEAD if dead else STATUS_FAILED, error, next_attempt_at, time.time(), record_id)
+        )
+
+    async def compact(self) -> int:
+        """Elimina las notificaciones entregadas y devuelve el espacio al sistema de archivos"""
+        deleted = await self._submit("DELETE FROM notifications WHERE status = ?", (STATUS_DELIVERED,))
+        await self._submit("PRAGMA incremental_vacuum", ())
+        await self._submit("PRAGMA wal_checkpoint(TRUNCATE)", ())
+        return deleted
+
+    def _writer_loop(self, conn):
+        running = True
+        while running:
+            batch = [self._ops.get()]
+            deadline = time.monotonic() + self.group_window
+            while len(batch) < self.group_max and batch[-1] is not None:
+                try:
+                    batch.append(self._ops.get_nowait())
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._ops.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if batch:
+                self._execute_group(conn, batch)
+        conn.close()
+
+    def _execute_group(self, conn, batch):
+        results = []
+        pragmas = [op for op in batch if op[0].startswith("PRAGMA")]
+        writes = [op for op in batch if not op[0].startswith("PRAGMA")]
+        try:
+            if writes:
+                conn.execute("BEGIN IMMEDIATE")
+                for sql, params, _, _ in writes:
+                    cursor = conn.execute(sql, params)
+                    results.append(cursor.lastrowid if sql.startswith("INSERT") else cursor.rowcount)
+                conn.execute("COMMIT")
+                self.commits += 1
+                self.writes += len(writes)
+            # Los PRAGMA de mantenimiento no pueden ir dentro de una transacción
+            for sql, params, _, _ in pragmas:
+                conn.execute(sql, params).fetchall()
+                results.append(None)
+        except Exception as e:
+            logger.error("❌ Error al escribir en el outbox durable: %s", e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, loop, future in batch:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            return
+
+        for (_, _, loop, future), result in zip(writes + pragmas, results):
+            loop.call_soon_threadsafe(_resolve, future, result, None)
+
+    # ------------------------------------------------------------------
+    # Lecturas
+    # ------------------------------------------------------------------
+    async def _read(self, sql, params):
+        def run():
+            with self._reader_lock:
+                return self._reader.execute(sql, params).fetchall()
+
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+    async def load_due(self, now: float, limit: int):
+        """Notificaciones pendientes o fallidas cuyo próximo intento ya venció"""
+        return await self._read(
+            "SELECT id, payment_id, message, customer_id, attempts FROM notifications"
+            " WHERE status IN (?, ?) AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (STATUS_PENDING, STATUS_FAILED, now, limit)
+        )
+
+    async def get_latest(self, payment_id: str):
+        rows = await self._read(
+            "SELECT status, attempts, provider, last_error, created_at, updated_at FROM notifications"
+            " WHERE payment_id = ? ORDER BY id DESC LIMIT 1",
+            (payment_id,)
+        )
+        if not rows:
+            return None
+        status, attempts, provider, last_error, created_at, updated_at = rows[0]
+        return {
+            "status": "queued" if status == STATUS_PENDING else status,
+            "attempts": attempts,
+            "provider": provider,
+            "error": last_error,
+            "queued_at": created_at,
+            "completed_at": updated_at if status != STATUS_PENDING else None,
+        }
+
+    async def counts(self):
+        rows = await self._read("SELECT status, COUNT(*) FROM notifications GROUP BY status", ())
+        return dict(rows)
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,191 @@
+"""
+Registro de proveedores de notificaciones.
+
+Los proveedores se declaran en NOTIFICATION_PROVIDERS, en orden de prioridad, y
+cada uno se configura con variables con su nombre como prefijo:
+
+- `<NOMBRE>_SERVICE_URL` (obligatoria)
+- `<NOMBRE>_MAX_CONNECTIONS` y `<NOMBRE>_MAX_KEEPALIVE_CONNECTIONS` (100 y 20)
+- `<NOMBRE>_MAX_RETRIES` (0)
+- `<NOMBRE>_COST_WEIGHT` (1.0)
+
+de modo que añadir un proveedor de SMS es un cambio de configuración. Cada
+proveedor tiene su propio pool de conexiones, circuit breaker, límite de
+concurrencia, política de reintentos, timeout adaptativo y estadísticas de
+enrutamiento.
+"""
+import httpx
+
+from ..budget import TokenBudget
+from ..circuit_breaker import STATE_OPEN, build_breaker
+from ..concurrency import AdaptiveConcurrencyLimiter
+from ..config import settings, provider_setting
+from ..events import BreakerEventListener, event_bus
+from ..latency import AdaptiveTimeout, LatencyTracker
+from ..metrics import Counter, Gauge, Histogram
+from ..retry import RetryPolicy
+from ..routing import RoutingStats
+
+PROVIDER_LATENCY = Histogram(
+    "notification_provider_latency_seconds", "Latencia de las llamadas a los proveedores", ["provider", "operation"]
+)
+PROVIDER_REQUESTS = Counter(
+    "notification_provider_requests_total", "Llamadas a los proveedores por resultado", ["provider", "operation", "outcome"]
+)
+PROVIDER_IN_FLIGHT = Gauge("notification_provider_in_flight", "Llamadas en curso a cada proveedor", ["provider"])
+PROVIDER_SCORE = Gauge("notification_provider_score", "Puntuación de enrutamiento (menor es mejor)", ["provider"])
+
+
+class ProviderMetrics:
+    """Hijos de las métricas de un proveedor, enlazados una sola vez"""
+
+    def __init__(self, provider: str, operation: str):
+        self.latency = PROVIDER_LATENCY.labels(provider, operation)
+        self.success = PROVIDER_REQUESTS.labels(provider, operation, "success")
+        self.error = PROVIDER_REQUESTS.labels(provider, operation, "error")
+        self.cancelled = PROVIDER_REQUESTS.labels(provider, operation, "cancelled")
+        self.timeout = PROVIDER_REQUESTS.labels(provider, operation, "timeout")
+        self.in_flight = PROVIDER_IN_FLIGHT.labels(provider)
+
+
+def build_client(max_connections: int, max_keepalive_connections: int) -> httpx.AsyncClient:
+    """Crea un cliente HTTP de larga vida con su propio pool de conexiones"""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(
+        timeout=settings.HTTP_TIMEOUT,
+        limits=limits,
+        http2=settings.HTTP2_ENABLED
+    )
+
+
+class Provider:
+    """Un proveedor de notificaciones con todo su estado de resiliencia"""
+
+    def __init__(self, name: str, url: str, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 max_retries: int = 0, cost_weight: float = 1.0):
+        self.name = name
+        self.key = name.lower()
+        self.url = url
+        self.notify_url = f"{url}/notify"
+        self.batch_url = f"{url}/notify/batch"
+        self.health_url = f"{url}/health"
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.cost_weight = cost_weight
+
+        # El cliente se crea y cierra en el lifespan de FastAPI
+        self.client = None
+
+        self.breaker = build_breaker(name)
+        self.breaker.add_listener(BreakerEventListener(event_bus, name))
+        self.latency = LatencyTracker()
+        self.timeout = AdaptiveTimeout(
+            self.latency,
+            percentile=settings.ADAPTIVE_TIMEOUT_PERCENTILE,
+            multiplier=settings.ADAPTIVE_TIMEOUT_MULTIPLIER,
+            min_timeout=settings.ADAPTIVE_TIMEOUT_MIN,
+            max_timeout=settings.HTTP_TIMEOUT,
+            min_samples=settings.ADAPTIVE_TIMEOUT_MIN_SAMPLES
+        )
+        self.limiter = AdaptiveConcurrencyLimiter(
+            name,
+            initial_limit=settings.BULKHEAD_INITIAL_LIMIT,
+            min_limit=settings.BULKHEAD_MIN_LIMIT,
+            max_limit=settings.BULKHEAD_MAX_LIMIT,
+            tolerance=settings.BULKHEAD_RTT_TOLERANCE
+        )
+        self.retry = RetryPolicy(
+            name, max_retries,
+            TokenBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_BURST),
+            settings.RETRY_BASE_DELAY, settings.RETRY_MAX_DELAY
+        )
+        self.routing = RoutingStats(settings.ROUTING_EWMA_ALPHA, settings.ROUTING_ERROR_HALF_LIFE)
+        self.metrics = ProviderMetrics(name, "single")
+        self.batch_metrics = ProviderMetrics(name, "batch")
+
+    @property
+    def in_flight(self) -> int:
+        return self.metrics.in_flight.value
+
+    def available(self) -> bool:
+        """Falso mientras el circuito está abierto (semi-abierto sí admite pruebas)"""
+        return self.breaker.current_state != STATE_OPEN
+
+    async def startup(self):
+        if self.client is None:
+            self.client = build_client(self.max_connections, self.max_keepalive_connections)
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
+
+    async def get_client(self) -> httpx.AsyncClient:
+        # Permite usar el proveedor fuera del lifespan (scripts, benchmarks)
+        if self.client is None:
+            await self.startup()
+        return self.client
+
+
+class ProviderRegistry:
+    """Proveedores configurados, en orden de prioridad; se buscan por nombre sin distinguir mayúsculas"""
+
+    def __init__(self, providers):
+        if not providers:
+            raise ValueError("Hay que configurar al menos un proveedor de notificaciones")
+        self._providers = list(providers)
+        self._by_key = {provider.key: provider for provider in self._providers}
+        if len(self._by_key) != len(self._providers):
+            raise ValueError("Hay proveedores de notificaciones duplicados")
+
+    def __iter__(self):
+        return iter(self._providers)
+
+    def __len__(self):
+        return len(self._providers)
+
+    @property
+    def primary(self) -> Provider:
+        return self._providers[0]
+
+    def get(self, name: str) -> Provider:
+        """Devuelve el proveedor `name` o lanza KeyError"""
+        return self._by_key[name.lower()]
+
+    async def startup(self):
+        """Crear los pools de conexiones de los proveedores"""
+        for provider in self._providers:
+            await provider.startup()
+
+    async def shutdown(self):
+        """Cerrar los pools de conexiones de los proveedores"""
+        for provider in self._providers:
+            await provider.shutdown()
+
+
+def build_registry(names: str) -> ProviderRegistry:
+    """Crea los proveedores de una lista separada por comas con su configuración <NOMBRE>_*"""
+    providers = []
+    for name in (name.strip() for name in names.split(",")):
+        if not name:
+            continue
+        url = provider_setting(name, "SERVICE_URL")
+        if not url:
+            raise ValueError(f"Falta {name.upper()}_SERVICE_URL para el proveedor {name}")
+        providers.append(Provider(
+            name,
+            url.rstrip("/"),
+            max_connections=int(provider_setting(name, "MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(provider_setting(name, "MAX_KEEPALIVE_CONNECTIONS", 20)),
+            max_retries=int(provider_setting(name, "MAX_RETRIES", 0)),
+            cost_weight=float(provider_setting(name, "COST_WEIGHT", 1.0))
+        ))
+    return ProviderRegistry(providers)
+
+
+# Registro global de proveedores
+provider_registry = build_registry(settings.NOTIFICATION_PROVIDERS)
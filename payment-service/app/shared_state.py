@@ -0,0 +1,303 @@
+"""
+Estado del circuit breaker compartido entre procesos (workers de uvicorn/gunicorn).
+
+El estado vive en un archivo mapeado en memoria (por defecto en /dev/shm) con:
+- una cabecera con el estado del circuito protegida por un seqlock: los escritores
+  (solo en transiciones, que son raras) se serializan con flock y los lectores
+  leen sin bloquear y reintentan si la secuencia cambió a mitad de la lectura;
+- una ranura por proceso con su propia ventana de cubetas de un segundo. Cada
+  ranura tiene un único escritor (su proceso), así que no hacen falta contadores
+  atómicos: cada proceso suma las ranuras de los demás periódicamente.
+
+time.monotonic() usa CLOCK_MONOTONIC, común a todos los procesos del mismo host,
+así que los instantes guardados son comparables entre workers.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+from .sliding_window import TimeSlidingWindow
+
+_MAGIC = 0xB4EA4E55
+_VERSION = 1
+
+# magic, version, window_size, max_slots, seq, state, forced, opened_at, reset_at
+_HEADER = struct.Struct("<IIIIQIIdd")
+_HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 16
+_STATE = struct.Struct("<IIdd")
+_STATE_OFFSET = 24
+_PID = struct.Struct("<Q")
+# segundo, llamadas, fallos, lentas
+_BUCKET = struct.Struct("<qIII4x")
+
+# Lecturas sin lock antes de tomarlo (ver load_state)
+_SEQLOCK_RETRIES = 1000
+
+_STATE_CODES = {'closed': 0, 'open': 1, 'half-open': 2}
+_STATE_NAMES = {code: name for name, code in _STATE_CODES.items()}
+
+
+class BreakerStateBackend:
+    """
+    Interfaz de un almacén de estado compartido para AsyncCircuitBreaker.
+
+    `window` es la ventana deslizante que usará el breaker. `state_seq()` debe ser
+    barato porque se consulta en cada llamada; `load_state()` y `publish_state()`
+    solo se usan cuando cambia el estado. Un backend compatible con Redis puede
+    implementar la misma interfaz.
+    """
+
+    window = None
+
+    def state_seq(self) -> int:
+        raise NotImplementedError
+
+    def load_state(self):
+        """Devuelve (estado, abierto_desde, forzado, secuencia)"""
+        raise NotImplementedError
+
+    def publish_state(self, state: str, opened_at: float, forced: bool) -> int:
+        """Publica el estado, reinicia la ventana compartida y devuelve la nueva secuencia"""
+        raise NotImplementedError
+
+    def attach(self) -> bool:
+        """Se une al estado compartido; True si ningún otro proceso vivo lo está usando"""
+        raise NotImplementedError
+
+
+class SharedTimeWindow:
+    """
+    Ventana por tiempo repartida en ranuras por proceso.
+
+    Las llamadas de este proceso se agregan al instante; las de los demás se
+    vuelven a sumar como mucho cada `refresh_interval` segundos, de modo que el
+    camino caliente no recorre la memoria compartida.
+    """
+
+    def __init__(self, backend, size: int, refresh_interval: float):
+        self._backend = backend
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self._own = TimeSlidingWindow(size)
+        self._others = (0, 0, 0)
+        self._last_refresh = float("-inf")
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def record(self, failed: bool, slow: bool, now: float):
+        own = self._own
+        own.record(failed, slow, now)
+        self._backend.write_bucket(*own.current_bucket())
+        if now - self._last_refresh >= self.refresh_interval:
+            self._refresh(now)
+        calls, failures, slow_calls = self._others
+        self.calls = calls + own.calls
+        self.failures = failures + own.failures
+        self.slow_calls = slow_calls + own.slow_calls
+
+    def totals(self, now: float):
+        own_calls, own_failures, own_slow = self._own.totals(now)
+        self._refresh(now)
+        calls, failures, slow_calls = self._others
+        self.calls = calls + own_calls
+        self.failures = failures + own_failures
+        self.slow_calls = slow_calls + own_slow
+        return self.calls, self.failures, self.slow_calls
+
+    def _refresh(self, now: float):
+        self._others = self._backend.sum_other_slots(now, self.size)
+        self._last_refresh = now
+
+    def reset(self):
+        self._own.reset()
+        self._backend.clear_own_slot()
+        self._others = (0, 0, 0)
+        self._last_refresh = float("-inf")
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+
+class SharedMemoryStateBackend(BreakerStateBackend):
+    """Estado compartido en un archivo mapeado en memoria para los workers de un mismo host"""
+
+    def __init__(self, path: str, window_size: int, max_workers: int = 64, refresh_interval: float = 0.1,
+                 clock=time.monotonic):
+        self.path = path
+        self.window_size = window_size
+        self.max_workers = max_workers
+        self._clock = clock
+        self._slot_size = _PID.size + _BUCKET.size * window_size
+        size = _HEADER_SIZE + self._slot_size * max_workers
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, size)
+            magic, version, stored_window, stored_slots = _HEADER.unpack_from(self._mm, 0)[:4]
+            if (magic, version, stored_window, stored_slots) != (_MAGIC, _VERSION, window_size, max_workers):
+                self._mm[:] = bytes(size)
+                _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, window_size, max_workers, 0,
+                                  _STATE_CODES['closed'], 0, 0.0, 0.0)
+
+        self._pid = None
+        self._slot_offset = None
+        self.window = SharedTimeWindow(self, window_size, refresh_interval)
+
+    # ------------------------------------------------------------------
+    # Sincronización entre procesos
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _ensure_slot(self):
+        """Reserva la ranura de este proceso (de nuevo si el proceso es un fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._locked():
+            self._reserve_slot(pid)
+
+    def _reserve_slot(self, pid: int):
+        # Con el lock tomado
+        if self._pid == pid:
+            return
+        free = None
+        for slot in range(self.max_workers):
+            offset = _HEADER_SIZE + slot * self._slot_size
+            owner = _PID.unpack_from(self._mm, offset)[0]
+            if owner == pid:
+                free = offset
+                break
+            if free is None and (owner == 0 or not _pid_alive(owner)):
+                free = offset
+        if free is None:
+            raise RuntimeError(f"No quedan ranuras libres en {self.path} ({self.max_workers} workers)")
+        self._mm[free:free + self._slot_size] = bytes(self._slot_size)
+        _PID.pack_into(self._mm, free, pid)
+        self._pid = pid
+        self._slot_offset = free
+
+    def attach(self) -> bool:
+        """
+        Reserva la ranura de este proceso y devuelve True si es el primero en usar
+        el estado (ningún otro proceso vivo tiene ranura). Comprobar y reservar bajo
+        el mismo lock garantiza que, si varios workers arrancan a la vez, solo uno
+        se considere el primero.
+        """
+        pid = os.getpid()
+        with self._locked():
+            first = True
+            for slot in range(self.max_workers):
+                owner = _PID.unpack_from(self._mm, _HEADER_SIZE + slot * self._slot_size)[0]
+                if owner not in (0, pid) and _pid_alive(owner):
+                    first = False
+                    break
+            self._reserve_slot(pid)
+        return first
+
+    # ------------------------------------------------------------------
+    # Estado del circuito
+    # ------------------------------------------------------------------
+    def state_seq(self) -> int:
+        return _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0]
+
+    def load_state(self):
+        for _ in range(_SEQLOCK_RETRIES):
+            before = self.state_seq()
+            if before % 2 == 0:
+                state, forced, opened_at, _ = _STATE.unpack_from(self._mm, _STATE_OFFSET)
+                if self.state_seq() == before:
+                    return _STATE_NAMES[state], opened_at, bool(forced), before
+        # Un escritor activo termina enseguida; si la secuencia sigue impar es que el
+        # escritor murió a mitad (el SO ya liberó su flock): se lee bajo el lock
+        with self._locked():
+            seq = self.state_seq()
+            if seq % 2:
+                seq += 1
+                _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq)
+            state, forced, opened_at, _ = _STATE.unpack_from(self._mm, _STATE_OFFSET)
+        return _STATE_NAMES.get(state, "closed"), opened_at, bool(forced), seq
+
+    def publish_state(self, state: str, opened_at: float, forced: bool) -> int:
+        with self._locked():
+            seq = self.state_seq()
+            _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq + 1)
+            _STATE.pack_into(self._mm, _STATE_OFFSET, _STATE_CODES[state], int(forced), opened_at, self._clock())
+            _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq + 2)
+        return seq + 2
+
+    def _reset_at(self) -> float:
+        return _STATE.unpack_from(self._mm, _STATE_OFFSET)[3]
+
+    # ------------------------------------------------------------------
+    # Ventana compartida
+    # ------------------------------------------------------------------
+    def write_bucket(self, second: int, calls: int, failures: int, slow_calls: int):
+        self._ensure_slot()
+        offset = self._slot_offset + _PID.size + (second % self.window_size) * _BUCKET.size
+        _BUCKET.pack_into(self._mm, offset, second, calls, failures, slow_calls)
+
+    def clear_own_slot(self):
+        if self._slot_offset is None or self._pid != os.getpid():
+            return
+        start = self._slot_offset + _PID.size
+        self._mm[start:self._slot_offset + self._slot_size] = bytes(self._slot_size - _PID.size)
+
+    def sum_other_slots(self, now: float, size: int):
+        """Suma las cubetas vigentes de los demás procesos desde el último reinicio de la ventana"""
+        second = int(now)
+        oldest = max(second - size + 1, int(self._reset_at()))
+        calls = failures = slow_calls = 0
+        mm = self._mm
+        for slot in range(self.max_workers):
+            offset = _HEADER_SIZE + slot * self._slot_size
+            if offset == self._slot_offset:
+                continue
+            if _PID.unpack_from(mm, offset)[0] == 0:
+                continue
+            start = offset + _PID.size
+            for bucket_second, c, f, s in _BUCKET.iter_unpack(mm[start:start + _BUCKET.size * size]):
+                if oldest <= bucket_second <= second:
+                    calls += c
+                    failures += f
+                    slow_calls += s
+        return calls, failures, slow_calls
+
+    def workers(self):
+        """PIDs con ranura reservada"""
+        pids = []
+        for slot in range(self.max_workers):
+            pid = _PID.unpack_from(self._mm, _HEADER_SIZE + slot * self._slot_size)[0]
+            if pid:
+                pids.append(pid)
+        return pids
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
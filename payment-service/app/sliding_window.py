@@ -0,0 +1,176 @@
+"""
+Ventanas deslizantes de resultados para el circuit breaker.
+
+Ambas ventanas usan buffers circulares de tamaño fijo reservados al crearse, de
+modo que registrar un resultado es O(1) y no crea listas ni objetos nuevos.
+"""
+
+# Códigos de resultado guardados en la ventana por conteo
+_FAILED = 1
+_SLOW = 2
+
+
+class CountSlidingWindow:
+    """Agrega los resultados de las últimas `size` llamadas"""
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("El tamaño de la ventana debe ser al menos 1")
+        self.size = size
+        self._outcomes = [0] * size
+        self._index = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def record(self, failed: bool, slow: bool, now: float):
+        if self.calls == self.size:
+            old = self._outcomes[self._index]
+            self.failures -= old & _FAILED
+            self.slow_calls -= (old & _SLOW) >> 1
+        else:
+            self.calls += 1
+
+        code = (_FAILED if failed else 0) | (_SLOW if slow else 0)
+        self._outcomes[self._index] = code
+        self.failures += code & _FAILED
+        self.slow_calls += (code & _SLOW) >> 1
+
+        self._index += 1
+        if self._index == self.size:
+            self._index = 0
+
+    def totals(self, now: float):
+        """Devuelve (llamadas, fallos, llamadas lentas) dentro de la ventana"""
+        return self.calls, self.failures, self.slow_calls
+
+    def reset(self):
+        for i in range(self.size):
+            self._outcomes[i] = 0
+        self._index = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def export_state(self, now: float):
+        """Resultados de la ventana, del más antiguo al más reciente"""
+        if self.calls == self.size:
+            outcomes = self._outcomes[self._index:] + self._outcomes[:self._index]
+        else:
+            outcomes = self._outcomes[:self._index]
+        return {"type": "count", "outcomes": outcomes}
+
+    def restore_state(self, data, now: float, age: float):
+        """Vuelve a registrar los resultados exportados (los últimos `size` si la ventana es menor)"""
+        if data.get("type") != "count":
+            return
+        self.reset()
+        for code in data["outcomes"][-self.size:]:
+            self.record(bool(code & _FAILED), bool(code & _SLOW), now)
+
+
+class TimeSlidingWindow:
+    """Agrega los resultados de los últimos `size` segundos en cubetas de un segundo"""
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("El tamaño de la ventana debe ser al menos 1")
+        self.size = size
+        self._calls = [0] * size
+        self._failures = [0] * size
+        self._slow = [0] * size
+        self._current_second = None
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def _advance(self, now: float):
+        """Vacía las cubetas que quedaron fuera de la ventana desde la última llamada"""
+        second = int(now)
+        if self._current_second is None:
+            self._current_second = second
+            return second % self.size
+        elapsed = second - self._current_second
+        if elapsed > 0:
+            for step in range(1, min(elapsed, self.size) + 1):
+                index = (self._current_second + step) % self.size
+                self.calls -= self._calls[index]
+                self.failures -= self._failures[index]
+                self.slow_calls -= self._slow[index]
+                self._calls[index] = 0
+                self._failures[index] = 0
+                self._slow[index] = 0
+            self._current_second = second
+        return self._current_second % self.size
+
+    def record(self, failed: bool, slow: bool, now: float):
+        index = self._advance(now)
+        self._calls[index] += 1
+        self.calls += 1
+        if failed:
+            self._failures[index] += 1
+            self.failures += 1
+        if slow:
+            self._slow[index] += 1
+            self.slow_calls += 1
+
+    def current_bucket(self):
+        """Devuelve (segundo, llamadas, fallos, llamadas lentas) de la cubeta actual"""
+        index = self._current_second % self.size
+        return self._current_second, self._calls[index], self._failures[index], self._slow[index]
+
+    def totals(self, now: float):
+        """Devuelve (llamadas, fallos, llamadas lentas) dentro de la ventana"""
+        self._advance(now)
+        return self.calls, self.failures, self.slow_calls
+
+    def reset(self):
+        for i in range(self.size):
+            self._calls[i] = 0
+            self._failures[i] = 0
+            self._slow[i] = 0
+        self._current_second = None
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def export_state(self, now: float):
+        """Cubetas no vacías como [antigüedad en segundos, llamadas, fallos, lentas]"""
+        index = self._advance(now)
+        buckets = []
+        for age in range(self.size):
+            i = (index - age) % self.size
+            if self._calls[i]:
+                buckets.append([age, self._calls[i], self._failures[i], self._slow[i]])
+        return {"type": "time", "buckets": buckets}
+
+    def restore_state(self, data, now: float, age: float):
+        """
+        Restaura las cubetas exportadas hace `age` segundos; las que con esa
+        antigüedad ya quedan fuera de la ventana se descartan
+        """
+        if data.get("type") != "time":
+            return
+        self.reset()
+        index = self._advance(now)
+        shift = int(round(age))
+        for bucket_age, calls, failures, slow_calls in data["buckets"]:
+            bucket_age += shift
+            if bucket_age >= self.size:
+                continue
+            i = (index - bucket_age) % self.size
+            self._calls[i] += calls
+            self._failures[i] += failures
+            self._slow[i] += slow_calls
+            self.calls += calls
+            self.failures += failures
+            self.slow_calls += slow_calls
+
+
+def build_window(window_type: str, size: int):
+    """Crea la ventana configurada: "count" (últimas N llamadas) o "time" (últimos N segundos)"""
+    if window_type == "count":
+        return CountSlidingWindow(size)
+    if window_type == "time":
+        return TimeSlidingWindow(size)
+    raise ValueError(f"Tipo de ventana desconocido: {window_type}")
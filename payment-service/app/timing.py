@@ -0,0 +1,187 @@
+"""
+Desglose de la latencia de cada solicitud por fases.
+
+Con SERVER_TIMING_ENABLED, TimingMiddleware crea un RequestTimings por solicitud
+en una ContextVar, que heredan las tareas creadas durante la solicitud (hedging,
+coalescing). El código instrumentado suma duraciones a fases con nombre:
+
+- `parse`: desde que llega la solicitud hasta que empieza el handler (lectura del
+  cuerpo y validación);
+- `<proveedor>`: llamadas HTTP a cada proveedor, reintentos incluidos;
+- `breaker`: tiempo de los intentos fuera de la llamada HTTP (circuit breaker,
+  límite de concurrencia, comprobación del deadline);
+- `log`: entrega de registros a la cola de logging;
+- `respond`: desde que termina el handler hasta que se envían las cabeceras
+  (serialización de la respuesta);
+- `total`.
+
+El desglose va en la cabecera Server-Timing de la respuesta y se agrega por
+endpoint y fase en /metrics (http_request_phase_seconds) y en /health. Sin el
+middleware, `phase` y `handler_span` solo consultan la ContextVar.
+"""
+import time
+from contextvars import ContextVar
+
+from .latency import LatencyTracker
+from .metrics import Histogram
+
+PHASE_DURATION = Histogram(
+    "http_request_phase_seconds", "Duración de cada fase de las solicitudes HTTP", ["handler", "phase"]
+)
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Duraciones acumuladas por fase de una solicitud"""
+
+    __slots__ = ("start", "handler_start", "handler_end", "phases")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.handler_start = None
+        self.handler_end = None
+        self.phases = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def get(self, name: str) -> float:
+        return self.phases.get(name, 0.0)
+
+    def finish(self, now: float):
+        """Fases completas al enviar las cabeceras, en orden de aparición y con `total` al final"""
+        phases = {}
+        if self.handler_start is not None:
+            phases["parse"] = self.handler_start - self.start
+        phases.update(self.phases)
+        if self.handler_end is not None:
+            phases["respond"] = now - self.handler_end
+        phases["total"] = now - self.start
+        return phases
+
+
+def current_timings():
+    """RequestTimings de la solicitud en curso, o None si no se mide"""
+    return _current.get()
+
+
+class phase:
+    """Context manager que suma su duración a la fase `name` de la solicitud en curso"""
+
+    __slots__ = ("name", "_timings", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._timings = timings = _current.get()
+        if timings is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._timings is not None:
+            self._timings.add(self.name, time.perf_counter() - self._start)
+
+
+class handler_span:
+    """Marca el comienzo y el final del handler, que separan `parse` y `respond`"""
+
+    __slots__ = ("_timings",)
+
+    def __enter__(self):
+        self._timings = timings = _current.get()
+        if timings is not None:
+            timings.handler_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._timings is not None:
+            self._timings.handler_end = time.perf_counter()
+
+
+def _format_header(phases) -> bytes:
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items()).encode("latin-1")
+
+
+class PhaseStats:
+    """Duraciones agregadas por endpoint y fase: histograma en /metrics y cuantiles en /health"""
+
+    def __init__(self):
+        self.enabled = False
+        self._children = {}
+
+    def record(self, endpoint, phases):
+        handler = getattr(endpoint, "__name__", "none")
+        for name, seconds in phases.items():
+            key = (handler, name)
+            children = self._children.get(key)
+            if children is None:
+                # Hay fases de microsegundos: cubetas desde 10 µs
+                tracker = LatencyTracker(min_latency=1e-5)
+                children = self._children[key] = (PHASE_DURATION.labels(handler, name), tracker)
+            children[0].observe(seconds)
+            children[1].observe(seconds)
+
+    def stats(self):
+        phases = {}
+        for (handler, name), (_, tracker) in self._children.items():
+            phases.setdefault(handler, {})[name] = tracker.stats()
+        return {"enabled": self.enabled, "phases": phases}
+
+
+# Estadísticas globales de las fases
+phase_stats = PhaseStats()
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI puro que mide las fases de cada solicitud, añade la cabecera
+    Server-Timing y agrega las duraciones en `phase_stats`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(time.perf_counter())
+        token = _current.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                phases = timings.finish(time.perf_counter())
+                message["headers"] = list(message.get("headers", ())) + [(b"server-timing", _format_header(phases))]
+                phase_stats.record(scope.get("endpoint"), phases)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+
+def _timed_handle(handle):
+    def timed(record):
+        timings = _current.get()
+        if timings is None:
+            return handle(record)
+        start = time.perf_counter()
+        try:
+            return handle(record)
+        finally:
+            timings.add("log", time.perf_counter() - start)
+    return timed
+
+
+def instrument_timing(app, log_handler=None):
+    """Registra TimingMiddleware y, si se indica, suma el tiempo de `log_handler` a la fase `log`"""
+    app.add_middleware(TimingMiddleware)
+    phase_stats.enabled = True
+    if log_handler is not None:
+        # Se envuelve la instancia: structured_logging es común a los tres servicios
+        log_handler.handle = _timed_handle(log_handler.handle)
@@ -0,0 +1,268 @@
+import asyncio
+
+import pytest
+
+from app.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, AsyncCircuitBreaker, BreakerListener, CircuitBreakerError
+)
+from app.sliding_window import build_window
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Recorder(BreakerListener):
+    def __init__(self):
+        self.transitions = []
+
+    def state_change(self, cb, old_state, new_state):
+        self.transitions.append((old_state, new_state))
+
+
+def _breaker(clock, **kwargs):
+    options = dict(reset_timeout=10.0, window=build_window("count", 10), minimum_calls=4,
+                   failure_rate_threshold=0.5, clock=clock)
+    options.update(kwargs)
+    return AsyncCircuitBreaker("test", **options)
+
+
+async def _ok():
+    return "ok"
+
+
+async def _fail():
+    raise RuntimeError("caído")
+
+
+def _call(breaker, func):
+    return asyncio.run(breaker.call(func))
+
+
+def _fail_call(breaker, exc=RuntimeError):
+    with pytest.raises(exc):
+        _call(breaker, _fail)
+
+
+def test_opens_on_failures_and_rejects_without_calling():
+    clock = FakeClock()
+    recorder = Recorder()
+    breaker = _breaker(clock, listeners=(recorder,))
+    for _ in range(4):
+        _fail_call(breaker)
+    assert breaker.current_state == STATE_OPEN
+    assert recorder.transitions == [(STATE_CLOSED, STATE_OPEN)]
+
+    called = []
+
+    async def tracked():
+        called.append(1)
+
+    with pytest.raises(CircuitBreakerError):
+        _call(breaker, tracked)
+    assert called == []
+
+
+def test_half_open_after_reset_timeout_then_closes_on_success():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _fail_call(breaker)
+
+    clock.now += 9.9
+    assert breaker.current_state == STATE_OPEN
+    assert breaker.remaining_open_time() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert breaker.current_state == STATE_HALF_OPEN
+
+    assert _call(breaker, _ok) == "ok"
+    assert breaker.current_state == STATE_CLOSED
+    assert breaker.window_totals() == (0, 0, 0)
+
+
+def test_half_open_failure_reopens_and_restarts_wait():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _fail_call(breaker)
+    clock.now += 10.0
+    _fail_call(breaker)
+    assert breaker.current_state == STATE_OPEN
+    assert breaker.remaining_open_time() == pytest.approx(10.0)
+
+
+def test_excluded_errors_count_as_success_and_ignored_do_not_count():
+    clock = FakeClock()
+    breaker = _breaker(clock, exclude=(KeyError,), ignore=(ValueError,))
+
+    async def excluded():
+        raise KeyError("negocio")
+
+    async def ignored():
+        raise ValueError("ignorado")
+
+    with pytest.raises(KeyError):
+        _call(breaker, excluded)
+    with pytest.raises(ValueError):
+        _call(breaker, ignored)
+    assert breaker.window_totals() == (1, 0, 0)
+
+
+def test_force_open_holds_until_reset():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    breaker.force_open()
+    clock.now += 1000.0
+    assert breaker.current_state == STATE_OPEN
+    assert not breaker.half_open_early()
+
+    breaker.reset()
+    assert breaker.current_state == STATE_CLOSED
+    assert _call(breaker, _ok) == "ok"
+
+
+def test_failure_rate_threshold_is_inclusive_and_needs_minimum_calls():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    # 3 fallos no alcanzan minimum_calls=4
+    for _ in range(3):
+        _fail_call(breaker)
+    assert breaker.current_state == STATE_CLOSED
+
+    # 4 llamadas con 2 fallos: exactamente el 50% abre el circuito
+    breaker.reset()
+    _call(breaker, _ok)
+    _call(breaker, _ok)
+    _fail_call(breaker)
+    assert breaker.current_state == STATE_CLOSED
+    _fail_call(breaker)
+    assert breaker.current_state == STATE_OPEN
+
+
+def test_slow_call_rate_threshold_opens_circuit():
+    clock = FakeClock()
+    breaker = _breaker(clock, slow_call_duration=1.0, slow_call_rate_threshold=0.5)
+
+    async def slow():
+        clock.now += 1.0
+        return "lenta"
+
+    _call(breaker, _ok)
+    _call(breaker, _ok)
+    _call(breaker, slow)
+    assert breaker.current_state == STATE_CLOSED
+    assert breaker.window_totals() == (3, 0, 1)
+    _call(breaker, slow)
+    assert breaker.current_state == STATE_OPEN
+
+
+def test_fast_successes_evict_old_failures_from_count_window():
+    clock = FakeClock()
+    breaker = _breaker(clock, window=build_window("count", 4))
+    _fail_call(breaker)
+    for _ in range(5):
+        _call(breaker, _ok)
+    assert breaker.window_totals() == (4, 0, 0)
+    _fail_call(breaker)
+    assert breaker.current_state == STATE_CLOSED
+
+
+def _open_half(breaker, clock):
+    for _ in range(4):
+        _fail_call(breaker)
+    clock.now += 10.0
+    assert breaker.current_state == STATE_HALF_OPEN
+
+
+def test_half_open_limits_concurrent_probes():
+    clock = FakeClock()
+    breaker = _breaker(clock, half_open_max_calls=2, half_open_success_threshold=2)
+    _open_half(breaker, clock)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return "ok"
+
+        probes = [asyncio.ensure_future(breaker.call(probe)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitBreakerError):
+            await breaker.call(_ok)
+        assert breaker.stats()["half_open_in_flight"] == 2
+        release.set()
+        await asyncio.gather(*probes)
+
+    asyncio.run(scenario())
+    assert breaker.current_state == STATE_CLOSED
+
+
+def test_probe_from_previous_half_open_phase_does_not_count():
+    clock = FakeClock()
+    breaker = _breaker(clock, half_open_max_calls=2)
+    _open_half(breaker, clock)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def stale_probe():
+            await release.wait()
+            return "ok"
+
+        stale = asyncio.ensure_future(breaker.call(stale_probe))
+        await asyncio.sleep(0)
+        # Otra prueba falla y reabre; vence reset_timeout y empieza una fase nueva
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+        clock.now += 10.0
+        assert breaker.current_state == STATE_HALF_OPEN
+
+        release.set()
+        await stale
+        # El éxito de la fase anterior ni cierra el circuito ni libera un permiso nuevo
+        assert breaker.current_state == STATE_HALF_OPEN
+        assert breaker.stats()["half_open_in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def _cancel_during(breaker, clock, elapsed):
+    """Cancela una llamada que lleva `elapsed` segundos en curso"""
+    async def scenario():
+        async def hang():
+            clock.now += elapsed
+            await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(breaker.call(hang))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_call_counts_as_slow_only_past_slow_call_duration():
+    clock = FakeClock()
+    breaker = _breaker(clock, slow_call_duration=1.0, slow_call_rate_threshold=0.5)
+    _cancel_during(breaker, clock, 0.5)
+    assert breaker.window_totals() == (0, 0, 0)
+    _cancel_during(breaker, clock, 1.5)
+    assert breaker.window_totals() == (1, 0, 1)
+
+
+def test_cancelled_slow_probe_reopens_and_fast_one_releases_permit():
+    clock = FakeClock()
+    breaker = _breaker(clock, slow_call_duration=1.0)
+    _open_half(breaker, clock)
+    _cancel_during(breaker, clock, 0.5)
+    assert breaker.current_state == STATE_HALF_OPEN
+    assert breaker.stats()["half_open_in_flight"] == 0
+
+    _cancel_during(breaker, clock, 1.5)
+    assert breaker.current_state == STATE_OPEN
@@ -0,0 +1,57 @@
+import asyncio
+
+from app.services.notification_service import notification_service
+
+
+def _slow_send(started, cancelled, seconds):
+    """Sustituye a `_send`: tarda `seconds` y anota qué proveedores empezaron y se cancelaron"""
+    async def send(provider, message, customer_id, deadline=None):
+        started.append(provider.key)
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(provider.key)
+            raise
+        return provider.key
+    return send
+
+
+def _cancel_after(delay, coro, cancelled):
+    """Cancela `coro` tras `delay` segundos; devuelve su tarea y los proveedores cancelados antes de cerrar el loop"""
+    async def run():
+        task = asyncio.ensure_future(coro)
+        await asyncio.sleep(delay)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Las tareas canceladas necesitan una vuelta del loop para procesar la cancelación
+        await asyncio.sleep(0.01)
+        # asyncio.run cancela lo que quede al terminar: se copia antes
+        return task, list(cancelled)
+    return asyncio.run(run())
+
+
+def test_cancelling_caller_during_hedge_delay_cancels_primary(monkeypatch):
+    started, cancelled = [], []
+    monkeypatch.setattr(notification_service, "_send", _slow_send(started, cancelled, 1.0))
+    monkeypatch.setattr(notification_service, "_hedge_delay", lambda provider: 0.5)
+
+    order = list(notification_service.providers)
+    task, cancelled = _cancel_after(0.05, notification_service._send_hedged(order, "hola", "c1"), cancelled)
+
+    assert task.cancelled()
+    assert started == [order[0].key]
+    assert cancelled == [order[0].key]
+
+
+def test_cancelling_caller_during_hedge_race_cancels_both(monkeypatch):
+    started, cancelled = [], []
+    monkeypatch.setattr(notification_service, "_send", _slow_send(started, cancelled, 1.0))
+    monkeypatch.setattr(notification_service, "_hedge_delay", lambda provider: 0.01)
+    monkeypatch.setattr(notification_service.hedge_budget, "try_spend", lambda: True)
+
+    order = list(notification_service.providers)
+    task, cancelled = _cancel_after(0.05, notification_service._send_hedged(order, "hola", "c1"), cancelled)
+
+    assert task.cancelled()
+    assert started == [order[0].key, order[1].key]
+    assert sorted(cancelled) == sorted(started)
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.idempotency import IdempotencyCache, IdempotencyKeyReusedError, MemoryIdempotencyStore
+
+
+def _cache():
+    return IdempotencyCache(MemoryIdempotencyStore(ttl=60.0, max_bytes=1 << 20))
+
+
+class Payment:
+    """Trabajo simulado que tarda hasta que se libera y cuenta sus ejecuciones"""
+
+    def __init__(self):
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        return {"payment_id": f"pmt_{self.runs}"}
+
+
+def test_concurrent_duplicates_run_once():
+    async def scenario():
+        cache = _cache()
+        payment = Payment()
+        calls = [asyncio.ensure_future(cache.run("k", "f", payment)) for _ in range(3)]
+        await asyncio.sleep(0)
+        payment.release.set()
+        results = await asyncio.gather(*calls)
+
+        assert payment.runs == 1
+        assert [replayed for _, replayed in results] == [False, True, True]
+        assert all(response == {"payment_id": "pmt_1"} for response, _ in results)
+        assert cache.stats()["coalesced"] == 2
+
+        # Un reintento posterior sale del almacén
+        assert await cache.run("k", "f", payment) == ({"payment_id": "pmt_1"}, True)
+        assert payment.runs == 1
+
+    asyncio.run(scenario())
+
+
+def test_reused_key_with_other_body_is_rejected():
+    async def scenario():
+        cache = _cache()
+        payment = Payment()
+        payment.release.set()
+        await cache.run("k", "f", payment)
+        with pytest.raises(IdempotencyKeyReusedError):
+            await cache.run("k", "otra", payment)
+
+    asyncio.run(scenario())
+
+
+def test_errors_are_not_stored():
+    async def scenario():
+        cache = _cache()
+
+        async def failing():
+            raise RuntimeError("proveedor caído")
+
+        with pytest.raises(RuntimeError):
+            await cache.run("k", "f", failing)
+        payment = Payment()
+        payment.release.set()
+        assert await cache.run("k", "f", payment) == ({"payment_id": "pmt_1"}, False)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_owner_hands_off_to_a_waiter():
+    async def scenario():
+        cache = _cache()
+        payment = Payment()
+        owner = asyncio.ensure_future(cache.run("k", "f", payment))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.run("k", "f", payment)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        await asyncio.sleep(0)
+        # Un solo relevo vuelve a ejecutar el pago; el otro se agrupa con él
+        assert payment.runs == 2
+        payment.release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert sorted(replayed for _, replayed in results) == [False, True]
+        assert all(response == {"payment_id": "pmt_2"} for response, _ in results)
+
+    asyncio.run(scenario())
+
+
+def test_admit_only_runs_for_new_executions():
+    async def scenario():
+        cache = _cache()
+        payment = Payment()
+        payment.release.set()
+        admitted = []
+        await cache.run("k", "f", payment, admit=lambda: admitted.append("k"))
+        await cache.run("k", "f", payment, admit=lambda: admitted.append("k"))
+        assert admitted == ["k"]
+
+        def reject():
+            raise RuntimeError("límite excedido")
+
+        with pytest.raises(RuntimeError):
+            await cache.run("otra", "f", payment, admit=reject)
+        assert payment.runs == 1
+        assert cache.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_memory_store_expires_entries():
+    now = [0.0]
+    store = MemoryIdempotencyStore(ttl=10.0, max_bytes=1 << 20, clock=lambda: now[0])
+
+    async def scenario():
+        await store.put("k", "f", {"payment_id": "pmt_1"})
+        now[0] = 9.0
+        assert await store.get("k") == ("f", {"payment_id": "pmt_1"})
+        now[0] = 10.5
+        assert await store.get("k") is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+import math
+import random
+
+from app.latency import AdaptiveTimeout, LatencyTracker
+
+
+def _call(timeout, tracker, rng, hang_rate, median=0.05):
+    """Una llamada simulada: latencia sana lognormal o un cuelgue cortado por el timeout; True si se cortó"""
+    if rng.random() < hang_rate:
+        tracker.observe_censored()
+        return True
+    latency = rng.lognormvariate(math.log(median), 0.5)
+    if latency >= timeout.value():
+        tracker.observe_censored()
+        return True
+    tracker.observe(latency)
+    return False
+
+
+def test_brownout_does_not_inflate_adaptive_timeout():
+    rng = random.Random(42)
+    tracker = LatencyTracker()
+    timeout = AdaptiveTimeout(tracker, percentile=0.99, multiplier=3.0, min_timeout=0.25, max_timeout=5.0)
+
+    for _ in range(500):
+        _call(timeout, tracker, rng, hang_rate=0.0)
+    healthy = timeout.value()
+    assert healthy < 1.0
+
+    # Brownout: el 5% de las llamadas se cuelga hasta el timeout
+    values = []
+    for _ in range(2000):
+        _call(timeout, tracker, rng, hang_rate=0.05)
+        values.append(timeout.value())
+    assert max(values) <= healthy * 1.5
+    assert tracker.censored >= 80
+
+    for _ in range(500):
+        _call(timeout, tracker, rng, hang_rate=0.0)
+    assert timeout.value() <= healthy * 1.5
+
+
+def test_censored_calls_do_not_move_quantiles():
+    tracker = LatencyTracker()
+    for _ in range(100):
+        tracker.observe(0.05)
+    before = tracker.quantile(0.99)
+    for _ in range(50):
+        tracker.observe_censored()
+    assert tracker.quantile(0.99) == before
+    assert tracker.count == 100
+    assert tracker.censored == 50
+
+
+def test_latency_shift_widens_adaptive_timeout():
+    rng = random.Random(7)
+    tracker = LatencyTracker()
+    timeout = AdaptiveTimeout(tracker, percentile=0.99, multiplier=3.0, min_timeout=0.25, max_timeout=5.0)
+
+    for _ in range(1000):
+        _call(timeout, tracker, rng, hang_rate=0.0)
+    assert timeout.value() < 1.0
+
+    # La latencia normal del proveedor pasa de 50 ms a 1 s: al principio todo se corta
+    cut = [_call(timeout, tracker, rng, hang_rate=0.0, median=1.0) for _ in range(1000)]
+    assert sum(cut[:20]) > 10
+    assert timeout.widened > 0
+    assert timeout.value() > 2.0
+    assert sum(cut[-500:]) < 10
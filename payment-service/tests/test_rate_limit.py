@@ -0,0 +1,72 @@
+import pytest
+
+from app.rate_limit import CustomerRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_rejects_with_wait_until_next_token():
+    clock = FakeClock()
+    limiter = CustomerRateLimiter(rate=2.0, burst=3, clock=clock)
+    assert [limiter.try_acquire("c1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.try_acquire("c1") == pytest.approx(0.5)
+    assert limiter.rejected == 1
+
+    # Un rechazo no consume: tras la espera indicada entra exactamente un pago más
+    clock.now += 0.5
+    assert limiter.try_acquire("c1") == 0.0
+    assert limiter.try_acquire("c1") == pytest.approx(0.5)
+
+
+def test_bucket_refills_up_to_burst_only():
+    clock = FakeClock()
+    limiter = CustomerRateLimiter(rate=2.0, burst=3, clock=clock)
+    for _ in range(3):
+        limiter.try_acquire("c1")
+    clock.now += 60.0
+    assert [limiter.try_acquire("c1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.try_acquire("c1") > 0
+
+
+def test_customers_are_limited_independently():
+    clock = FakeClock()
+    limiter = CustomerRateLimiter(rate=1.0, burst=1, clock=clock)
+    assert limiter.try_acquire("c1") == 0.0
+    assert limiter.try_acquire("c1") > 0
+    assert limiter.try_acquire("c2") == 0.0
+
+
+def test_invalid_configuration_is_rejected():
+    with pytest.raises(ValueError):
+        CustomerRateLimiter(rate=0.0, burst=1)
+    with pytest.raises(ValueError):
+        CustomerRateLimiter(rate=1.0, burst=0)
+    with pytest.raises(ValueError):
+        CustomerRateLimiter(rate=1.0, burst=1, shards=3)
+
+
+def test_sweep_drops_idle_customers():
+    clock = FakeClock()
+    limiter = CustomerRateLimiter(rate=1.0, burst=1, shards=1, min_sweep_size=4, clock=clock)
+    for i in range(4):
+        limiter.try_acquire(f"c{i}")
+    clock.now += 2.0
+    # El quinto cliente dispara el barrido: los cuatro anteriores ya tienen el bucket lleno
+    limiter.try_acquire("c4")
+    assert len(limiter) == 1
+    assert limiter.evicted_idle == 4
+
+
+def test_memory_is_bounded_with_only_active_customers():
+    clock = FakeClock()
+    limiter = CustomerRateLimiter(rate=1.0, burst=1, shards=1, max_entries=64, min_sweep_size=16, clock=clock)
+    for i in range(1000):
+        limiter.try_acquire(f"c{i}")
+    assert len(limiter) <= 64
+    assert limiter.evicted_active > 0
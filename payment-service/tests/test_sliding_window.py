@@ -0,0 +1,49 @@
+import pytest
+
+from app.sliding_window import CountSlidingWindow, TimeSlidingWindow, build_window
+
+
+def test_count_window_evicts_oldest_outcomes():
+    window = CountSlidingWindow(3)
+    window.record(True, True, 0.0)
+    window.record(False, False, 0.0)
+    window.record(True, False, 0.0)
+    assert window.totals(0.0) == (3, 2, 1)
+
+    # La primera llamada (fallida y lenta) sale de la ventana
+    window.record(False, False, 0.0)
+    assert window.totals(0.0) == (3, 1, 0)
+    window.record(False, True, 0.0)
+    window.record(False, False, 0.0)
+    assert window.totals(0.0) == (3, 0, 1)
+
+
+def test_time_window_evicts_expired_buckets():
+    window = TimeSlidingWindow(3)
+    window.record(True, False, 100.2)
+    window.record(False, True, 101.5)
+    window.record(False, False, 102.9)
+    assert window.totals(102.9) == (3, 1, 1)
+
+    # En el segundo 103 sale la cubeta del 100
+    assert window.totals(103.0) == (2, 0, 1)
+    assert window.totals(104.0) == (1, 0, 0)
+    # Un salto mayor que la ventana la vacía entera
+    window.record(True, False, 104.5)
+    assert window.totals(110.0) == (0, 0, 0)
+
+
+def test_reset_clears_window():
+    for window in (CountSlidingWindow(5), TimeSlidingWindow(5)):
+        window.record(True, True, 10.0)
+        window.reset()
+        assert window.totals(10.0) == (0, 0, 0)
+
+
+def test_build_window_rejects_unknown_types_and_sizes():
+    assert isinstance(build_window("count", 5), CountSlidingWindow)
+    assert isinstance(build_window("time", 5), TimeSlidingWindow)
+    with pytest.raises(ValueError):
+        build_window("sessions", 5)
+    with pytest.raises(ValueError):
+        build_window("count", 0)
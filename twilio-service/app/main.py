@@ -1,12 +1,24 @@
 import logging
 import random
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Body, FastAPI, HTTPException, Request, Response, Query
 from pydantic import BaseModel, Field
+from typing import List, Optional
 from fastapi.openapi.utils import get_openapi
 from .config import settings
+from .metrics import Counter, instrument_app
+from .scenarios import ScenarioEngine, request_deadline
+from .serialization import CodecError, RawJSONResponse, StructField, dumps, struct, validation_error_response
+from .structured_logging import setup_logging
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (cola no bloqueante; las entregas exitosas se muestrean)
+setup_logging(
+    "twilio-service",
+    level=settings.LOG_LEVEL,
+    log_format=settings.LOG_FORMAT,
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    sampled_events=("notification_delivered", "notification_batch"),
+    queue_size=settings.LOG_QUEUE_SIZE
+)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -18,6 +30,18 @@ app = FastAPI(
     openapi_url="/openapi.json"
 )
 
+# Middleware de métricas y endpoint /metrics
+instrument_app(app)
+
+NOTIFICATIONS = Counter("notifications_total", "Notificaciones procesadas por resultado", ["outcome"])
+NOTIFICATIONS_DELIVERED = NOTIFICATIONS.labels("delivered")
+NOTIFICATIONS_FAILED = NOTIFICATIONS.labels("failed")
+
+# Escenario de fallos y latencia (por defecto: latencia fija y FAILURE_RATE)
+scenarios = ScenarioEngine(settings.LATENCY, settings.FAILURE_RATE, settings.SCENARIO_SEED)
+if settings.SCENARIO_FILE:
+    scenarios.load_file(settings.SCENARIO_FILE)
+
 
 class NotificationRequest(BaseModel):
     message: str = Field(..., description="Mensaje que será enviado al cliente",
@@ -50,6 +74,26 @@ class NotificationResponse(BaseModel):
     }
 
 
+# Estructura compilada equivalente a NotificationRequest para el camino rápido
+NotificationIn = struct("NotificationIn", message=StructField(str), customer_id=StructField(str))
+
+
+class BatchNotificationRequest(BaseModel):
+    notifications: List[NotificationRequest] = Field(..., description="Notificaciones que se enviarán en el lote")
+
+
+class BatchItemResult(BaseModel):
+    customer_id: str = Field(..., description="ID del cliente del elemento")
+    status: str = Field(..., description="delivered o failed", example="delivered")
+    message_id: Optional[str] = Field(None, description="ID del mensaje si se entregó")
+    error: Optional[str] = Field(None, description="Motivo del fallo si no se entregó")
+
+
+class BatchNotificationResponse(BaseModel):
+    provider: str = Field(..., description="Proveedor que procesó el lote", example="Twilio")
+    results: List[BatchItemResult] = Field(..., description="Resultado de cada notificación, en el mismo orden")
+
+
 @app.get("/",
          summary="Información del servicio",
          description="Obtiene información básica sobre el servicio de notificaciones Twilio",
@@ -73,53 +117,143 @@ async def health_check():
     return {"status": "healthy"}
 
 
-@app.post("/notify",
-          response_model=NotificationResponse,
-          summary="Enviar notificación",
-          description="Envía una notificación a un cliente a través del servicio Twilio",
-          tags=["Notificaciones"],
-          responses={
-              200: {"description": "Notificación enviada con éxito"},
-              500: {"description": "Error al enviar la notificación"}
-          })
-async def send_notification(notification: NotificationRequest):
-    # Simular fallas aleatorias basadas en el FAILURE_RATE configurado
-    if random.random() < settings.FAILURE_RATE:
-        logger.error(f"Simulando falla en el servicio Twilio")
-        raise HTTPException(status_code=500, detail="Error al enviar notificación con Twilio")
+NOTIFY_ROUTE = {
+    "response_model": NotificationResponse,
+    "summary": "Enviar notificación",
+    "description": "Envía una notificación a un cliente a través del servicio Twilio",
+    "tags": ["Notificaciones"],
+    "responses": {
+        200: {"description": "Notificación enviada con éxito"},
+        500: {"description": "Error al enviar la notificación"}
+    },
+}
 
-    # Procesar la notificación (simulado)
-    logger.info(f"Enviando notificación a través de Twilio para el cliente {notification.customer_id}")
-    logger.info(f"Mensaje: {notification.message}")
 
-    # Simular un pequeño retardo para enviar la notificación
-    import asyncio
-    await asyncio.sleep(0.1)
+async def send_notification(notification: NotificationRequest, request: Request):
+    with scenarios.request() as outcome:
+        # Simular fallas aleatorias según el escenario vigente
+        if outcome.fault == "error":
+            logger.error("Simulando falla en el servicio Twilio", extra={"event": "notification_failed"})
+            NOTIFICATIONS_FAILED.inc()
+            raise HTTPException(status_code=500, detail="Error al enviar notificación con Twilio")
+
+        # Simular el tiempo de respuesta (o un timeout o cuelgue) sin pasar del deadline del llamador
+        await outcome.wait(request, request_deadline(request))
+
+    # Procesar la notificación (simulado)
+    logger.info("Enviando notificación a través de Twilio para el cliente %s", notification.customer_id,
+                extra={"event": "notification_delivered", "customer_id": notification.customer_id})
 
-    return {
+    NOTIFICATIONS_DELIVERED.inc()
+    return outcome.respond({
         "provider": "Twilio",
         "status": "delivered",
         "message_id": f"twilio_{random.randint(1000, 9999)}_{notification.customer_id}"
-    }
+    })
+
+
+async def send_notification_fast(request: Request):
+    """/notify sin Pydantic: decodifica a NotificationIn y devuelve los bytes de la respuesta"""
+    try:
+        notification = NotificationIn.decode(await request.body())
+    except CodecError as e:
+        return validation_error_response(e)
+    result = await send_notification(notification, request)
+    return result if isinstance(result, Response) else RawJSONResponse(dumps(result))
+
+
+# Con FAST_PATH_ENABLED el mismo endpoint se sirve sin validación de Pydantic
+if settings.FAST_PATH_ENABLED:
+    app.post("/notify", response_class=RawJSONResponse, openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": NotificationRequest.model_json_schema()}}
+    }}, **NOTIFY_ROUTE)(send_notification_fast)
+else:
+    app.post("/notify", **NOTIFY_ROUTE)(send_notification)
+
+
+@app.post("/notify/batch",
+          response_model=BatchNotificationResponse,
+          summary="Enviar notificaciones por lotes",
+          description="Envía varias notificaciones en una sola llamada; cada elemento puede fallar por separado",
+          tags=["Notificaciones"],
+          responses={
+              200: {"description": "Lote procesado; revisar el estado de cada elemento"}
+          })
+async def send_notification_batch(batch: BatchNotificationRequest, request: Request):
+    """
+    Procesa un lote de notificaciones. Los fallos simulados se aplican a cada
+    elemento por separado y la latencia es la de una sola notificación.
+    """
+    logger.info("Enviando lote de %d notificaciones a través de Twilio", len(batch.notifications),
+                extra={"event": "notification_batch", "size": len(batch.notifications)})
+
+    # Un lote tarda lo mismo que una notificación individual
+    with scenarios.request(batch=True) as outcome:
+        await outcome.wait(request, request_deadline(request))
+
+    results = []
+    for notification in batch.notifications:
+        if outcome.item_failed():
+            NOTIFICATIONS_FAILED.inc()
+            results.append({
+                "customer_id": notification.customer_id,
+                "status": "failed",
+                "error": "Error al enviar notificación con Twilio"
+            })
+        else:
+            NOTIFICATIONS_DELIVERED.inc()
+            results.append({
+                "customer_id": notification.customer_id,
+                "status": "delivered",
+                "message_id": f"twilio_{random.randint(1000, 9999)}_{notification.customer_id}"
+            })
+
+    return outcome.respond({"provider": "Twilio", "results": results})
 
 
 @app.post("/toggle-failure",
-          summary="Modificar tasa de fallos",
-          description="Cambia la tasa de fallos del servicio para pruebas",
+          summary="Modificar tasa de fallos o escenario",
+          description="Cambia la tasa de fallos del servicio o carga un escenario de fallos y latencia para pruebas",
           tags=["Configuración"],
           responses={
-              200: {"description": "Tasa de fallos actualizada correctamente"}
+              200: {"description": "Configuración actualizada correctamente"},
+              422: {"description": "Escenario inválido"}
           })
-async def toggle_failure(failure_rate: float = Query(
-    ...,
-    description="Tasa de fallos entre 0.0 (sin fallos) y 1.0 (siempre falla)",
-    ge=0.0,
-    le=1.0)):
-    """Endpoint para cambiar la tasa de fallos (para pruebas)"""
-    old_rate = settings.FAILURE_RATE
-    settings.FAILURE_RATE = max(0.0, min(1.0, failure_rate))  # Asegurar que esté entre 0 y 1
-    logger.info(f"Tasa de fallos de Twilio cambiada de {old_rate} a {settings.FAILURE_RATE}")
-    return {"status": "updated", "failure_rate": settings.FAILURE_RATE}
+async def toggle_failure(
+    failure_rate: Optional[float] = Query(
+        None,
+        description="Tasa de fallos entre 0.0 (sin fallos) y 1.0 (siempre falla)",
+        ge=0.0,
+        le=1.0),
+    scenario: Optional[dict] = Body(
+        None,
+        description="Escenario JSON (ver app/scenarios.py); {} vuelve al escenario por defecto",
+        examples=[{"seed": 42, "latency": {"distribution": "lognormal", "median": 0.1, "sigma": 0.5},
+                   "phases": [{"duration": 30, "faults": {"error": 1.0}},
+                              {"duration": 60, "ramp": True}]}])
+):
+    """Endpoint para cambiar la tasa de fallos o el escenario (para pruebas)"""
+    if scenario is not None:
+        try:
+            scenarios.load(scenario)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Escenario inválido: {e}")
+        logger.info("Escenario de Twilio cargado", extra={"event": "scenario_loaded"})
+    if failure_rate is not None:
+        old_rate = settings.FAILURE_RATE
+        settings.FAILURE_RATE = max(0.0, min(1.0, failure_rate))  # Asegurar que esté entre 0 y 1
+        scenarios.set_failure_rate(settings.FAILURE_RATE)
+        logger.info("Tasa de fallos de Twilio cambiada de %s a %s", old_rate, settings.FAILURE_RATE)
+    return {"status": "updated", "failure_rate": settings.FAILURE_RATE, "scenario": scenarios.describe()}
+
+
+@app.get("/scenario",
+         summary="Escenario vigente",
+         description="Muestra la fase, las probabilidades de fallo y la latencia del escenario vigente",
+         tags=["Configuración"])
+async def get_scenario():
+    return scenarios.describe()
 
 
 def custom_openapi():
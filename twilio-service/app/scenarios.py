@@ -0,0 +1,405 @@
+"""
+Motor de escenarios de fallos y latencia del simulador.
+
+Un escenario es un JSON que describe cómo responde el proveedor:
+
+    {
+      "seed": 42,
+      "latency": {"distribution": "lognormal", "median": 0.2, "sigma": 0.5, "max": 5},
+      "latency_multiplier": 1.0,
+      "faults": {"error": 0.05, "timeout": 0.01, "hang": 0, "reset": 0.01, "slow_drip": 0},
+      "timeout_after": 30,
+      "drip": {"chunks": 10, "interval": 0.5},
+      "capacity": {"limit": 50, "exponent": 1.0},
+      "phases": [
+        {"name": "caída", "duration": 30, "faults": {"error": 1.0}},
+        {"name": "recuperación", "duration": 60, "ramp": true, "latency_multiplier": 1.0}
+      ],
+      "repeat": false
+    }
+
+Distribuciones de latencia (segundos, opcionalmente acotadas con "max"):
+fixed (value), uniform (min, max), lognormal (median, sigma), pareto (scale,
+alpha; cola pesada) y bimodal (fast, slow: distribuciones; slow_probability).
+
+Fallos, elegidos por solicitud con su probabilidad:
+- error: 500 inmediato (en los lotes se aplica a cada elemento por separado);
+- timeout: espera `timeout_after` segundos y responde 504;
+- hang: no responde hasta que el cliente se desconecta;
+- reset: envía la mitad de la respuesta y cierra la conexión;
+- slow_drip: envía la respuesta en `drip.chunks` trozos separados por `drip.interval`.
+
+Con "capacity" la latencia crece con la concurrencia: se multiplica por
+(en curso / limit) ** exponent cuando hay más de `limit` solicitudes en curso.
+
+Las fases se aplican en orden desde que se carga el escenario. Cada una parte de
+la configuración base y sobrescribe lo que declare; con "ramp" las
+probabilidades de fallo y `latency_multiplier` pasan gradualmente de los valores
+de la fase anterior a los suyos. Al terminar la última fase sus valores se
+mantienen, o las fases vuelven a empezar con "repeat".
+
+Todas las decisiones aleatorias salen de un generador con `seed`, así que la
+misma secuencia de solicitudes produce los mismos fallos y latencias.
+
+Si el llamador envía su presupuesto en la cabecera X-Deadline-Ms, la espera
+simulada (latencia, timeout o cuelgue) se abandona con 504 en cuanto vence, y una
+solicitud que llega ya vencida se rechaza sin hacer ningún trabajo: el llamador
+ya no espera la respuesta y el simulador no gasta capacidad en ella.
+
+Este módulo es idéntico en los dos simuladores.
+"""
+import asyncio
+import copy
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .metrics import Counter, Gauge
+
+FAULTS = ("error", "timeout", "hang", "reset", "slow_drip")
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+SCENARIO_FAULTS = Counter("scenario_faults_total", "Fallos inyectados por el escenario", ["fault"])
+SCENARIO_IN_FLIGHT = Gauge("scenario_in_flight", "Solicitudes en curso según el modelo de capacidad")
+_FAULT_COUNTERS = {fault: SCENARIO_FAULTS.labels(fault) for fault in FAULTS}
+DEADLINE_EXPIRED = Counter(
+    "deadline_expired_total", "Solicitudes abandonadas porque venció el deadline del llamador", ["stage"]
+)
+_EXPIRED_ON_ARRIVAL = DEADLINE_EXPIRED.labels("arrival")
+_EXPIRED_IN_PROGRESS = DEADLINE_EXPIRED.labels("in_progress")
+
+_DEFAULTS = {
+    "latency_multiplier": 1.0,
+    "faults": {fault: 0.0 for fault in FAULTS},
+    "timeout_after": 30.0,
+    "drip": {"chunks": 10, "interval": 0.5},
+    "capacity": {"limit": None, "exponent": 1.0},
+}
+_SECTIONS = ("faults", "drip", "capacity")
+_VALUES = ("latency", "latency_multiplier", "timeout_after")
+
+
+def _take(spec: dict, key: str, kind: str):
+    try:
+        return spec.pop(key)
+    except KeyError:
+        raise ValueError(f"La distribución {kind} necesita el parámetro '{key}'") from None
+
+
+def build_distribution(spec: dict):
+    """Convierte la descripción de una distribución en una función rng -> segundos"""
+    if not isinstance(spec, dict):
+        raise ValueError("La latencia debe ser un objeto con 'distribution'")
+    spec = dict(spec)
+    kind = spec.pop("distribution", "fixed")
+    cap = spec.pop("max", None) if kind != "uniform" else None
+
+    if kind == "fixed":
+        value = float(_take(spec, "value", kind))
+        sample = lambda rng: value  # noqa: E731
+    elif kind == "uniform":
+        low, high = float(_take(spec, "min", kind)), float(_take(spec, "max", kind))
+        sample = lambda rng: rng.uniform(low, high)  # noqa: E731
+    elif kind == "lognormal":
+        mu, sigma = math.log(float(_take(spec, "median", kind))), float(_take(spec, "sigma", kind))
+        sample = lambda rng: rng.lognormvariate(mu, sigma)  # noqa: E731
+    elif kind == "pareto":
+        scale, alpha = float(_take(spec, "scale", kind)), float(_take(spec, "alpha", kind))
+        sample = lambda rng: scale * rng.paretovariate(alpha)  # noqa: E731
+    elif kind == "bimodal":
+        fast, slow = build_distribution(_take(spec, "fast", kind)), build_distribution(_take(spec, "slow", kind))
+        slow_probability = float(_take(spec, "slow_probability", kind))
+        sample = lambda rng: slow(rng) if rng.random() < slow_probability else fast(rng)  # noqa: E731
+    else:
+        raise ValueError(f"Distribución de latencia desconocida: {kind}")
+
+    if spec:
+        raise ValueError(f"Parámetros desconocidos en la distribución {kind}: {sorted(spec)}")
+    if cap is None:
+        return sample
+    cap = float(cap)
+    return lambda rng: min(sample(rng), cap)
+
+
+def _resolve(base: dict, overrides: dict) -> dict:
+    """Aplica `overrides` sobre una configuración ya resuelta y la valida"""
+    params = {key: dict(value) if key in _SECTIONS else value for key, value in base.items()}
+    for key, value in overrides.items():
+        if key in _SECTIONS:
+            unknown = set(value) - set(_DEFAULTS[key])
+            if unknown:
+                raise ValueError(f"Claves desconocidas en '{key}': {sorted(unknown)}")
+            params[key].update(value)
+        elif key in _VALUES:
+            params[key] = value
+        else:
+            raise ValueError(f"Clave desconocida en el escenario: '{key}'")
+
+    faults = params["faults"] = {fault: float(p) for fault, p in params["faults"].items()}
+    if any(not 0.0 <= p <= 1.0 for p in faults.values()) or sum(faults.values()) > 1.0 + 1e-9:
+        raise ValueError("Las probabilidades de fallo deben estar entre 0 y 1 y sumar como mucho 1")
+    params["latency_multiplier"] = float(params["latency_multiplier"])
+    params["timeout_after"] = float(params["timeout_after"])
+    if params["drip"]["chunks"] < 1:
+        raise ValueError("drip.chunks debe ser al menos 1")
+    limit = params["capacity"]["limit"]
+    if limit is not None and limit < 1:
+        raise ValueError("capacity.limit debe ser al menos 1")
+    params["sample"] = build_distribution(params["latency"])
+    return params
+
+
+def _interpolate(start: dict, end: dict, fraction: float) -> dict:
+    params = dict(end)
+    params["faults"] = {
+        fault: start["faults"][fault] + (p - start["faults"][fault]) * fraction
+        for fault, p in end["faults"].items()
+    }
+    params["latency_multiplier"] = (
+        start["latency_multiplier"] + (end["latency_multiplier"] - start["latency_multiplier"]) * fraction
+    )
+    return params
+
+
+class Phase:
+    __slots__ = ("name", "start", "end", "start_params", "params", "ramp")
+
+    def __init__(self, name, start, end, start_params, params, ramp):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.start_params = start_params
+        self.params = params
+        self.ramp = ramp
+
+
+class Scenario:
+    """Escenario compilado: configuración base, fases y generador aleatorio"""
+
+    def __init__(self, spec: dict, default_latency: float, seed=None):
+        if not isinstance(spec, dict):
+            raise ValueError("El escenario debe ser un objeto JSON")
+        self.spec = copy.deepcopy(spec)
+        spec = copy.deepcopy(spec)
+        self.seed = spec.pop("seed", seed)
+        self.repeat = bool(spec.pop("repeat", False))
+        phases = spec.pop("phases", [])
+
+        defaults = dict(_DEFAULTS, latency={"distribution": "fixed", "value": default_latency})
+        self.base = _resolve(defaults, spec)
+
+        self.phases = []
+        start, previous = 0.0, self.base
+        for index, phase in enumerate(phases):
+            phase = dict(phase)
+            name = phase.pop("name", f"fase {index + 1}")
+            duration = float(phase.pop("duration", 0))
+            if duration <= 0:
+                raise ValueError(f"La fase '{name}' necesita una duración positiva")
+            ramp = bool(phase.pop("ramp", False))
+            params = _resolve(self.base, phase)
+            self.phases.append(Phase(name, start, start + duration, previous, params, ramp))
+            start, previous = start + duration, params
+        self.total_duration = start
+        self.final = previous
+
+        self.rng = random.Random(self.seed)
+        self.started = time.monotonic()
+
+    def current(self):
+        """(fase, configuración) vigentes; la fase es None fuera de las fases"""
+        if not self.phases:
+            return None, self.base
+        elapsed = time.monotonic() - self.started
+        if self.repeat:
+            elapsed %= self.total_duration
+        for phase in self.phases:
+            if elapsed < phase.end:
+                if not phase.ramp:
+                    return phase, phase.params
+                fraction = (elapsed - phase.start) / (phase.end - phase.start)
+                return phase, _interpolate(phase.start_params, phase.params, fraction)
+        return None, self.final
+
+
+def request_deadline(request):
+    """Instante (time.monotonic) en que vence el deadline de la solicitud; None sin cabecera válida"""
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(milliseconds):
+        return None
+    return time.monotonic() + max(0.0, milliseconds) / 1000
+
+
+def _deadline_expired(counter):
+    counter.inc()
+    return HTTPException(status_code=504, detail="Deadline del llamador vencido; trabajo abandonado")
+
+
+async def _sleep(seconds: float, deadline=None):
+    """Duerme `seconds` o hasta el deadline, y en ese caso abandona con 504"""
+    if deadline is not None and time.monotonic() + seconds > deadline:
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+        raise _deadline_expired(_EXPIRED_IN_PROGRESS)
+    await asyncio.sleep(seconds)
+
+
+class Outcome:
+    """Lo que el escenario decidió para una solicitud"""
+
+    __slots__ = ("engine", "params", "fault", "latency")
+
+    def __init__(self, engine, params, fault, latency):
+        self.engine = engine
+        self.params = params
+        self.fault = fault
+        self.latency = latency
+
+    async def wait(self, request=None, deadline=None):
+        """
+        Simula el tiempo de respuesta; los timeouts y cuelgues terminan en excepción.
+        Con `deadline` (ver request_deadline) la espera no pasa de él.
+        """
+        if deadline is not None and time.monotonic() >= deadline:
+            raise _deadline_expired(_EXPIRED_ON_ARRIVAL)
+        if self.fault == "timeout":
+            await _sleep(self.params["timeout_after"], deadline)
+            raise HTTPException(status_code=504, detail="Tiempo de espera agotado en el proveedor (simulado)")
+        if self.fault == "hang":
+            # Sin respuesta mientras el cliente siga conectado
+            while request is None or not await request.is_disconnected():
+                await _sleep(0.5, deadline)
+            raise HTTPException(status_code=504, detail="El proveedor no respondió (simulado)")
+        await _sleep(self.latency, deadline)
+
+    def item_failed(self) -> bool:
+        """Decide si un elemento de un lote falla, con la probabilidad de error vigente"""
+        return self.engine.scenario.rng.random() < self.params["faults"]["error"]
+
+    def respond(self, body: dict):
+        """Devuelve el cuerpo tal cual o una respuesta que reinicia la conexión o gotea"""
+        if self.fault == "reset":
+            return _reset_response(body)
+        if self.fault == "slow_drip":
+            drip = self.params["drip"]
+            return _drip_response(self.engine, body, drip["chunks"], drip["interval"])
+        return body
+
+
+def _encode(body: dict) -> bytes:
+    return json.dumps(body).encode()
+
+
+def _reset_response(body: dict):
+    content = _encode(body)
+
+    async def stream():
+        yield content[:len(content) // 2]
+        # El servidor cierra la conexión con la respuesta a medias
+        raise ConnectionResetError("Conexión reiniciada por el escenario")
+
+    return StreamingResponse(stream(), media_type="application/json",
+                             headers={"Content-Length": str(len(content))})
+
+
+def _drip_response(engine, body: dict, chunks: int, interval: float):
+    content = _encode(body)
+    size = max(1, math.ceil(len(content) / chunks))
+
+    async def stream():
+        # El goteo sigue ocupando capacidad después de que el endpoint retorna
+        engine.in_flight += 1
+        try:
+            for offset in range(0, len(content), size):
+                if offset:
+                    await asyncio.sleep(interval)
+                yield content[offset:offset + size]
+        finally:
+            engine.in_flight -= 1
+
+    return StreamingResponse(stream(), media_type="application/json",
+                             headers={"Content-Length": str(len(content))})
+
+
+class ScenarioEngine:
+    """Escenario vigente del simulador; `load` lo sustituye y reinicia sus fases"""
+
+    def __init__(self, default_latency: float, failure_rate: float = 0.0, seed=None):
+        self.default_latency = default_latency
+        self.seed = seed
+        self.in_flight = 0
+        self.scenario = None
+        self.load({"faults": {"error": failure_rate}})
+        SCENARIO_IN_FLIGHT.set_function(lambda: self.in_flight)
+
+    def load(self, spec: dict):
+        self.scenario = Scenario(spec, self.default_latency, self.seed)
+        return self.scenario
+
+    def load_file(self, path: str):
+        with open(path) as f:
+            return self.load(json.load(f))
+
+    def set_failure_rate(self, failure_rate: float):
+        """Cambia la probabilidad base de error conservando el resto del escenario"""
+        spec = copy.deepcopy(self.scenario.spec)
+        spec.setdefault("faults", {})["error"] = failure_rate
+        return self.load(spec)
+
+    def draw(self, batch: bool = False) -> Outcome:
+        scenario = self.scenario
+        _, params = scenario.current()
+        rng = scenario.rng
+
+        fault = None
+        roll = rng.random()
+        for name in FAULTS:
+            if batch and name == "error":
+                # En los lotes el error se decide por elemento
+                continue
+            probability = params["faults"][name]
+            if roll < probability:
+                fault = name
+                _FAULT_COUNTERS[name].inc()
+                break
+            roll -= probability
+
+        latency = params["sample"](rng) * params["latency_multiplier"]
+        limit = params["capacity"]["limit"]
+        if limit is not None and self.in_flight > limit:
+            latency *= (self.in_flight / limit) ** params["capacity"]["exponent"]
+        return Outcome(self, params, fault, latency)
+
+    @contextmanager
+    def request(self, batch: bool = False):
+        """Cuenta la solicitud como en curso y decide su resultado"""
+        self.in_flight += 1
+        try:
+            yield self.draw(batch)
+        finally:
+            self.in_flight -= 1
+
+    def describe(self):
+        scenario = self.scenario
+        phase, params = scenario.current()
+        return {
+            "seed": scenario.seed,
+            "phase": phase.name if phase else None,
+            "elapsed_s": round(time.monotonic() - scenario.started, 3),
+            "repeat": scenario.repeat,
+            "in_flight": self.in_flight,
+            "latency": params["latency"],
+            "latency_multiplier": round(params["latency_multiplier"], 4),
+            "faults": {fault: round(p, 4) for fault, p in params["faults"].items()},
+            "spec": scenario.spec,
+        }
@@ -0,0 +1,155 @@
+"""
+Serialización rápida para los endpoints calientes (opt-in con FAST_PATH_ENABLED).
+
+Por defecto FastAPI valida el cuerpo con Pydantic, construye el modelo y vuelve a
+validar la salida con `response_model`. En el camino rápido:
+
+- el cuerpo se decodifica con orjson (con json si no está instalado) a una
+  estructura con `__slots__` compilada de antemano con `struct`, que solo
+  comprueba el tipo de cada campo;
+- la respuesta se codifica una sola vez a bytes y se devuelve con
+  RawJSONResponse, sin una segunda validación.
+
+La codificación es JSON compacto con los campos en orden de declaración, la
+misma que produce `model_dump_json` de Pydantic para los mismos datos.
+
+Este módulo es idéntico en los tres servicios.
+"""
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    loads = orjson.loads
+    dumps = orjson.dumps
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    loads = json.loads
+
+    def dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode()
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+_REQUIRED = object()
+_MISSING = object()
+
+
+class CodecError(ValueError):
+    """Cuerpo inválido; `errors` sigue el formato de los errores 422 de FastAPI"""
+
+    def __init__(self, errors):
+        super().__init__(errors[0]["msg"])
+        self.errors = errors
+
+
+class RawJSONResponse(Response):
+    """Respuesta con un cuerpo JSON ya codificado a bytes"""
+
+    media_type = "application/json"
+
+
+def validation_error_response(error: CodecError) -> RawJSONResponse:
+    return RawJSONResponse(dumps({"detail": error.errors}), status_code=422)
+
+
+class StructField:
+    __slots__ = ("kind", "default")
+
+    def __init__(self, kind, default=_REQUIRED):
+        self.kind = kind
+        self.default = default
+
+
+def _converter(kind):
+    """Función que acepta o convierte un valor JSON del tipo `kind`; TypeError si no encaja"""
+    if kind is float:
+        def convert(value):
+            value_type = type(value)
+            if value_type is float:
+                return value
+            if value_type is int:
+                return float(value)
+            raise TypeError("Input should be a valid number")
+    else:
+        message = {str: "Input should be a valid string", int: "Input should be a valid integer",
+                   bool: "Input should be a valid boolean"}[kind]
+
+        def convert(value):
+            if type(value) is not kind:
+                raise TypeError(message)
+            return value
+    return convert
+
+
+def struct(name: str, **fields):
+    """
+    Crea una clase con `__slots__` para los campos dados (nombre=StructField(tipo[, default]))
+    con `decode(bytes)`, `to_dict()` y `encode()`. Los campos desconocidos se ignoran.
+    """
+    names = tuple(fields)
+    cls = type(name, (), {"__slots__": names})
+    specs = tuple(
+        (field_name, getattr(cls, field_name).__set__, _converter(field.kind), field.default)
+        for field_name, field in fields.items()
+    )
+
+    def __init__(self, *args, **kwargs):
+        values = dict(zip(names, args), **kwargs)
+        for field_name, setter, _, default in specs:
+            value = values.get(field_name, default)
+            if value is _REQUIRED:
+                raise TypeError(f"{name} necesita el campo '{field_name}'")
+            setter(self, value)
+
+    @classmethod
+    def decode(cls, body: bytes):
+        try:
+            data = loads(body)
+        except ValueError:
+            raise CodecError([{"type": "json_invalid", "loc": ["body"], "msg": "JSON decode error"}]) from None
+        if type(data) is not dict:
+            raise CodecError([{"type": "model_attributes_type", "loc": ["body"],
+                               "msg": "Input should be a valid dictionary or object to extract fields from"}])
+
+        obj = cls.__new__(cls)
+        errors = None
+        for field_name, setter, convert, default in specs:
+            value = data.get(field_name, _MISSING)
+            if value is _MISSING:
+                if default is _REQUIRED:
+                    errors = (errors or []) + [{"type": "missing", "loc": ["body", field_name],
+                                                "msg": "Field required"}]
+                    continue
+                value = default
+            elif value is not None or default is not None:
+                try:
+                    value = convert(value)
+                except TypeError as e:
+                    errors = (errors or []) + [{"type": "type_error", "loc": ["body", field_name], "msg": str(e)}]
+                    continue
+            setter(obj, value)
+        if errors:
+            raise CodecError(errors)
+        return obj
+
+    def to_dict(self):
+        return {field_name: getattr(self, field_name) for field_name in names}
+
+    def encode(self) -> bytes:
+        return dumps(self.to_dict())
+
+    def __repr__(self):
+        return f"{name}({', '.join(f'{field_name}={getattr(self, field_name)!r}' for field_name in names)})"
+
+    cls.__init__ = __init__
+    cls.decode = decode
+    cls.to_dict = to_dict
+    cls.encode = encode
+    cls.__repr__ = __repr__
+    return cls
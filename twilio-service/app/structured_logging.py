@@ -0,0 +1,139 @@
+"""
+Logging estructurado y no bloqueante.
+
+Los registros se encolan sin formatear en una cola acotada y un hilo en segundo
+plano (QueueListener) los formatea y los escribe, de modo que el event loop solo
+paga la creación del LogRecord. Los mensajes usan el formato perezoso de logging
+(`logger.info("... %s", valor)`), que se resuelve en ese hilo y solo para los
+registros que se escriben. Con `log_format="json"` cada registro es una línea
+JSON con los campos pasados en `extra`.
+
+Los eventos frecuentes del camino de éxito se marcan con `extra={"event": ...}` y
+se muestrean: cada evento de `sampled_events` se conserva con probabilidad
+`sample_rate`. Los WARNING y ERROR y los registros sin un evento muestreado
+(transiciones del circuito, arranque...) se conservan siempre. Si la cola está
+llena el registro se descarta y se cuenta en lugar de bloquear el event loop.
+
+Este módulo es idéntico en los tres servicios.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Atributos propios de LogRecord; el resto son campos de `extra`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Conserva los eventos de `events` con probabilidad `sample_rate`; el resto pasa siempre"""
+
+    def __init__(self, sample_rate: float, events=()):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.events = frozenset(events)
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, "event", None) not in self.events:
+            return True
+        if random.random() < self.sample_rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Encola el registro sin formatearlo y lo descarta si la cola está llena"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # El mensaje y la excepción se formatean en el hilo del QueueListener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self, handler: NonBlockingQueueHandler, sampler: SamplingFilter, listener: QueueListener):
+        self.handler = handler
+        self.sampler = sampler
+        self.listener = listener
+        self._running = True
+
+    def stop(self):
+        """Escribe lo pendiente y detiene el hilo (se llama también al salir del proceso)"""
+        if self._running:
+            self._running = False
+            self.listener.stop()
+
+    def stats(self):
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+            "sample_rate": self.sampler.sample_rate,
+        }
+
+
+_pipeline = None
+
+
+def setup_logging(service: str, level: str = "INFO", log_format: str = "json", sample_rate: float = 1.0,
+                  sampled_events=(), queue_size: int = 10000, stream=None) -> LogPipeline:
+    """Sustituye los handlers del logger raíz por la cola; las llamadas repetidas devuelven el mismo pipeline"""
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(service) if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    sampler = SamplingFilter(sample_rate, sampled_events)
+    handler.addFilter(sampler)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    _pipeline = LogPipeline(handler, sampler, listener)
+    atexit.register(_pipeline.stop)
+    return _pipeline